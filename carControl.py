@@ -19,7 +19,10 @@ class CarControl(object):
         self.parser = msgParser.MsgParser()
 
         self.actions = None
+        self.reset(accel, brake, gear, steer, clutch, focus, meta)
 
+    def reset(self, accel = 0.0, brake = 0.0, gear = 1, steer = 0.0, clutch = 0.0, focus = 0, meta = 0):
+        '''Set every control in place (defaults: a new episode), reusing this object and its parser'''
         self.accel = accel
         self.brake = brake
         self.gear = gear
@@ -16,6 +16,10 @@ class CarState(object):
         '''Constructor'''
         # Assuming msgParser.py is updated for Python 3
         self.parser = msgParser.MsgParser()
+        self.reset()
+
+    def reset(self):
+        '''Clear every sensor in place for a new episode (the parser is kept)'''
         self.sensors = None # Raw dictionary from parser
         # Individual sensor values (initialized to None)
         self.angle = None
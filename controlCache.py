@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+'''
+Adaptive control rate: skip the model when the car's state barely moved.
+
+On long straights consecutive sensor frames are nearly identical, yet
+Driver.drive runs the scaler and MLP on every one. ControlCache keys each
+frame on a few features that dominate the controls (speedX, angle,
+trackPos and the five forward rangefinders, track_7..track_11), quantized
+with per-feature steps. While a frame falls in the same quantization cell
+as the last frame the model actually ran on, the commands from that run
+(accel, brake, steer, clutch) are reused. The cell is anchored on the last
+model run rather than the previous frame, so slow drift cannot accumulate
+unnoticed, and after max_stale reused frames in a row the model runs
+anyway. The gear rule still runs every tick.
+
+Larger tolerance means coarser cells, more hits and a larger error. The
+replay command measures both on recordings: every row goes through the
+full model and through the cache in recording order, and the difference
+in commands is the driving error the cache adds. It exits with 1 when the
+mean error of any command exceeds --bound.
+
+Usage:
+    python pyclient.py --controlCache [--cacheTolerance 1.0] [--maxStale 3]
+    python controlCache.py replay collected_data/*.csv --cacheTolerance 1.0 --bound 0.02
+'''
+import argparse
+import sys
+
+import numpy as np
+
+# Quantization step of each key feature at tolerance 1.0
+KEY_STEPS = {'speedX': 0.5, 'angle': 0.005, 'trackPos': 0.01,
+             'track_7': 2.0, 'track_8': 2.0, 'track_9': 2.0, 'track_10': 2.0, 'track_11': 2.0}
+
+# Commands the cache holds (the gear rule is evaluated every tick)
+CACHED_OUTPUTS = ('accel', 'brake', 'steer', 'clutch')
+
+
+class ControlCache(object):
+    '''
+    Reuses the last model commands while the quantized key features stay in one cell
+    '''
+
+    def __init__(self, tolerance: float = 1.0, max_stale: int = 3):
+        '''Constructor'''
+        self.tolerance = tolerance
+        self.max_stale = max_stale
+        self.indices = None
+        self.inverse_steps = None
+        self.reset_metrics()
+        self.invalidate()
+
+    def bind(self, feature_columns: list[str]):
+        '''Locate the key features in a model input row (call again whenever the schema changes)'''
+        present = [col for col in KEY_STEPS if col in feature_columns]
+        self.indices = np.array([feature_columns.index(col) for col in present], dtype=np.intp)
+        self.inverse_steps = np.array([1.0 / (KEY_STEPS[col] * self.tolerance) for col in present], dtype=np.float32)
+        self.invalidate()
+
+    def invalidate(self):
+        '''Forget the cached commands (new episode, model or schema)'''
+        self.key = None
+        self.pending_key = None
+        self.commands = None
+        self.stale = 0
+
+    def reset_metrics(self):
+        self.hits = 0
+        self.misses = 0
+        self.longest = 0 # Longest run of reused frames
+
+    def quantize(self, row: np.ndarray) -> np.ndarray:
+        return np.floor(row[self.indices] * self.inverse_steps)
+
+    def lookup(self, features: np.ndarray):
+        '''
+        Cached commands for a (1, n_features) row, or None if the model has to run.
+        On None the caller runs the model and hands the result to store().
+        '''
+        if self.indices is None or len(self.indices) == 0:
+            return None
+        key = self.quantize(features[0])
+        if self.commands is not None and self.stale < self.max_stale and np.array_equal(key, self.key):
+            self.stale += 1
+            self.hits += 1
+            self.longest = max(self.longest, self.stale)
+            return self.commands
+        self.pending_key = key
+        return None
+
+    def store(self, commands: tuple):
+        '''Commands computed for the row that just missed; anchors a new cell'''
+        if self.indices is None or len(self.indices) == 0:
+            return
+        self.key, self.commands, self.stale = self.pending_key, commands, 0
+        self.misses += 1
+
+    def summary(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'longest_reuse': self.longest}
+
+    def format(self, name: str) -> str:
+        s = self.summary()
+        return (f"{name:<24} hit rate={s['hit_rate']:.1%} ({s['hits']} reused, {s['misses']} model runs), "
+                f"longest reuse={s['longest_reuse']}")
+
+
+def replay(paths: list[str], tolerance: float, max_stale: int, stage: int = 3) -> dict:
+    '''
+    Commands with and without the cache over recordings, in row order (each
+    file is an episode). Returns per-command error statistics and the hit rate.
+    '''
+    import driver
+    import evaluateModel
+
+    d = driver.Driver(stage)
+    if d.nn_model is None:
+        raise SystemExit("The driver could not load its model/scaler; nothing to replay.")
+    cache = ControlCache(tolerance, max_stale)
+    cache.bind(d.feature_columns)
+    errors = {name: [] for name in CACHED_OUTPUTS}
+    for path in paths:
+        columns, _, _ = evaluateModel.load_episodes([path], d.schema.input_columns)
+        X = d.schema.features(columns)
+        predictions = evaluateModel.predict(d, X, 65536)
+        full = np.stack([np.clip(predictions[:, d.nn_output_names.index(name)], *driver.OUTPUT_RANGES[name])
+                         for name in CACHED_OUTPUTS], axis=1)
+        # Sequential pass: which model run does each row's command come from?
+        source = np.empty(len(X), dtype=np.int64)
+        cache.invalidate()
+        for i in range(len(X)):
+            if cache.lookup(X[i:i + 1]) is None:
+                cache.store(i) # The cache holds the row index of the model run instead of the commands
+            source[i] = cache.commands
+        held = full[source]
+        for k, name in enumerate(CACHED_OUTPUTS):
+            errors[name].append(np.abs(held[:, k] - full[:, k]))
+    result = {name: {'mean': float(np.mean(np.concatenate(e))), 'p99': float(np.percentile(np.concatenate(e), 99)),
+                     'max': float(np.max(np.concatenate(e)))} for name, e in errors.items()}
+    result['cache'] = cache.summary()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the hit rate and driving error of the adaptive control cache.')
+    parser.add_argument('command', choices=['replay'], help='Replay recordings with and without the cache')
+    parser.add_argument('paths', nargs='+', help='Recorded episodes (.csv or .tlm)')
+    parser.add_argument('--cacheTolerance', action='store', type=float, dest='tolerance', default=1.0,
+                        help='Scale of the quantization steps (default: 1.0)')
+    parser.add_argument('--maxStale', action='store', type=int, dest='max_stale', default=3,
+                        help='Most frames in a row that reuse one model run (default: 3)')
+    parser.add_argument('--bound', action='store', type=float, dest='bound', default=0.02,
+                        help='Largest acceptable mean absolute error of any command (default: 0.02)')
+    parser.add_argument('--stage', action='store', type=int, dest='stage', default=3,
+                        help='Stage passed to the Driver (default: 3)')
+    arguments = parser.parse_args()
+
+    result = replay(arguments.paths, arguments.tolerance, arguments.max_stale, arguments.stage)
+    cache = result.pop('cache')
+    print(f"tolerance {arguments.tolerance}, max stale {arguments.max_stale}: hit rate {cache['hit_rate']:.1%} "
+          f"({cache['misses']} of {cache['hits'] + cache['misses']} frames ran the model)")
+    worst = 0.0
+    for name, e in result.items():
+        worst = max(worst, e['mean'])
+        print(f"  {name:<7} mean |error| {e['mean']:.5f}  p99 {e['p99']:.5f}  max {e['max']:.5f}")
+    print(f"mean error {worst:.5f} {'within' if worst <= arguments.bound else 'EXCEEDS'} bound {arguments.bound}")
+    sys.exit(0 if worst <= arguments.bound else 1)
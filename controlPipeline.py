@@ -0,0 +1,139 @@
+'''
+Pipelined control mode for the SCR client.
+
+In the default client loop recv, parse, inference, CSV write and send all
+run back to back on one thread, so reply latency includes inference time.
+Here the network thread only receives packets and immediately answers with
+the most recently published control message, while a compute thread runs
+Driver.drive() on the newest sensor frame and publishes its result into a
+double-buffered ControlSlot.
+
+The reply path never takes a lock: the compute thread fills the back
+buffer and publishes it with a single reference store (atomic under the
+GIL), and the network thread reads whichever buffer is in front. The
+trade-off is that a reply is computed from the previous frame(s).
+'''
+import queue
+import threading
+import time
+
+import carControl
+import latencyStats
+
+
+class ControlSlot(object):
+    '''
+    Double-buffered CarControl with its pre-encoded reply message
+    '''
+
+    def __init__(self):
+        '''Constructor'''
+        self.controls = [carControl.CarControl(), carControl.CarControl()]
+        initial = self.controls[0].toMsg().encode()
+        self.messages = [initial, initial]
+        self.front = 0
+        self.version = 0 # Number of publishes so far
+
+    def publish(self, control: carControl.CarControl, msg: bytes):
+        '''Copy control into the back buffer and flip it to the front (single writer only)'''
+        back = 1 - self.front
+        slot = self.controls[back]
+        slot.accel = control.accel
+        slot.brake = control.brake
+        slot.gear = control.gear
+        slot.steer = control.steer
+        slot.clutch = control.clutch
+        slot.focus = control.focus
+        slot.meta = control.meta
+        self.messages[back] = msg
+        self.front = back
+        self.version += 1
+
+    def read(self) -> bytes:
+        '''Return the current reply message; bytes are immutable so a concurrent publish cannot tear it'''
+        return self.messages[self.front]
+
+    def current(self) -> carControl.CarControl:
+        return self.controls[self.front]
+
+
+class ComputeWorker(threading.Thread):
+    '''
+    Runs Driver.drive() off the network thread and publishes into a ControlSlot.
+
+    process_all=False keeps only the newest submitted frame (driving);
+    process_all=True queues every frame so data collection rows are not lost.
+    '''
+
+    def __init__(self, driver, slot: ControlSlot, process_all: bool = False, csv_writer=None):
+        '''Constructor'''
+        super().__init__(name='driver-compute', daemon=True)
+        self.driver = driver
+        self.slot = slot
+        self.process_all = process_all
+        self.csv_writer = csv_writer
+
+        self.frames = queue.SimpleQueue() # Used when process_all is set
+        self.latest = None                # (msg, step) mailbox used otherwise
+        self.mailbox_lock = threading.Lock() # Guards the mailbox swap only; the reply path never takes it
+        self.wakeup = threading.Event()
+        self.running = True
+        self.failed = False # Set when Driver.drive raised; the network thread falls back to synchronous driving
+        self.error = None
+
+        self.skipped_frames = 0
+        self.compute_latency = latencyStats.LatencyRecorder()
+
+    def submit(self, msg: str, step: int):
+        '''Hand a sensor frame to the compute thread (called by the network thread)'''
+        if self.process_all:
+            self.frames.put((msg, step))
+            return
+        with self.mailbox_lock:
+            if self.latest is not None:
+                self.skipped_frames += 1
+            self.latest = (msg, step)
+        self.wakeup.set()
+
+    def _next_frame(self):
+        if self.process_all:
+            try:
+                return self.frames.get(timeout=0.1)
+            except queue.Empty:
+                return None
+        if not self.wakeup.wait(0.1):
+            return None
+        self.wakeup.clear()
+        with self.mailbox_lock:
+            frame, self.latest = self.latest, None
+        return frame
+
+    def run(self):
+        try:
+            while self.running:
+                frame = self._next_frame()
+                if frame is None:
+                    continue
+                msg, step = frame
+                start = time.perf_counter()
+                if self.csv_writer is not None:
+                    reply = self.driver.drive(msg, csv_writer=self.csv_writer, current_step=step)
+                else:
+                    reply = self.driver.drive(msg)
+                if reply is not None:
+                    self.slot.publish(self.driver.control, reply.encode())
+                self.compute_latency.add(time.perf_counter() - start)
+        except Exception as e:
+            # Without this the thread dies silently and the last published control is sent forever
+            self.error = e
+            self.failed = True
+            print(f"Compute thread failed: {e!r}")
+
+    def stop(self):
+        '''Finish queued work and stop; the driver is safe to reset once this returns'''
+        if self.process_all:
+            # A dead worker never drains the queue
+            while not self.frames.empty() and self.is_alive():
+                time.sleep(0.001)
+        self.running = False
+        self.join()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+'''
+Deterministic, preprocessed dataset cache for training.
+
+Parsing the episode CSVs and fitting the scaler is the slow part of
+every training run, and random_split()/shuffle=True in MLP_Model.ipynb
+give different splits each time. DatasetCache does that work once per
+(source files, preprocessing config) and keeps the result on disk:
+
+  * X.npy / y.npy   - ready-to-train float32 arrays (scaled features, labels)
+  * train.npy / val.npy - a seeded, fixed train/validation split
+  * order.npy       - precomputed shuffled training orders, one per epoch
+  * scaler.pkl      - the fitted scaler (None for scaler='none')
+  * meta.json       - feature/label names, config, sizes
+
+Entries are keyed by a hash of the source file contents and the config
+(feature set, scaler, dropped columns, one-hot gear, split, seed), loaded
+memory-mapped, and evicted least-recently-used first to stay within a
+disk budget.
+
+Usage:
+    python datasetCache.py Dataset.csv --dropColumns z fuel --oneHotGear
+    python datasetCache.py --list
+'''
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+import telemetrySchema
+
+DEFAULT_CONFIG = {
+    'feature_set': 'raw',   # 'raw' or 'reduced' (featureReduction.py)
+    'scaler': 'standard',   # 'standard', 'minmax' or 'none'
+    'drop_columns': [],     # Feature columns left out (recorded names)
+    'one_hot_gear': False,  # Replace sensor_gear by indicator columns for gears -1..6
+    'val_fraction': 0.2,
+    'seed': 0,
+    'epochs': 20,           # Shuffled training orders to precompute
+}
+GEARS = list(range(-1, 7))
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def epoch_order(seed: int, epoch: int, train_idx: np.ndarray) -> np.ndarray:
+    '''Shuffled training order of an epoch; the same for a given seed and epoch on every run'''
+    return np.random.default_rng([seed, epoch]).permutation(train_idx).astype(np.int64)
+
+
+class CachedDataset(object):
+    '''
+    One cache entry, memory-mapped
+    '''
+
+    def __init__(self, path: str):
+        '''Constructor'''
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.X = np.load(os.path.join(path, 'X.npy'), mmap_mode='r')
+        self.y = np.load(os.path.join(path, 'y.npy'), mmap_mode='r')
+        self.train_idx = np.load(os.path.join(path, 'train.npy'))
+        self.val_idx = np.load(os.path.join(path, 'val.npy'))
+        self.orders = np.load(os.path.join(path, 'order.npy'), mmap_mode='r')
+        self.feature_names = self.meta['feature_names']
+        self.output_names = self.meta['output_names']
+        self.scaler_filename = os.path.join(path, 'scaler.pkl') if self.meta['config']['scaler'] != 'none' else None
+
+    def order(self, epoch: int) -> np.ndarray:
+        '''Training row order for an epoch (precomputed ones are read from disk)'''
+        if epoch < self.orders.shape[0]:
+            return np.asarray(self.orders[epoch])
+        return epoch_order(self.meta['config']['seed'], epoch, self.train_idx)
+
+    def batches(self, epoch: int, batch_size: int):
+        '''(X, y) training minibatches of an epoch, in its fixed shuffled order'''
+        order = self.order(epoch)
+        for start in range(0, order.shape[0], batch_size):
+            idx = np.sort(order[start:start + batch_size]) # Forward reads from the memory map
+            yield self.X[idx], self.y[idx]
+
+    def validation(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.X[self.val_idx], self.y[self.val_idx]
+
+
+class DatasetCache(object):
+    '''
+    Directory of CachedDatasets with a disk budget and LRU eviction
+    '''
+
+    def __init__(self, root: str = 'dataset_cache', budget_bytes: int = 4 << 30):
+        '''Constructor'''
+        self.root = root
+        self.budget_bytes = budget_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, paths: list[str], config: dict) -> str:
+        '''Hash of the sources (contents, in order) and the preprocessing config'''
+        h = hashlib.sha1()
+        for path in paths:
+            h.update(file_digest(path).encode())
+        h.update(json.dumps(config, sort_keys=True).encode())
+        return h.hexdigest()[:20]
+
+    def get(self, paths: list[str], config: dict | None = None) -> CachedDataset:
+        '''Return the cached entry for these sources and config, building it on a miss'''
+        config = {**DEFAULT_CONFIG, **(config or {})}
+        key = self.key(paths, config)
+        path = os.path.join(self.root, key)
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            print(f"DatasetCache: hit {key}")
+        else:
+            start = time.perf_counter()
+            self.build(paths, config, path)
+            print(f"DatasetCache: built {key} in {time.perf_counter() - start:.1f}s")
+        # Directory mtime is the LRU clock
+        os.utime(path)
+        self.evict(keep=key)
+        return CachedDataset(path)
+
+    def build(self, paths: list[str], config: dict, path: str):
+        import joblib
+        import pandas as pd
+
+        schema = scaler_names = None
+        X_parts, y_parts = [], []
+        for source in paths:
+            header, columns = telemetrySchema.read_table(source)
+            if schema is None:
+                schema, scaler_names = telemetrySchema.dataset_schema(header, config['feature_set'])
+            X, y = schema.select(columns)
+            keep = ~np.isnan(y).any(axis=1)
+            X_parts.append(X[keep])
+            y_parts.append(y[keep])
+        X = np.concatenate(X_parts)
+        y = np.concatenate(y_parts)
+
+        names = list(schema.feature_columns)
+        kept = [i for i, col in enumerate(names) if col not in config['drop_columns']]
+        X = X[:, kept]
+        names = [names[i] for i in kept]
+        scaler_names = [scaler_names[i] for i in kept]
+        if config['one_hot_gear'] and 'sensor_gear' in names:
+            g = names.index('sensor_gear')
+            one_hot = (np.rint(X[:, g])[:, None] == np.array(GEARS)[None, :]).astype(np.float32)
+            X = np.concatenate([np.delete(X, g, axis=1), one_hot], axis=1)
+            gear_names = [f'gear_{k}' for k in GEARS]
+            names = names[:g] + names[g + 1:] + gear_names
+            scaler_names = scaler_names[:g] + scaler_names[g + 1:] + gear_names
+
+        order = np.random.default_rng(config['seed']).permutation(X.shape[0])
+        n_val = max(1, int(len(order) * config['val_fraction']))
+        val_idx, train_idx = np.sort(order[:n_val]), np.sort(order[n_val:])
+
+        scaler = None
+        if config['scaler'] != 'none':
+            from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+            scaler = (StandardScaler() if config['scaler'] == 'standard' else MinMaxScaler())
+            scaler.fit(pd.DataFrame(X[train_idx], columns=scaler_names))
+            X = scaler.transform(pd.DataFrame(X, columns=scaler_names)).astype(np.float32)
+
+        # Written to a temporary directory and renamed, so a crash never leaves a half entry behind
+        tmp = f"{path}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        np.save(os.path.join(tmp, 'X.npy'), np.ascontiguousarray(X, dtype=np.float32))
+        np.save(os.path.join(tmp, 'y.npy'), y.astype(np.float32))
+        np.save(os.path.join(tmp, 'train.npy'), train_idx)
+        np.save(os.path.join(tmp, 'val.npy'), val_idx)
+        orders = np.stack([epoch_order(config['seed'], e, train_idx) for e in range(config['epochs'])]) \
+            if config['epochs'] else np.zeros((0, len(train_idx)), dtype=np.int64)
+        np.save(os.path.join(tmp, 'order.npy'), orders)
+        if scaler is not None:
+            joblib.dump(scaler, os.path.join(tmp, 'scaler.pkl'))
+        meta = {'sources': [os.path.abspath(p) for p in paths], 'config': config, 'feature_names': names,
+                'scaler_feature_names': scaler_names, 'output_names': schema.output_names,
+                'label_columns': schema.label_columns, 'rows': int(X.shape[0]), 'created': time.time()}
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, path)
+
+    def entries(self) -> list[tuple[str, int, float]]:
+        '''(key, bytes, last used) of every complete entry, least recently used first'''
+        result = []
+        for key in os.listdir(self.root):
+            path = os.path.join(self.root, key)
+            if not os.path.isdir(path) or not os.path.exists(os.path.join(path, 'meta.json')):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+            result.append((key, size, os.path.getmtime(path)))
+        return sorted(result, key=lambda entry: entry[2])
+
+    def evict(self, keep: str | None = None):
+        '''Remove least recently used entries until the cache fits its budget'''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.budget_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total -= size
+            print(f"DatasetCache: evicted {key} ({size / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or inspect the preprocessed training dataset cache.')
+    parser.add_argument('datasets', nargs='*', help='Dataset.csv or recorded episode files (.csv or .tlm)')
+    parser.add_argument('--cacheDir', action='store', dest='cache_dir', default='dataset_cache',
+                        help='Cache directory (default: dataset_cache)')
+    parser.add_argument('--budgetGB', action='store', type=float, dest='budget_gb', default=4.0,
+                        help='Disk budget; least recently used entries are evicted beyond it (default: 4)')
+    parser.add_argument('--features', action='store', dest='feature_set', default='raw', choices=['raw', 'reduced'],
+                        help='Raw sensors or the reduced features of featureReduction.py (default: raw)')
+    parser.add_argument('--scaler', action='store', dest='scaler', default='standard',
+                        choices=['standard', 'minmax', 'none'], help='Feature scaler (default: standard)')
+    parser.add_argument('--dropColumns', action='store', dest='drop_columns', nargs='+', default=[],
+                        help='Feature columns to leave out (recorded names)')
+    parser.add_argument('--oneHotGear', action='store_true', dest='one_hot_gear', default=False,
+                        help='Encode sensor_gear as indicator columns for gears -1..6')
+    parser.add_argument('--valFraction', action='store', type=float, dest='val_fraction', default=0.2,
+                        help='Share of rows held out for validation (default: 0.2)')
+    parser.add_argument('--seed', action='store', type=int, dest='seed', default=0,
+                        help='Seed for the split and the epoch orders (default: 0)')
+    parser.add_argument('--epochs', action='store', type=int, dest='epochs', default=20,
+                        help='Shuffled epoch orders to precompute (default: 20)')
+    parser.add_argument('--list', action='store_true', dest='list', default=False,
+                        help='List the cache entries and exit')
+    arguments = parser.parse_args()
+
+    cache = DatasetCache(arguments.cache_dir, int(arguments.budget_gb * (1 << 30)))
+    if arguments.list or not arguments.datasets:
+        for key, size, used in reversed(cache.entries()):
+            with open(os.path.join(arguments.cache_dir, key, 'meta.json')) as f:
+                meta = json.load(f)
+            print(f"{key}  {size / 1e6:8.1f} MB  {meta['rows']:>9} rows  {len(meta['feature_names']):>3} features  "
+                  f"last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}  {meta['config']}")
+    else:
+        config = {name: getattr(arguments, name) for name in DEFAULT_CONFIG}
+        dataset = cache.get(arguments.datasets, config)
+        print(f"{dataset.path}: {dataset.meta['rows']} rows, {len(dataset.feature_names)} features -> "
+              f"{dataset.output_names}, {len(dataset.train_idx)} train / {len(dataset.val_idx)} val")
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+'''
+Distil the deployed driver model into much smaller students.
+
+The teacher is the model/scaler pair the Driver loads
+(torcs_mlp_model.pth + scaler_multi_output.pkl). Its outputs over
+recorded telemetry become the training targets of small driver.MLP
+students (e.g. a single 32-unit hidden layer, or no hidden layer at
+all), which keep the teacher's scaler and feature/output layout.
+
+Each student is exported in the runtime format Driver loads: a state_dict
+<outDir>/student_<sizes>.pth next to a copy of the teacher's scaler in
+<outDir>/scaler.pkl; copy the pair over the deployed files to use it
+(layer sizes are read from the file). The report lists, per student,
+the clipped control-output error against the teacher (MAE, worst case,
+gear agreement through the rule-based gearbox) and the per-tick
+inference speedup.
+
+Usage:
+    python distillModel.py collected_data/*.csv --hidden 32 16 none
+'''
+import argparse
+import os
+import shutil
+import time
+
+import numpy as np
+
+import driver
+import modelBundle
+import sweepRunner
+
+
+def teacher_targets(arrays: dict, X: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    '''Teacher outputs over X (NumPy reference forward, in chunks)'''
+    out = np.empty((X.shape[0], modelBundle.mlp_dims(arrays)[2]), dtype=np.float32)
+    for start in range(0, X.shape[0], chunk):
+        out[start:start + chunk] = modelBundle.forward(arrays, X[start:start + chunk].astype(np.float64))
+    return out
+
+
+def train_student(hidden: tuple[int, ...], X: np.ndarray, targets: np.ndarray, train_idx: np.ndarray,
+                  val_idx: np.ndarray, arguments) -> tuple[object, float]:
+    '''Fit a student MLP on (already scaled) X against the teacher outputs; return (model, val loss)'''
+    import torch
+    import torch.nn as nn
+
+    torch.manual_seed(arguments.seed)
+    rng = np.random.default_rng(arguments.seed)
+    model = driver.MLP(X.shape[1], targets.shape[1], hidden=hidden)
+    criterion = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=arguments.lr)
+    X_val, y_val = torch.from_numpy(X[val_idx]), torch.from_numpy(targets[val_idx])
+
+    best_loss, best_epoch, best_state = float('inf'), 0, None
+    for epoch in range(1, arguments.max_epochs + 1):
+        model.train()
+        order = rng.permutation(train_idx)
+        for start in range(0, len(order), arguments.batch_size):
+            idx = order[start:start + arguments.batch_size]
+            optimizer.zero_grad()
+            loss = criterion(model(torch.from_numpy(X[idx])), torch.from_numpy(targets[idx]))
+            loss.backward()
+            optimizer.step()
+
+        model.eval()
+        with torch.no_grad():
+            val_loss = criterion(model(X_val), y_val).item()
+        if val_loss < best_loss - arguments.min_delta:
+            best_loss, best_epoch = val_loss, epoch
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        elif epoch - best_epoch >= arguments.patience:
+            break
+    if best_state is None:
+        raise SystemExit(f"Distillation diverged: no finite validation loss in {epoch} epochs "
+                         f"(lr {arguments.lr}); try a lower --lr.")
+    model.load_state_dict(best_state)
+    model.eval()
+    return model, best_loss
+
+
+def control_error(output_names: list[str], teacher: np.ndarray, student: np.ndarray, columns: dict,
+                  rows: np.ndarray) -> dict:
+    '''Error between the commands Driver.drive would send with each model (outputs clipped, rule-based gear)'''
+    result = {}
+    clipped = {}
+    for name, (low, high) in driver.OUTPUT_RANGES.items():
+        t = np.clip(teacher[:, output_names.index(name)], low, high)
+        s = np.clip(student[:, output_names.index(name)], low, high)
+        clipped[name] = (t, s)
+        result[name] = {'mae': float(np.mean(np.abs(t - s))), 'max': float(np.max(np.abs(t - s)))}
+    # Gear needs rpm/speed, which Dataset.csv-style tables do have; skip it otherwise
+    if not np.isnan(columns['rpm'][rows]).all():
+        rpm, speed, gear = (columns[col][rows] for col in ('rpm', 'speedX', 'sensor_gear'))
+        t_gear = driver.gear_rule_batch(rpm, speed, gear, clipped['accel'][0], clipped['brake'][0])
+        s_gear = driver.gear_rule_batch(rpm, speed, gear, clipped['accel'][1], clipped['brake'][1])
+        result['gear'] = {'agreement': float(np.mean(t_gear == s_gear))}
+    return result
+
+
+def parse_hidden(text: str) -> tuple[int, ...]:
+    '''"32,16" -> (32, 16); "none" -> () for a purely linear student'''
+    return () if text.lower() == 'none' else sweepRunner.parse_hidden(text)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Distil the deployed model into small student networks.')
+    parser.add_argument('datasets', nargs='+', help='Recorded episodes (.csv or .tlm) or Dataset.csv (labels are not needed)')
+    parser.add_argument('--hidden', action='store', dest='hidden', nargs='+', type=parse_hidden,
+                        default=[(32,), (16,), (32, 16), ()],
+                        help='Student hidden sizes, e.g. 32 16 32,16 none (default: 32 16 32,16 none)')
+    parser.add_argument('--model', action='store', dest='model_filename', default='torcs_mlp_model.pth',
+                        help='Teacher model file (default: torcs_mlp_model.pth)')
+    parser.add_argument('--scaler', action='store', dest='scaler_filename', default='scaler_multi_output.pkl',
+                        help='Teacher scaler file (default: scaler_multi_output.pkl)')
+    parser.add_argument('--lr', action='store', type=float, dest='lr', default=1e-3,
+                        help='Adam learning rate (default: 1e-3)')
+    parser.add_argument('--batchSize', action='store', type=int, dest='batch_size', default=256,
+                        help='Minibatch size (default: 256)')
+    parser.add_argument('--maxEpochs', action='store', type=int, dest='max_epochs', default=100,
+                        help='Epoch limit per student (default: 100)')
+    parser.add_argument('--patience', action='store', type=int, dest='patience', default=8,
+                        help='Stop after this many epochs without improvement (default: 8)')
+    parser.add_argument('--minDelta', action='store', type=float, dest='min_delta', default=1e-6,
+                        help='Smallest validation loss decrease counted as improvement (default: 1e-6)')
+    parser.add_argument('--valFraction', action='store', type=float, dest='val_fraction', default=0.2,
+                        help='Share of rows held out for the error report (default: 0.2)')
+    parser.add_argument('--ticks', action='store', type=int, dest='ticks', default=2000,
+                        help='Timed ticks per model for the speedup (default: 2000)')
+    parser.add_argument('--seed', action='store', type=int, dest='seed', default=0,
+                        help='Seed for the split, initialisation and shuffling (default: 0)')
+    parser.add_argument('--outDir', action='store', dest='out_dir', default='students',
+                        help='Directory for the exported students and scaler (default: students)')
+    arguments = parser.parse_args()
+
+    arrays = modelBundle.load_bundle(arguments.model_filename, arguments.scaler_filename)
+    schema = modelBundle.bundle_schema(arrays)
+    input_dim, teacher_hidden, output_dim = modelBundle.mlp_dims(arrays)
+    schema.check_model(input_dim, output_dim, arrays['scaler.mul'].shape[0])
+
+    # Labels are not used, so any recording with the teacher's input columns will do
+    gear_parts = {}
+    X_parts = []
+    for path in arguments.datasets:
+        _, columns = telemetrySchema.read_table(path)
+        schema.check_columns(list(columns))
+        X_parts.append(schema.features(columns))
+        for col in ('rpm', 'speedX', 'sensor_gear'):
+            n = X_parts[-1].shape[0]
+            gear_parts.setdefault(col, []).append(columns.get(col, np.full(n, np.nan, dtype=np.float32)))
+    X = np.concatenate(X_parts)
+    columns = {col: np.concatenate(chunks) for col, chunks in gear_parts.items()}
+    teacher = teacher_targets(arrays, X)
+    X_scaled = (X * arrays['scaler.mul'] + arrays['scaler.add']).astype(np.float32)
+
+    order = np.random.default_rng(arguments.seed).permutation(X.shape[0])
+    n_val = max(1, int(len(order) * arguments.val_fraction))
+    val_idx, train_idx = np.sort(order[:n_val]), order[n_val:]
+    print(f"Distill: teacher {input_dim}->{'->'.join(map(str, teacher_hidden))}->{output_dim}, "
+          f"{len(train_idx)} training and {len(val_idx)} held-out rows")
+
+    import torch
+
+    os.makedirs(arguments.out_dir, exist_ok=True)
+    scaler_filename = os.path.join(arguments.out_dir, 'scaler.pkl')
+    shutil.copyfile(arguments.scaler_filename, scaler_filename)
+    rows = X[val_idx[:arguments.ticks]]
+    teacher_latency = sweepRunner.measure_latency(arguments.model_filename, arguments.scaler_filename,
+                                                  rows, arguments.ticks)
+    teacher_params = sum(arrays[name].size for name in arrays if name.startswith('model.'))
+
+    print('*********************************************')
+    print(f"Teacher: {teacher_params} parameters, tick p50={teacher_latency['p50_ms']:.3f}ms "
+          f"p99={teacher_latency['p99_ms']:.3f}ms")
+    for hidden in arguments.hidden:
+        start = time.perf_counter()
+        model, val_loss = train_student(hidden, X_scaled, teacher, train_idx, val_idx, arguments)
+        name = 'student_' + ('x'.join(map(str, hidden)) or 'linear')
+        model_filename = os.path.join(arguments.out_dir, f'{name}.pth')
+        torch.save(model.state_dict(), model_filename)
+
+        with torch.no_grad():
+            student = model(torch.from_numpy(X_scaled[val_idx])).numpy()
+        error = control_error(schema.output_names, teacher[val_idx], student, columns, val_idx)
+        latency = sweepRunner.measure_latency(model_filename, scaler_filename, rows, arguments.ticks)
+        params = sum(p.numel() for p in model.parameters())
+
+        print(f"--- {name}: {params} parameters ({teacher_params / params:.1f}x fewer), "
+              f"distillation loss {val_loss:.5f}, trained in {time.perf_counter() - start:.0f}s ---")
+        print(f"  tick p50={latency['p50_ms']:.3f}ms p99={latency['p99_ms']:.3f}ms "
+              f"(speedup p50 {teacher_latency['p50_ms'] / latency['p50_ms']:.2f}x, "
+              f"p99 {teacher_latency['p99_ms'] / latency['p99_ms']:.2f}x)")
+        for output, m in error.items():
+            if 'agreement' in m:
+                print(f"  {output:<7} agreement with teacher={m['agreement']:.4f}")
+            else:
+                print(f"  {output:<7} MAE vs teacher={m['mae']:.4f}  max={m['max']:.4f}")
+        print(f"  exported {model_filename}")
+    print('*********************************************')
@@ -9,38 +9,129 @@ Corrected sensor extraction and prediction mapping for the NN.
 import msgParser
 import carState
 import carControl
-import csv
-from pynput import keyboard
-import threading
-import time
 import numpy as np
 import torch  # Import PyTorch
 import torch.nn as nn  # Import nn
 import joblib
+import inferenceBackend
+import manualInput
+import modelBundle
+import telemetrySchema
 
 # --- Define the MLP model class (same as your training script) ---
 class MLP(nn.Module):
-    def __init__(self, input_dim, output_dim):
+    def __init__(self, input_dim, output_dim, hidden=(128, 64)):
         super(MLP, self).__init__()
-        self.model = nn.Sequential(
-            nn.Linear(input_dim, 128),
-            nn.ReLU(),
-            nn.Linear(128, 64),
-            nn.ReLU(),
-            nn.Linear(64, output_dim)
-        )
+        # Linear/ReLU pairs for each hidden size; the default keeps the 128/64 layout (and state_dict keys) used in training
+        layers = []
+        prev_dim = input_dim
+        for hidden_dim in hidden:
+            layers += [nn.Linear(prev_dim, hidden_dim), nn.ReLU()]
+            prev_dim = hidden_dim
+        layers.append(nn.Linear(prev_dim, output_dim))
+        self.model = nn.Sequential(*layers)
 
     def forward(self, x):
         return self.model(x)
 # --- End model definition ---
 
+# Valid range of each NN output; predictions are clipped to these (live and in batch evaluation)
+OUTPUT_RANGES = {'accel': (0.0, 1.0), 'brake': (0.0, 1.0), 'steer': (-1.0, 1.0), 'clutch': (0.0, 1.0)}
+
+
+def gear_rule_batch(rpm: np.ndarray, speed: np.ndarray, sensor_gear: np.ndarray,
+                    accel: np.ndarray, brake: np.ndarray) -> np.ndarray:
+    '''
+    Vectorized Driver.determine_gear_rule_based() over arrays, one element
+    per tick. NaN marks a missing sensor; a missing sensor gear starts from
+    gear 1 (the CarControl default) instead of the previous control gear.
+    '''
+    gear = np.where(np.isnan(sensor_gear), 1, sensor_gear).astype(np.int64)
+    known = ~np.isnan(rpm) & ~np.isnan(speed)
+
+    # The elif chain of the scalar rule, evaluated as mutually exclusive masks
+    start = known & (gear == 0) & (speed < 5) & (accel > 0.2)
+    stop = known & ~start & (brake > 0.8) & (speed < 1) & (gear >= 0)
+    up = known & ~start & ~stop & (rpm > 8000) & (gear >= 1) & (gear < 6)
+    down = known & ~start & ~stop & ~up & (rpm < 2500) & (gear > 1)
+
+    out = gear.copy()
+    out[start] = 1
+    out[stop & (speed < -0.5)] = -1
+    out[stop & ~(speed < -0.5) & (gear > 0)] = 0
+    out[up] += 1
+    out[down] -= 1
+    out[known & (speed < 2) & (out > 0) & (accel < 0.1)] = 0
+
+    return np.where(out >= 1, np.clip(out, 1, 6), np.where(out == 0, 0, -1))
+
+def fallback_batch(angle: np.ndarray, track_pos: np.ndarray, speed: np.ndarray, rpm: np.ndarray,
+                   sensor_gear: np.ndarray, prev_rpm: np.ndarray, prev_accel: np.ndarray, prev_gear: np.ndarray,
+                   steer_lock: float = 0.785398, max_speed: float = 100.0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Vectorized fallback driver: Driver.steer(), gear() and speed() in that
+    order, one element per car or tick. Driver.drive runs it on a batch of
+    one (fallback_step), so the live and offline fallbacks are one code path;
+    the scalar methods stay as the reference for fallbackPolicy.py check. The policy is
+    stateful, so the previous rpm reading and the previous accel/gear
+    commands are inputs (prev_rpm is NaN before the first reading). NaN
+    marks a missing sensor; the affected command then keeps its previous
+    value, as in the scalar methods. Returns (accel, steer, gear); the
+    fallback never brakes.
+    '''
+    angle, track_pos, speed, rpm, sensor_gear, prev_rpm, prev_accel = (
+        np.asarray(a, dtype=np.float64) for a in (angle, track_pos, speed, rpm, sensor_gear, prev_rpm, prev_accel))
+
+    steer = np.clip((angle - track_pos * 0.5) / steer_lock, -1.0, 1.0)
+    steer = np.where(np.isnan(steer), 0.0, steer)
+
+    # Gear: the scalar elif chain as mutually exclusive masks, using the accel of the previous tick
+    known = ~np.isnan(rpm) & ~np.isnan(sensor_gear) & ~np.isnan(speed)
+    gear = np.where(known, sensor_gear, 0).astype(np.int64)
+    rising = prev_rpm < rpm # False while prev_rpm is unknown, as in the scalar rule
+    start = (gear == 0) & (speed < 10.0) & (prev_accel > 0.1)
+    up = ~start & rising & (rpm > 7000) & (gear >= 1) & (gear < 6)
+    down = ~start & ~up & ~rising & (rpm < 3000) & (gear > 1)
+    idle = ~start & ~up & ~down & (speed < 1.0) & (prev_accel <= 0.1) & (gear > 0)
+    gear = np.where(start, 1, gear + up - down)
+    gear = np.clip(np.where(idle, 0, gear), 0, 6)
+    gear = np.where(known, gear, np.asarray(prev_gear, dtype=np.int64))
+
+    # Speed: step accel towards max_speed
+    accel = np.where(speed < max_speed, np.minimum(prev_accel + 0.1, 1.0), np.maximum(prev_accel - 0.1, 0.0))
+    accel = np.where(np.isnan(speed), prev_accel, accel)
+    return accel, steer, gear
+
+def build_model(arrays: dict):
+    '''Return (model, scaler) built on top of bundle arrays without copying the weights'''
+    input_dim, hidden, output_dim = modelBundle.mlp_dims(arrays)
+    model = MLP(input_dim=input_dim, output_dim=output_dim, hidden=hidden)
+    for name, param in model.named_parameters():
+        param.data = torch.from_numpy(arrays[name]) # Shares the array's memory
+    model.eval()
+    return model, modelBundle.ArrayScaler(arrays)
+
 class Driver(object):
     '''
     A driver object for the SCRC
     '''
 
-    def __init__(self, stage: int, collect_data: bool = False):
-        '''Constructor'''
+    def __init__(self, stage: int, collect_data: bool = False, model_bundle: dict | None = None,
+                 feature_set: str = 'raw', input_source: str = 'keyboard', input_device: str | None = None,
+                 model_registry=None, control_cache=None, backend: inferenceBackend.InferenceBackend | None = None):
+        '''
+        Constructor. model_bundle, if given, is a dict of weight/scaler arrays
+        (see modelBundle.py) used instead of loading the model files, e.g.
+        views of a shared memory block owned by supervisor.py. feature_set
+        selects raw sensors or the reduced features of featureReduction.py.
+        input_source/input_device pick the manual input used when collecting
+        data (see manualInput.py). model_registry, if given, supplies
+        preloaded per-track/stage models (see modelRegistry.py); the caller
+        routes it with model_registry.activate() at identification time.
+        control_cache, if given, lets drive() reuse the last model commands
+        while the state barely changes (see controlCache.py). backend runs
+        the model (see inferenceBackend.py; default: torch under no_grad).
+        '''
         self.WARM_UP = 0
         self.QUALIFYING = 1
         self.RACE = 2
@@ -55,6 +146,7 @@ class Driver(object):
         self.steer_lock = 0.785398
         self.max_speed = 100
         self.prev_rpm = None
+        self.fallback_announced = False # The fallback notice is printed once, not on every tick
 
         # Initialize rangefinder angles (needed for init message)
         self.angles = [0.0] * 19
@@ -67,40 +159,66 @@ class Driver(object):
 
         self.collect_data = collect_data  # Store the data collection flag
 
+        # Model bookkeeping for hot reloads and telemetry
+        self.pending_model = None
+        self.last_features = None # Last raw feature row fed to the model (used as a reload smoke-test frame)
+        self.metrics = {'model_version': 'initial', 'reloads': 0, 'reload_failures': 0, 'last_reload_seconds': None}
+        self.model_registry = model_registry if not collect_data else None
+        self.control_cache = control_cache if not collect_data else None
+        self.backend = backend if backend is not None else inferenceBackend.create('torch')
+
         # --- Load the Trained Model and Scaler if not collecting data ---
         self.nn_model = None
         self.feature_scaler = None
         self.model_filename = 'torcs_mlp_model.pth'  # Changed to PyTorch model name
         self.scaler_filename = 'scaler_multi_output.pkl'
-        self.nn_output_names = ['accel', 'brake', 'steer', 'clutch', 'gear']  # Corrected to match the actual outputs.  Removed focus and meta.
         self.num_gear_classes = 7
-        self.label_columns = ['accel', 'brake', 'steer', 'clutch', 'gear']  # Corrected label columns
 
-        # Define the list of feature columns (MUST exactly match feature_columns in preprocess_data.py)
-        self.feature_columns = [
-            'speedX', 'speedY', 'speedZ', 'rpm', 'fuel', 'damage', 'sensor_gear',
-            'racePos', 'distFromStart', 'distRaced', 'curLapTime', 'lastLapTime',
-            'trackPos', 'angle', 'z',
-        ] + [f'track_{i}' for i in range(19)] + \
-            [f'opponents_{i}' for i in range(36)] + \
-            [f'wheelSpinVel_{i}' for i in range(4)]
+        # Column layout (recorded header, feature order, output order) comes from one compiled schema.
+        # The default uses every sensor; a loaded scaler's feature names override it below.
+        self.feature_set = feature_set
+        self.use_schema(telemetrySchema.TelemetrySchema(feature_set=feature_set))
 
-
-        if not self.collect_data:
+        if self.model_registry is not None:
+            # Stage routing until the track is known; every model is already built and warm
+            model_registry.activate(self, None, stage)
+            print(f"Driver: Model registry {model_registry.path} attached ({len(model_registry.names)} models).")
+        elif not self.collect_data and model_bundle is not None:
+            try:
+                self.load_model_arrays(model_bundle)
+                print("Driver: Model and scaler attached from shared bundle.")
+            except telemetrySchema.SchemaError as e:
+                print(f"Driver: Shared model/scaler do not match the telemetry schema: {e}")
+                print("Driver: Falling back to simple AI driver.")
+        elif not self.collect_data:
             try:
                 print(f"Driver: Loading trained PyTorch model from file '{self.model_filename}'...")
                 # Instantiate the model with the correct input and output dimensions
                 #  Crucially, input_dim must match the number of features.
                 #  output_dim must match the number of target variables.
-                self.nn_model = MLP(input_dim=len(self.feature_columns), output_dim=len(self.label_columns))
-                # Load the model's state_dict (the trained weights)
-                self.nn_model.load_state_dict(torch.load(self.model_filename))
-                self.nn_model.eval()  # Set the model to evaluation mode
-                print("Driver: Model loaded successfully.")
+                state_dict = torch.load(self.model_filename)
+                input_dim, hidden, output_dim = modelBundle.mlp_dims(state_dict)
 
                 print(f"Driver: Loading scaler from '{self.scaler_filename}'...")
-                self.feature_scaler = joblib.load(self.scaler_filename)
-                print("Driver: Scaler loaded successfully.")
+                feature_scaler = joblib.load(self.scaler_filename)
+
+                # The scaler's feature names fix the input order; refuse artifacts that do not line up
+                schema = telemetrySchema.TelemetrySchema.for_scaler(feature_scaler, self.feature_set)
+                schema.check_model(input_dim, output_dim, getattr(feature_scaler, 'n_features_in_', None))
+                self.use_schema(schema)
+
+                nn_model = MLP(input_dim=input_dim, output_dim=output_dim, hidden=hidden)
+                # Load the model's state_dict (the trained weights)
+                nn_model.load_state_dict(state_dict)
+                nn_model.eval()  # Set the model to evaluation mode
+                self.set_model(nn_model, feature_scaler)
+                print(f"Driver: Model and scaler loaded successfully ({input_dim} features -> {self.nn_output_names}).")
+
+            except telemetrySchema.SchemaError as e:
+                print(f"Driver: Model/scaler do not match the telemetry schema: {e}")
+                print("Driver: Falling back to simple AI driver.")
+                self.nn_model = None
+                self.feature_scaler = None
 
             except (FileNotFoundError, ImportError, Exception) as e:
                 print(f"Driver: Error loading model or scaler: {e}")
@@ -108,29 +226,85 @@ class Driver(object):
                 self.nn_model = None
                 self.feature_scaler = None
 
-        # --- Manual Control Attributes (for data collection mode) ---
-        self.manual_accel = 0.0
-        self.manual_brake = 0.0
-        self.manual_steer = 0.0
-        self.manual_gear = 1
-        self.last_gear_change_time = 0
-        self.key_states = {
-            keyboard.Key.up: False,
-            keyboard.Key.down: False,
-            keyboard.Key.left: False,
-            keyboard.Key.right: False,
-            keyboard.KeyCode(char='a'): False,
-            keyboard.KeyCode(char='z'): False,
-            keyboard.KeyCode(char='r'): False,
-        }
-        self.listener = None
-
+        # --- Manual input (for data collection mode): event threads publish snapshots, drive() reads one per frame ---
+        self.manual_input = None
         if self.collect_data:
-            print("Driver: Data Collection Mode: Setting up keyboard listener (Arrow keys for control, 'a' for gear down, 'z' for gear up, 'r' for reverse).")
-            self.listener = keyboard.Listener(
-                on_press=self.on_key_press,
-                on_release=self.on_key_release)
-            self.listener.start()
+            print(f"Driver: Data Collection Mode: Setting up {input_source} input.")
+            self.manual_input = manualInput.open_input(input_source, input_device)
+
+    def use_schema(self, schema: telemetrySchema.TelemetrySchema):
+        '''Adopt a schema's feature and output layout'''
+        self.schema = schema
+        self.feature_columns = schema.feature_columns
+        self.nn_output_names = schema.output_names
+        self.label_columns = schema.label_columns
+        if self.control_cache is not None:
+            self.control_cache.bind(schema.feature_columns)
+
+    def load_model_arrays(self, arrays: dict):
+        '''Build the MLP and scaler on top of bundle arrays without copying the weights'''
+        schema = modelBundle.bundle_schema(arrays, self.feature_set)
+        if schema.feature_set != self.feature_set:
+            raise telemetrySchema.SchemaError(f"Bundle uses {schema.feature_set} features, {self.feature_set} were requested")
+        input_dim, _, output_dim = modelBundle.mlp_dims(arrays)
+        schema.check_model(input_dim, output_dim, arrays['scaler.mul'].shape[0])
+        self.use_schema(schema)
+        self.set_model(*build_model(arrays))
+
+    def set_model(self, model, scaler, backend: inferenceBackend.InferenceBackend | None = None):
+        '''
+        Install a (model, scaler) pair and drop cached commands. With backend (already
+        loaded with the pair, e.g. built off-thread) this is a reference swap;
+        otherwise the current backend is loaded here.
+        '''
+        if backend is not None:
+            self.backend = backend
+        else:
+            self.backend.load(model, scaler)
+        self.nn_model, self.feature_scaler = model, scaler
+        if self.control_cache is not None:
+            self.control_cache.invalidate()
+
+    def stage_model(self, model, scaler, version: str, reload_seconds: float,
+                    backend: inferenceBackend.InferenceBackend | None = None):
+        '''
+        Queue a new (model, scaler) pair from another thread (see modelWatcher.py),
+        with a backend already loaded with it so the swap costs no load on the driving thread.
+        It is swapped in by drive() before the next tick, never mid-tick.
+        '''
+        self.pending_model = (model, scaler, version, reload_seconds, backend)
+
+    def apply_pending_model(self):
+        pending, self.pending_model = self.pending_model, None
+        if pending is None:
+            return
+        model, scaler, version, reload_seconds, backend = pending
+        self.set_model(model, scaler, backend)
+        self.metrics['model_version'] = version
+        self.metrics['reloads'] += 1
+        self.metrics['last_reload_seconds'] = reload_seconds
+        print(f"Driver: Switched to model version {version} (loaded in {reload_seconds * 1e3:.1f} ms).")
+
+    def extract_features(self) -> np.ndarray:
+        '''
+        Return the current CarState as a (1, n_features) float32 row in
+        feature_columns order, using the schema's compiled gather plan.
+        The batch equivalent is telemetrySchema.features_from_columns().
+        '''
+        return self.schema.gather(self.state)
+
+    def predict_commands(self, sensor_data_reshaped: np.ndarray) -> tuple:
+        '''Scaler + MLP on one feature row: clipped (accel, brake, steer, clutch)'''
+        # Scaler + forward pass on the configured backend (torch, TorchScript, NumPy or ONNX Runtime)
+        predictions = self.backend.predict_one(sensor_data_reshaped)
+
+        # Map the predictions to the car control outputs
+        accel_command = np.clip(predictions[self.nn_output_names.index('accel')], *OUTPUT_RANGES['accel'])
+        brake_command = np.clip(predictions[self.nn_output_names.index('brake')], *OUTPUT_RANGES['brake'])
+        steer_command = np.clip(predictions[self.nn_output_names.index('steer')], *OUTPUT_RANGES['steer'])
+        clutch_command = np.clip(predictions[self.nn_output_names.index('clutch')], *OUTPUT_RANGES['clutch'])
+        # gear_command = int(round(np.clip(predictions[self.nn_output_names.index('gear')], 0, 6))) # No gear output from NN
+        return accel_command, brake_command, steer_command, clutch_command
 
     def determine_gear_rule_based(self):
         """
@@ -180,77 +354,6 @@ class Driver(object):
         
         self.control.setGear(int(target_gear))
 
-    def on_key_press(self, key):
-        """Callback for when a key is pressed.  Handles character keys case-insensitively."""
-        if hasattr(key, 'char'):
-            char_pressed = key.char.lower()
-            if char_pressed in ['a', 'z', 'r']:
-                key_code_for_state = keyboard.KeyCode(char=char_pressed)
-                if key_code_for_state in self.key_states:
-                    self.key_states[key_code_for_state] = True
-                self.handle_gear_shift(char_pressed)
-                return
-        if key in self.key_states:
-            self.key_states[key] = True
-            self.update_manual_controls()
-
-    def on_key_release(self, key):
-        """Callback for when a key is released. Handles character keys case-insensitively."""
-        if hasattr(key, 'char'):
-            char_released = key.char.lower()
-            key_code_for_state = keyboard.KeyCode(char=char_released)
-            if key_code_for_state in self.key_states:
-                self.key_states[key_code_for_state] = False
-            return
-        if key in self.key_states:
-            self.key_states[key] = False
-            self.update_manual_controls()
-
-    def update_manual_controls(self):
-        """Update manual control values based on current key states (Accel, Brake, Steer)."""
-        if self.key_states[keyboard.Key.up]:
-            self.manual_accel = 1.0
-            self.manual_brake = 0.0
-        elif self.key_states[keyboard.Key.down]:
-            self.manual_accel = 0.0
-            self.manual_brake = 1.0
-        else:
-            self.manual_accel = 0.0
-            self.manual_brake = 0.0
-
-        if self.key_states[keyboard.Key.left] and not self.key_states[keyboard.Key.right]:
-            self.manual_steer = 1.0
-        elif self.key_states[keyboard.Key.right] and not self.key_states[keyboard.Key.left]:
-            self.manual_steer = -1.0
-        else:
-            self.manual_steer = 0.0
-
-
-    def handle_gear_shift(self, char: str):
-        """Handle gear shifts based on 'a', 'z', and 'r' key characters."""
-        current_time = time.time()
-        if current_time - self.last_gear_change_time < 0.2 and char in ['a', 'z']:
-            return
-
-        old_gear = self.manual_gear
-        new_gear = old_gear
-
-        if char == 'a':
-            new_gear -= 1
-            new_gear = max(0, new_gear)
-            self.last_gear_change_time = current_time
-        elif char == 'z':
-            new_gear += 1
-            new_gear = min(6, new_gear)
-            self.last_gear_change_time = current_time
-        elif char == 'r':
-            new_gear = -1
-            self.last_gear_change_time = current_time
-
-        if new_gear != old_gear:
-            self.manual_gear = new_gear
-
-
     def init(self) -> str:
         '''Return init string with rangefinder angles'''
         return self.parser.stringify({'init': self.angles})
@@ -260,92 +363,36 @@ class Driver(object):
         Process incoming sensor message, decide control, and optionally save data/predict control.
         This is where your AI logic (or manual input) will go.
         '''
+        if self.pending_model is not None:
+            self.apply_pending_model()
+
         self.state.setFromMsg(msg)
 
         if self.collect_data and csv_writer is not None and current_step is not None:
-            gear_to_send = self.manual_gear
-            self.control.setAccel(self.manual_accel)
-            self.control.setBrake(self.manual_brake)
-            self.control.setSteer(self.manual_steer)
-            self.control.setGear(gear_to_send)
-
-            sensor_data_row = [
-                self.state.getSpeedX(), self.state.getSpeedY(), self.state.getSpeedZ(),
-                self.state.getRpm(), self.state.getFuel(), self.state.getDamage(),
-                self.state.getGear(),
-                self.state.getRacePos(), self.state.getDistFromStart(),
-                self.state.getDistRaced(), self.state.getCurLapTime(), self.state.getLastLapTime(),
-                self.state.getTrackPos(), self.state.getAngle(), self.state.getZ(),
-            ]
-            track_sensors = self.state.getTrack()
-            opponent_sensors = self.state.getOpponents()
-            wheel_spin_vel = self.state.getWheelSpinVel()
-            sensor_data_row.extend(track_sensors if track_sensors is not None else [None] * 19)
-            sensor_data_row.extend(opponent_sensors if opponent_sensors is not None else [None] * 36)
-            sensor_data_row.extend(wheel_spin_vel if wheel_spin_vel is not None else [None] * 4)
-
-            control_data_row = [
-                self.control.getAccel(), self.control.getBrake(), self.control.getSteer(),
-                self.control.getClutch(),
-                # self.control.getFocus(),  Removed focus and meta
-                # self.control.getMeta()
-            ]
-
-            full_data_row = sensor_data_row + control_data_row
+            # One snapshot per frame, so the recorded labels all come from the same input state
+            manual = self.manual_input.take()
+            self.control.setAccel(manual.accel)
+            self.control.setBrake(manual.brake)
+            self.control.setSteer(manual.steer)
+            self.control.setGear(manual.gear)
+
+            # Every sensor and every control, in the schema's header() order
+            full_data_row = self.schema.record_row(self.state, self.control)
             try:
                 csv_writer.writerow(full_data_row)
             except Exception as e:
                 print(f"Error writing data row for step {current_step}: {e}")
 
         elif self.nn_model is not None and self.feature_scaler is not None:
-            sensor_values_for_prediction = []
-
-            for col in self.feature_columns:
-                if col.startswith('track_'):
-                    track_idx = int(col.split('_')[1])
-                    track_sensors = self.state.getTrack()
-                    sensor_values_for_prediction.append(track_sensors[track_idx] if track_sensors and len(track_sensors) > track_idx else 0.0)
-                elif col.startswith('opponents_'):
-                    opp_idx = int(col.split('_')[1])
-                    opponent_sensors = self.state.getOpponents()
-                    sensor_values_for_prediction.append(opponent_sensors[opp_idx] if opponent_sensors and len(opponent_sensors) > opp_idx else 200.0)
-                elif col.startswith('wheelSpinVel_'):
-                    wheel_idx = int(col.split('_')[1])
-                    wheel_spin_vel = self.state.getWheelSpinVel()
-                    sensor_values_for_prediction.append(wheel_spin_vel[wheel_idx] if wheel_spin_vel and len(wheel_spin_vel) > wheel_idx else 0.0)
-                else:
-                    getter_map = {
-                        'speedX': self.state.getSpeedX, 'speedY': self.state.getSpeedY, 'speedZ': self.state.getSpeedZ,
-                        'rpm': self.state.getRpm, 'fuel': self.state.getFuel, 'damage': self.state.getDamage,
-                        'sensor_gear': self.state.getGear, 'racePos': self.state.getRacePos,
-                        'distFromStart': self.state.getDistFromStart, 'distRaced': self.state.getDistRaced,
-                        'curLapTime': self.state.getCurLapTime, 'lastLapTime': self.state.getLastLapTime,
-                        'trackPos': self.state.getTrackPos, 'angle': self.state.getAngle, 'z': self.state.getZ,
-                    }
-                    getter = getter_map.get(col)
-                    value = getter()
-                    sensor_values_for_prediction.append(value if value is not None else 0.0)
-
-            sensor_data_np = np.array(sensor_values_for_prediction).astype(np.float32)
-            sensor_data_reshaped = sensor_data_np.reshape(1, -1)
-            scaled_sensor_data = self.feature_scaler.transform(sensor_data_reshaped)
-
-            # Convert the scaled data to a PyTorch tensor
-            sensor_data_torch = torch.from_numpy(scaled_sensor_data).float()  # crucial .float()
-
-            # Make the prediction using the PyTorch model
-            self.nn_model.eval()  # Set to evaluation mode
-            with torch.no_grad():  # Disable gradient calculation
-                predictions_torch = self.nn_model(sensor_data_torch)  # Get predictions
-            predictions_np = predictions_torch.numpy()  # convert to numpy
-
-            # Map the predictions to the car control outputs.  predictions_np[0] because we have a batch size of 1.
-            accel_command = np.clip(predictions_np[0][self.nn_output_names.index('accel')], 0.0, 1.0)
-            brake_command = np.clip(predictions_np[0][self.nn_output_names.index('brake')], 0.0, 1.0)
-            steer_command = np.clip(predictions_np[0][self.nn_output_names.index('steer')], -1.0, 1.0)
-            clutch_command = np.clip(predictions_np[0][self.nn_output_names.index('clutch')], 0.0, 1.0)
-            # gear_command = int(round(np.clip(predictions_np[0][self.nn_output_names.index('gear')], 0, 6))) # No gear output from NN
-            
+            sensor_data_reshaped = self.extract_features()
+            self.last_features = sensor_data_reshaped
+            commands = self.control_cache.lookup(sensor_data_reshaped) if self.control_cache is not None else None
+            if commands is None:
+                commands = self.predict_commands(sensor_data_reshaped)
+                if self.control_cache is not None:
+                    self.control_cache.store(commands)
+            accel_command, brake_command, steer_command, clutch_command = commands
+
             self.control.setAccel(accel_command)
             self.control.setBrake(brake_command)
             self.control.setSteer(steer_command)
@@ -356,10 +403,10 @@ class Driver(object):
             self.determine_gear_rule_based() # This will call self.control.setGear()
 
         elif not self.collect_data:
-            print("Driver: Model or scaler not loaded in __init__, falling back to simple AI driver.")
-            self.steer()
-            self.gear()
-            self.speed()
+            if not self.fallback_announced:
+                print("Driver: Model or scaler not loaded in __init__, falling back to simple AI driver.")
+                self.fallback_announced = True
+            self.fallback_step()
 
         new_rpm = self.state.getRpm()
         if new_rpm is not None:
@@ -370,12 +417,12 @@ class Driver(object):
     def onShutDown(self):
         '''
         Called when the server sends a ***shutdown*** message.
-        Use this to perform any cleanup, including stopping the keyboard listener.
+        Use this to perform any cleanup, including stopping the manual input.
         '''
         print("Driver: Shutting down.")
-        if self.listener:
-            self.listener.stop()
-            print("Driver: Keyboard listener stopped.")
+        if self.manual_input:
+            self.manual_input.stop()
+            print("Driver: Manual input stopped.")
         pass
 
     def onRestart(self):
@@ -384,28 +431,42 @@ class Driver(object):
         Use this to reset any internal state for a new race.
         '''
         print("Driver: Restarting.")
-        self.state = carState.CarState()
-        self.control = carControl.CarControl()
-
-        if self.collect_data and self.listener:
-            self.manual_accel = 0.0
-            self.manual_brake = 0.0
-            self.manual_steer = 0.0
-            self.manual_gear = 1
-            self.last_gear_change_time = time.time()
-            for key in self.key_states:
-                self.key_states[key] = False
-            self.update_manual_controls()
+        self.reset()
 
+    def reset(self):
+        '''
+        In-place reset for a new episode: the state and control objects are
+        cleared rather than rebuilt, and the model, scaler, manual input and
+        any writers the caller holds stay open.
+        '''
+        self.state.reset()
+        self.control.reset()
+        if self.control_cache is not None:
+            self.control_cache.invalidate()
+        if self.manual_input:
+            self.manual_input.reset()
         self.prev_rpm = None
-        pass
+
+    def fallback_step(self):
+        '''The fallback policy for this car: fallback_batch on a batch of one (None sensors become NaN)'''
+        angle, track_pos, speed, rpm, sensor_gear, prev_rpm = (
+            np.array([np.nan if value is None else value], dtype=np.float64)
+            for value in (self.state.getAngle(), self.state.getTrackPos(), self.state.getSpeedX(),
+                          self.state.getRpm(), self.state.getGear(), self.prev_rpm))
+        accel, steer, gear = fallback_batch(angle, track_pos, speed, rpm, sensor_gear, prev_rpm,
+                                            np.array([self.control.getAccel()], dtype=np.float64),
+                                            np.array([self.control.getGear()], dtype=np.int64),
+                                            steer_lock=self.steer_lock, max_speed=self.max_speed)
+        self.control.setAccel(float(accel[0]))
+        self.control.setSteer(float(steer[0]))
+        self.control.setGear(int(gear[0]))
 
     def steer(self):
         angle = self.state.getAngle()
         dist = self.state.getTrackPos()
         if angle is not None and dist is not None:
             steer_command = (angle - dist * 0.5) / self.steer_lock
-            self.control.setSteer(np.clip(steer_command, -1.0, 1.0))
+            self.control.setSteer(max(-1.0, min(1.0, steer_command)))
         else:
             self.control.setSteer(0.0)
 
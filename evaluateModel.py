@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+'''
+Offline evaluation of the deployed driver model over recorded episodes.
+
+Loads the same inference stack Driver uses (scaler + MLP + rule-based
+gear) and replays recorded CSV episodes through it in large vectorized
+batches. Features are built from the driver's own TelemetrySchema (the
+batch twin of Driver.extract_features()), and predictions are clipped
+with driver.OUTPUT_RANGES, so these numbers match what the live client does.
+
+Reports per-output MAE and R^2, gear accuracy, a per-track breakdown and
+throughput.
+
+Usage: python evaluateModel.py collected_data/*.csv [--batchSize 65536]
+'''
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+import driver
+import lapIndex
+import telemetryCodec
+import telemetrySchema
+
+# Recorded label column for each evaluated output
+LABEL_COLUMNS = telemetrySchema.LABEL_SOURCES
+
+
+def load_episodes(paths: list[str], wanted: list[str]) -> tuple[dict, np.ndarray, list[str]]:
+    '''Read the wanted columns of every file into float32 arrays plus a per-row track id'''
+    parts = {col: [] for col in wanted}
+    track_ids = []
+    tracks = []
+    for path in paths:
+        if path.endswith('.tlm'):
+            header = telemetryCodec.column_names(path)
+            present = [col for col in wanted if col in header]
+            frame = telemetryCodec.read_columns(path, present)
+            n = len(next(iter(frame.values()))) if frame else 0
+        else:
+            header = pd.read_csv(path, nrows=0).columns.str.strip()
+            present = [col for col in wanted if col in header]
+            frame = pd.read_csv(path, usecols=present, dtype=np.float32, engine='c')
+            n = len(frame)
+        file_columns = {col: np.asarray(frame[col]) if col in present else np.full(n, np.nan, dtype=np.float32)
+                        for col in wanted}
+        if telemetrySchema.repair_legacy_controls(file_columns):
+            print(f"{path}: old control layout (clutch under control_gear, no gear labels), repaired")
+        for col in wanted:
+            parts[col].append(file_columns[col])
+        track = lapIndex.track_of(path)
+        if track not in tracks:
+            tracks.append(track)
+        track_ids.append(np.full(n, tracks.index(track), dtype=np.int32))
+    columns = {col: np.concatenate(chunks) for col, chunks in parts.items()}
+    return columns, np.concatenate(track_ids), tracks
+
+
+def predict(d: driver.Driver, X: np.ndarray, batch_size: int) -> np.ndarray:
+    '''Scaler + MLP over X in batches of batch_size rows'''
+    out = np.empty((X.shape[0], len(d.nn_output_names)), dtype=np.float32)
+    with torch.inference_mode():
+        for start in range(0, X.shape[0], batch_size):
+            scaled = d.feature_scaler.transform(X[start:start + batch_size])
+            out[start:start + batch_size] = d.nn_model(torch.from_numpy(np.asarray(scaled, dtype=np.float32))).numpy()
+    return out
+
+
+def controls(d: driver.Driver, predictions: np.ndarray, columns: dict) -> dict:
+    '''Turn raw NN outputs into the commands Driver.drive would send'''
+    out = {}
+    for name, (low, high) in driver.OUTPUT_RANGES.items():
+        out[name] = np.clip(predictions[:, d.nn_output_names.index(name)], low, high)
+    out['gear'] = driver.gear_rule_batch(columns['rpm'], columns['speedX'], columns['sensor_gear'],
+                                         out['accel'], out['brake'])
+    return out
+
+
+def metrics(pred: dict, columns: dict, mask: np.ndarray) -> dict:
+    '''MAE and R^2 for continuous outputs, accuracy for gear, over the rows in mask'''
+    result = {}
+    for name, label_col in LABEL_COLUMNS.items():
+        y = columns[label_col][mask]
+        p = pred[name][mask]
+        valid = ~np.isnan(y)
+        if not valid.any():
+            continue
+        y, p = y[valid].astype(np.float64), p[valid].astype(np.float64)
+        if name == 'gear':
+            result[name] = {'accuracy': float(np.mean(p == np.round(y)))}
+            continue
+        ss_res = np.sum((y - p) ** 2)
+        ss_tot = np.sum((y - y.mean()) ** 2)
+        result[name] = {'mae': float(np.mean(np.abs(y - p))),
+                        'r2': float(1.0 - ss_res / ss_tot) if ss_tot > 0 else float('nan')}
+    return result
+
+
+def print_metrics(title: str, rows: int, result: dict):
+    print(f"--- {title} ({rows} rows) ---")
+    for name, m in result.items():
+        if 'accuracy' in m:
+            print(f"  {name:<7} accuracy={m['accuracy']:.4f}")
+        else:
+            print(f"  {name:<7} MAE={m['mae']:.4f}  R2={m['r2']:.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate the deployed driver model over recorded episodes.')
+    parser.add_argument('episodes', nargs='+', help='Recorded episode CSV files')
+    parser.add_argument('--batchSize', action='store', type=int, dest='batch_size', default=65536,
+                        help='Rows per inference batch (default: 65536)')
+    parser.add_argument('--stage', action='store', type=int, dest='stage', default=3,
+                        help='Stage passed to the Driver (default: 3)')
+    arguments = parser.parse_args()
+
+    d = driver.Driver(arguments.stage)
+    if d.nn_model is None:
+        raise SystemExit("The driver could not load its model/scaler; nothing to evaluate.")
+
+    wanted = list(dict.fromkeys(d.schema.input_columns + ['rpm', 'speedX', 'sensor_gear']
+                                + list(LABEL_COLUMNS.values()) + ['focus', 'meta']))
+
+    t0 = time.perf_counter()
+    columns, track_ids, tracks = load_episodes(arguments.episodes, wanted)
+    t1 = time.perf_counter()
+    X = d.schema.features(columns)
+    t2 = time.perf_counter()
+    pred = controls(d, predict(d, X, arguments.batch_size), columns)
+    t3 = time.perf_counter()
+
+    rows = X.shape[0]
+    print_metrics('All episodes', rows, metrics(pred, columns, np.ones(rows, dtype=bool)))
+    for i, track in enumerate(tracks):
+        mask = track_ids == i
+        print_metrics(f"Track {track}", int(mask.sum()), metrics(pred, columns, mask))
+
+    print('--- Throughput ---')
+    print(f"  load      {t1 - t0:.2f}s ({rows / max(t1 - t0, 1e-9):,.0f} rows/s)")
+    print(f"  features  {t2 - t1:.2f}s ({rows / max(t2 - t1, 1e-9):,.0f} rows/s)")
+    print(f"  inference {t3 - t2:.2f}s ({rows / max(t3 - t2, 1e-9):,.0f} rows/s)")
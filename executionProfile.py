@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+'''
+Execution profile for many driver processes on one host.
+
+By default every pyclient.py process starts torch's intra-op pool with one
+thread per core (plus OpenMP/MKL/OpenBLAS pools under NumPy and sklearn)
+for a batch-1 MLP that cannot use them. With N bots on N cores that is N^2
+spinning threads, and tick latency tails grow with the bot count.
+ExecutionProfile.apply() pins a process down:
+
+  * torch intra-op and inter-op threads (default 1 each)
+  * OMP/MKL/OpenBLAS thread counts: environment variables for pools not
+    yet started, threadpoolctl for those that are (if installed)
+  * CPU affinity (os.sched_setaffinity), e.g. one core per bot
+
+and warm() runs the model a number of times on a dummy row before the
+race, so lazy initialisation (allocator pools, kernel selection) happens
+outside the first ticks. The profile also switches the eager torch
+backend to preallocated input/output tensors (inferenceBackend reuse), so
+a tick allocates no tensors.
+
+python executionProfile.py scale runs 1, 2, 4, ... bots up to the core
+count (or --maxBots) as separate processes, each calling Driver.drive on
+simulated sensor packets, once with library defaults and once with the
+profile, and prints the p99 tick latency for each bot count.
+
+Usage:
+    python pyclient.py --execProfile [--cpuAffinity 2] [--backendThreads 1]
+    python executionProfile.py scale --maxBots 8 --ticks 2000
+'''
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+THREAD_ENV = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def parse_cores(text: str | None) -> set[int] | None:
+    '''"0-3,6" -> {0, 1, 2, 3, 6}'''
+    if not text:
+        return None
+    cores = set()
+    for part in text.split(','):
+        low, _, high = part.partition('-')
+        cores.update(range(int(low), int(high or low) + 1))
+    return cores
+
+
+def set_thread_env(threads: int):
+    '''Thread counts for OpenMP/BLAS pools of this process's future children (and pools not started yet)'''
+    for name in THREAD_ENV:
+        os.environ[name] = str(threads)
+
+
+class ExecutionProfile(object):
+    '''
+    Thread counts, CPU affinity and warm-up for one driver process
+    '''
+
+    def __init__(self, threads: int = 1, interop_threads: int = 1, cores: set[int] | None = None, warmup: int = 100):
+        '''Constructor'''
+        self.threads = threads
+        self.interop_threads = interop_threads
+        self.cores = cores
+        self.warmup = warmup
+        self.limits = None # threadpoolctl handle, kept alive while the limits apply
+
+    def apply(self):
+        import torch
+
+        set_thread_env(self.threads)
+        torch.set_num_threads(self.threads)
+        try:
+            torch.set_num_interop_threads(self.interop_threads)
+        except RuntimeError:
+            pass # Only allowed before the first inter-op parallel work; later calls keep the existing pool
+        try:
+            from threadpoolctl import threadpool_limits
+            self.limits = threadpool_limits(limits=self.threads)
+        except ImportError:
+            pass
+        if self.cores is not None and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.cores)
+
+    def warm(self, driver):
+        '''Run the driver's backend on a dummy row so first-call costs are paid before the race'''
+        if driver.nn_model is None:
+            return 0.0
+        row = np.zeros((1, len(driver.feature_columns)), dtype=np.float32)
+        t0 = time.perf_counter()
+        for _ in range(self.warmup):
+            driver.backend.predict_one(row)
+        return time.perf_counter() - t0
+
+    def describe(self) -> str:
+        import torch
+
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None
+        return (f"torch threads={torch.get_num_threads()} interop={torch.get_num_interop_threads()} "
+                f"cores={cores}")
+
+
+def scale_worker(profiled: bool, core: int | None, messages: list[str], ticks: int, interval: float,
+                 start, results):
+    '''One simulated bot: Driver.drive on recorded packets, tick times to results; start is the shared barrier'''
+    if profiled:
+        profile = ExecutionProfile(cores={core} if core is not None else None)
+        profile.apply()
+    import driver
+    import inferenceBackend
+    import latencyStats
+
+    d = driver.Driver(3, backend=inferenceBackend.create('torch', reuse=profiled))
+    if profiled:
+        profile.warm(d)
+    latency = latencyStats.LatencyRecorder(ticks)
+    start.wait() # Barrier: every bot has loaded and warmed its model
+    next_tick = time.perf_counter()
+    for i in range(ticks):
+        t0 = time.perf_counter()
+        d.drive(messages[i % len(messages)])
+        latency.add(time.perf_counter() - t0)
+        if interval:
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+    results.put(latency.summary())
+
+
+def scale(max_bots: int, ticks: int, interval: float) -> list[tuple[int, dict, dict]]:
+    '''p99 tick latency per bot count, library defaults vs. the profile'''
+    import kinematicSim
+
+    sim = kinematicSim.KinematicSim(kinematicSim.Track(kinematicSim.TRACKS['circuit']), 64)
+    policy = kinematicSim.fallback_policy(64)
+    messages = []
+    for _ in range(8):
+        columns = sim.sensor_columns()
+        messages += sim.messages(columns)
+        sim.step(*policy(columns, sim))
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    counts = sorted({min(2 ** k, max_bots) for k in range(max_bots.bit_length() + 1)})
+    ctx = multiprocessing.get_context('spawn')
+    rows = []
+    for bots in counts:
+        summaries = []
+        for profiled in (False, True):
+            # The clock starts once every worker has imported torch and loaded its model, however long that takes
+            start, results = ctx.Barrier(bots + 1), ctx.Queue()
+            workers = [ctx.Process(target=scale_worker,
+                                   args=(profiled, cores[i % len(cores)], messages, ticks, interval, start, results))
+                       for i in range(bots)]
+            for w in workers:
+                w.start()
+            start.wait(120) # BrokenBarrierError instead of a hang if a worker dies while loading
+            stats = [results.get() for _ in workers]
+            for w in workers:
+                w.join()
+            summaries.append({'p50_ms': float(np.median([s['p50_ms'] for s in stats])),
+                              'p99_ms': max(s['p99_ms'] for s in stats)})
+        rows.append((bots, summaries[0], summaries[1]))
+        print(f"{bots:>4} bots  default p50={summaries[0]['p50_ms']:.3f}ms p99={summaries[0]['p99_ms']:.3f}ms  "
+              f"profile p50={summaries[1]['p50_ms']:.3f}ms p99={summaries[1]['p99_ms']:.3f}ms")
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tick latency of co-located driver processes with and without the execution profile.')
+    parser.add_argument('command', choices=['scale'], help='Run the bot-count scaling benchmark')
+    parser.add_argument('--maxBots', action='store', type=int, dest='max_bots',
+                        default=len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count(),
+                        help='Largest number of bots (default: number of usable cores)')
+    parser.add_argument('--ticks', action='store', type=int, dest='ticks', default=2000,
+                        help='Ticks per bot (default: 2000)')
+    parser.add_argument('--interval', action='store', type=float, dest='interval', default=0.002,
+                        help='Seconds between ticks of one bot, 0 for back-to-back (default: 0.002)')
+    arguments = parser.parse_args()
+
+    print(f"Workers: up to {arguments.max_bots} bots, {arguments.ticks} ticks each, {arguments.interval * 1e3:.1f} ms apart")
+    scale(arguments.max_bots, arguments.ticks, arguments.interval)
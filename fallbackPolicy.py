@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+'''
+Batched fallback driver: parity check, throughput and dataset labelling.
+
+driver.fallback_batch() is the array version of the scalar fallback
+methods (Driver.steer(), gear(), speed()); Driver.drive() runs it on a
+batch of one. This tool keeps it in step with the scalar reference and
+puts the batched one to work:
+
+  check  - random states (including missing sensors, the first tick
+           without a previous rpm, and speeds/rpms around every threshold)
+           through both; any mismatch is listed and the exit code is 1
+  bench  - rows/s of the scalar methods vs. the batched function
+  label  - the fallback's commands for every row of recordings, as a
+           baseline to compare models or human laps against. The policy is
+           stateful, so each row sees the previous row's rpm and the
+           recorded accel/gear of the previous row as its own previous
+           commands.
+
+FallbackPolicy keeps that per-car state between ticks for closed-loop use
+(see kinematicSim.py --policy fallback).
+
+Usage:
+    python fallbackPolicy.py check --rows 200000
+    python fallbackPolicy.py label collected_data/*.tlm --out fallback_labels.csv
+'''
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import driver
+import telemetrySchema
+
+
+class FallbackPolicy(object):
+    '''
+    Per-car state (previous rpm and commands) around driver.fallback_batch
+    '''
+
+    def __init__(self, cars: int):
+        '''Constructor: the state of freshly constructed Drivers (CarControl defaults)'''
+        self.prev_rpm = np.full(cars, np.nan)
+        self.accel = np.zeros(cars)
+        self.gear = np.ones(cars, dtype=np.int64)
+
+    def __call__(self, angle, track_pos, speed, rpm, sensor_gear) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''One tick for every car: (accel, steer, gear)'''
+        self.accel, steer, self.gear = driver.fallback_batch(angle, track_pos, speed, rpm, sensor_gear,
+                                                             self.prev_rpm, self.accel, self.gear)
+        rpm = np.asarray(rpm, dtype=np.float64)
+        self.prev_rpm = np.where(np.isnan(rpm), self.prev_rpm, rpm)
+        return self.accel, steer, self.gear
+
+
+def random_states(n: int, seed: int) -> dict[str, np.ndarray]:
+    '''States that exercise every branch; about 5% of each sensor is missing (NaN)'''
+    rng = np.random.default_rng(seed)
+    states = {
+        'angle': rng.uniform(-1.5, 1.5, n),
+        'trackPos': rng.uniform(-2.0, 2.0, n),
+        # Mostly around the 1/10 km/h gear thresholds and max_speed
+        'speedX': np.select([rng.random(n) < 0.3, rng.random(n) < 0.5],
+                            [rng.uniform(-5, 15, n), rng.uniform(90, 110, n)], rng.uniform(-20, 300, n)),
+        'rpm': np.where(rng.random(n) < 0.5, rng.uniform(0, 10000, n), rng.choice([2999.0, 3000.0, 7000.0, 7001.0], n)),
+        'sensor_gear': rng.integers(-1, 7, n).astype(np.float64),
+        'prev_rpm': rng.uniform(0, 10000, n),
+        'prev_accel': np.where(rng.random(n) < 0.3, rng.choice([0.1, 0.0, 1.0], n), rng.uniform(-0.2, 1.2, n)),
+        'prev_gear': rng.integers(-1, 7, n),
+    }
+    for name in ('angle', 'trackPos', 'speedX', 'rpm', 'sensor_gear', 'prev_rpm'):
+        states[name][rng.random(n) < 0.05] = np.nan
+    return states
+
+
+def scalar_reference(states: dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''The scalar Driver methods, row by row, from the given state and previous commands'''
+    d = driver.Driver.__new__(driver.Driver) # Only the fallback attributes; no model loading
+    d.steer_lock, d.max_speed = 0.785398, 100
+    import carControl
+    import carState
+
+    n = len(states['angle'])
+    out = np.empty((3, n))
+    columns = [[None if v != v else v for v in states[name].tolist()]
+               for name in ('angle', 'trackPos', 'speedX', 'rpm', 'sensor_gear', 'prev_rpm')]
+    for i, (angle, track_pos, speed, rpm, gear, prev_rpm) in enumerate(zip(*columns)):
+        d.state = carState.CarState()
+        d.state.angle, d.state.trackPos, d.state.speedX, d.state.rpm = angle, track_pos, speed, rpm
+        d.state.gear = None if gear is None else int(gear)
+        d.control = carControl.CarControl(accel=float(states['prev_accel'][i]), gear=int(states['prev_gear'][i]))
+        d.prev_rpm = prev_rpm
+        d.steer()
+        d.gear()
+        d.speed()
+        out[:, i] = d.control.getAccel(), d.control.getSteer(), d.control.getGear()
+    return out[0], out[1], out[2]
+
+
+def batch(states: dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return driver.fallback_batch(states['angle'], states['trackPos'], states['speedX'], states['rpm'],
+                                 states['sensor_gear'], states['prev_rpm'], states['prev_accel'], states['prev_gear'])
+
+
+def check(rows: int, seed: int) -> int:
+    '''Compare both implementations; returns the number of mismatching rows'''
+    states = random_states(rows, seed)
+    expected = scalar_reference(states)
+    actual = batch(states)
+    bad = np.zeros(rows, dtype=bool)
+    for name, e, a in zip(('accel', 'steer', 'gear'), expected, actual):
+        wrong = ~np.isclose(e, a, rtol=0, atol=1e-12)
+        bad |= wrong
+        print(f"  {name:<6} {int(wrong.sum())} mismatches")
+    for i in np.flatnonzero(bad)[:10]:
+        print(f"  row {i}: " + ' '.join(f"{k}={v[i]:.6g}" for k, v in states.items())
+              + f" -> scalar {[float(e[i]) for e in expected]}, batch {[float(a[i]) for a in actual]}")
+    return int(bad.sum())
+
+
+def label(paths: list[str]) -> dict[str, np.ndarray]:
+    '''Fallback commands for every row of the recordings (previous row = previous tick, per file)'''
+    parts = []
+    for path in paths:
+        _, c = telemetrySchema.read_table(path)
+        n = len(c['rpm'])
+        previous = lambda name, first: np.concatenate([[first], c[name][:-1]]).astype(np.float64) \
+            if name in c else np.full(n, first, dtype=np.float64)
+        prev_gear = previous('control_gear', 1)
+        prev_gear = np.where(np.isnan(prev_gear), 1, prev_gear).astype(np.int64)
+        accel, steer, gear = driver.fallback_batch(c['angle'], c['trackPos'], c['speedX'], c['rpm'], c['sensor_gear'],
+                                                   previous('rpm', np.nan), np.nan_to_num(previous('accel', 0.0)),
+                                                   prev_gear)
+        parts.append((accel, steer, gear))
+    return {name: np.concatenate([part[k] for part in parts]) for k, name in enumerate(('accel', 'steer', 'gear'))}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parity check, benchmark and labelling for the batched fallback driver.')
+    parser.add_argument('command', choices=['check', 'bench', 'label'], help='What to run')
+    parser.add_argument('paths', nargs='*', help='Recordings to label (.csv or .tlm)')
+    parser.add_argument('--rows', action='store', type=int, dest='rows', default=100000,
+                        help='Random states for check/bench (default: 100000)')
+    parser.add_argument('--seed', action='store', type=int, dest='seed', default=0,
+                        help='Seed for the random states (default: 0)')
+    parser.add_argument('--out', action='store', dest='out', default=None,
+                        help='label: CSV to write the commands to')
+    arguments = parser.parse_args()
+
+    if arguments.command == 'check':
+        mismatches = check(arguments.rows, arguments.seed)
+        print(f"{arguments.rows} states: {'OK' if mismatches == 0 else f'{mismatches} rows differ'}")
+        sys.exit(1 if mismatches else 0)
+    elif arguments.command == 'bench':
+        states = random_states(arguments.rows, arguments.seed)
+        small = {k: v[:min(arguments.rows, 20000)] for k, v in states.items()}
+        t0 = time.perf_counter()
+        scalar_reference(small)
+        t1 = time.perf_counter()
+        batch(states)
+        t2 = time.perf_counter()
+        scalar_rate, batch_rate = len(small['angle']) / (t1 - t0), arguments.rows / (t2 - t1)
+        print(f"scalar Driver methods: {scalar_rate:,.0f} rows/s")
+        print(f"fallback_batch:        {batch_rate:,.0f} rows/s ({batch_rate / scalar_rate:.0f}x)")
+    else:
+        if not arguments.paths:
+            parser.error('label needs recordings')
+        labels = label(arguments.paths)
+        print(f"Labelled {len(labels['accel'])} rows: mean accel {labels['accel'].mean():.3f}, "
+              f"mean |steer| {np.abs(labels['steer']).mean():.3f}, gears {np.bincount(labels['gear'] + 1, minlength=8)[1:].tolist()}")
+        if arguments.out:
+            import pandas as pd
+
+            pd.DataFrame(labels).to_csv(arguments.out, index=False)
+            print(f"Wrote {arguments.out}")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+'''
+Compact derived features computed from the raw SCR sensors.
+
+The raw model input has 19 track rangefinders and 36 opponent sensors.
+FeatureReducer turns a (N, raw) matrix into REDUCED_COLUMNS in a single
+vectorized pass:
+
+  * the car's own kinematics are passed through unchanged
+  * track rays become free space ahead, the bearing of the longest ray,
+    a curvature estimate and a left/right asymmetry
+  * opponents become the nearest distance in six 60 degree sectors plus
+    the distance and bearing of the closest car
+
+The same reducer runs on a single live row in Driver.drive (through
+TelemetrySchema with feature_set='reduced') and on whole datasets.
+
+Usage: python featureReduction.py recorded.csv reduced.csv
+'''
+import numpy as np
+
+# Rangefinder angles set in Driver.init(), in degrees
+RAY_ANGLES = np.array([-90, -75, -60, -45, -30, -20, -15, -10, -5, 0, 5, 10, 15, 20, 30, 45, 60, 75, 90],
+                      dtype=np.float32)
+# Opponent sensor i covers bearings [-180 + 10i, -170 + 10i); this is its centre
+OPPONENT_BEARINGS = np.arange(36, dtype=np.float32) * 10.0 - 175.0
+# Opponent sensors read this when nobody is in range
+OPPONENT_RANGE = 200.0
+
+PASSTHROUGH_COLUMNS = [
+    'speedX', 'speedY', 'speedZ', 'rpm', 'sensor_gear', 'trackPos', 'angle', 'z',
+    'wheelSpinVel_0', 'wheelSpinVel_1', 'wheelSpinVel_2', 'wheelSpinVel_3',
+    'track_0', 'track_18', # Clearance to either edge, perpendicular to the car
+]
+TRACK_COLUMNS = ['free_ahead', 'longest_ray_bearing', 'track_curvature', 'track_asymmetry']
+# Sector k covers opponent bearings [-180 + 60k, -120 + 60k)
+OPPONENT_COLUMNS = [f'opp_sector_{k}' for k in range(6)] + ['opp_nearest', 'opp_nearest_bearing']
+REDUCED_COLUMNS = PASSTHROUGH_COLUMNS + TRACK_COLUMNS + OPPONENT_COLUMNS
+
+
+class FeatureReducer(object):
+    '''
+    Maps raw sensor matrices (columns in a given layout) to REDUCED_COLUMNS
+    '''
+
+    def __init__(self, columns: list[str]):
+        '''Constructor. columns is the layout of the raw matrices passed in.'''
+        index = {col: i for i, col in enumerate(columns)}
+        self.passthrough = [index[col] for col in PASSTHROUGH_COLUMNS]
+        self.track = [index[f'track_{i}'] for i in range(19)]
+        self.opponents = [index[f'opponents_{i}'] for i in range(36)]
+
+        self.ray_sin = np.sin(np.radians(RAY_ANGLES))
+        # Symmetric front rays (+-5..+-20 degrees) used for the asymmetry measure
+        self.neg_front = [5, 6, 7, 8]
+        self.pos_front = [13, 12, 11, 10]
+
+    def __call__(self, raw: np.ndarray) -> np.ndarray:
+        '''(N, raw columns) float array -> (N, len(REDUCED_COLUMNS)) float32'''
+        n = raw.shape[0]
+        out = np.empty((n, len(REDUCED_COLUMNS)), dtype=np.float32)
+        p = len(PASSTHROUGH_COLUMNS)
+        out[:, :p] = raw[:, self.passthrough]
+
+        # Rays read -1 off track; treat that as no free space
+        track = np.maximum(raw[:, self.track], 0.0)
+        longest = np.argmax(track, axis=1)
+        longest_dist = track[np.arange(n), longest]
+        out[:, p] = track[:, 8:11].max(axis=1) # Rays at -5, 0 and +5 degrees
+        out[:, p + 1] = RAY_ANGLES[longest] / 90.0
+        # Circle tangent to the heading through the far end of the longest ray: k = 2 sin(theta) / d
+        out[:, p + 2] = 2.0 * self.ray_sin[longest] / np.maximum(longest_dist, 1.0)
+        neg = track[:, self.neg_front].sum(axis=1)
+        pos = track[:, self.pos_front].sum(axis=1)
+        out[:, p + 3] = (pos - neg) / np.maximum(pos + neg, 1e-3)
+
+        q = p + len(TRACK_COLUMNS)
+        opponents = raw[:, self.opponents]
+        out[:, q:q + 6] = opponents.reshape(n, 6, 6).min(axis=2)
+        nearest = np.argmin(opponents, axis=1)
+        out[:, q + 6] = opponents[np.arange(n), nearest]
+        # Bearing of the closest car in [-1, 1); 0 when nobody is in range
+        out[:, q + 7] = np.where(out[:, q + 6] < OPPONENT_RANGE, OPPONENT_BEARINGS[nearest] / 180.0, 0.0)
+        return out
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import pandas as pd
+
+    import telemetrySchema
+
+    parser = argparse.ArgumentParser(description='Write the reduced features (plus labels) of a recorded episode.')
+    parser.add_argument('source', help='Recorded episode CSV')
+    parser.add_argument('target', help='Output CSV')
+    arguments = parser.parse_args()
+
+    schema = telemetrySchema.TelemetrySchema(feature_set='reduced')
+    frame = pd.read_csv(arguments.source, dtype=np.float32)
+    frame.columns = frame.columns.str.strip()
+    columns = {col: frame[col].to_numpy() for col in frame.columns}
+    telemetrySchema.repair_legacy_controls(columns)
+    X, y = schema.select(columns)
+    out = pd.DataFrame(X, columns=schema.feature_columns)
+    out[schema.label_columns] = y
+    out.to_csv(arguments.target, index=False)
+    print(f"Wrote {len(out)} rows x {len(schema.feature_columns)} reduced features to {arguments.target}")
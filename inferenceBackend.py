@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+'''
+Compute backends for the driver's model.
+
+Driver.drive hands one raw feature row to its backend and gets the model
+outputs back; the backend owns the scaler transform and the forward pass.
+Every backend has the same three methods:
+
+  load(model, scaler)  - take a torch MLP (driver.MLP, a modelRegistry
+                         mixture, ...) and a scaler with transform()
+  predict_one(X)       - (1, n_features) float32 row -> (n_outputs,) array
+  predict_batch(X)     - (N, n_features) -> (N, n_outputs)
+
+and clone() returns an unloaded backend with the same settings. load()
+can be slow (TorchScript compiles, ONNX exports and opens a session), so
+a model change is loaded into a clone off the driving thread and the
+driver then swaps backends (Driver.set_model(..., backend=)).
+
+Backends:
+
+  torch        eager module under torch.no_grad (the original code path)
+  torch-infer  eager module under torch.inference_mode
+  torchscript  torch.jit.script'ed module under torch.inference_mode
+  numpy        the weights as NumPy views (no copy), matmuls in float32;
+               no torch call on the hot path
+  onnx         ONNX Runtime CPU session. The driver's model is exported on
+               load; with onnx_path, a given .onnx file is run instead (for
+               instance a notebook model exported with tf2onnx), fed the
+               scaled feature row. Needs pip install onnxruntime (and onnx
+               for the export).
+
+The torch backends take a thread count (torch.set_num_threads) so several
+bots on one host do not each start a full intra-op pool. With reuse, the
+eager torch backends run batch-1 calls through preallocated input, hidden
+and output tensors (addmm/relu_ with out=), so a tick allocates no
+tensors; the returned row is then a view that the next call overwrites.
+
+python inferenceBackend.py bench runs the current model through every
+available backend and reports batch-1 latency, batch throughput and the
+largest difference from the NumPy reference forward.
+'''
+import argparse
+import io
+import time
+
+import numpy as np
+import torch
+
+import latencyStats
+import modelBundle
+
+BACKENDS = ('torch', 'torch-infer', 'torchscript', 'numpy', 'onnx')
+
+
+class InferenceBackend(object):
+    '''
+    Interface: load() a model and scaler, then predict_one()/predict_batch()
+    '''
+
+    name = None
+
+    def load(self, model, scaler):
+        raise NotImplementedError
+
+    def clone(self) -> 'InferenceBackend':
+        '''A new, unloaded backend with the same settings'''
+        raise NotImplementedError
+
+    def predict_one(self, X: np.ndarray) -> np.ndarray:
+        return self.predict_batch(X)[0]
+
+    def predict_batch(self, X: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class TorchBackend(InferenceBackend):
+    '''
+    The torch module itself: eager under no_grad or inference_mode, or TorchScript
+    '''
+
+    def __init__(self, mode: str = 'eager', inference_mode: bool = False, threads: int | None = None,
+                 reuse: bool = False):
+        '''Constructor: mode 'eager' or 'script'; threads pins torch's intra-op pool; reuse preallocates batch-1 tensors'''
+        self.name = 'torchscript' if mode == 'script' else ('torch-infer' if inference_mode else 'torch')
+        self.mode = mode
+        self.inference_mode = inference_mode
+        self.reuse = reuse and mode == 'eager'
+        self.plan = None
+        self.grad_off = torch.inference_mode if (inference_mode or mode == 'script') else torch.no_grad
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = None
+        self.scaler = None
+
+    def load(self, model, scaler):
+        model.eval()
+        # Scripted modules share the original parameters and buffers, so in-place updates still apply
+        self.model = torch.jit.script(model) if self.mode == 'script' else model
+        self.scaler = scaler
+        self.plan = self.preallocate(model, scaler) if self.reuse else None
+
+    def clone(self):
+        # The thread count is process-wide and already set
+        return TorchBackend(self.mode, self.inference_mode, reuse=self.reuse)
+
+    def preallocate(self, model, scaler):
+        '''Buffers and (weight^T, bias, out, relu) steps for allocation-free batch-1 calls; None if the model is not a Linear/ReLU stack'''
+        layers = list(getattr(model, 'model', []))
+        if not layers or not all(isinstance(m, (torch.nn.Linear, torch.nn.ReLU)) for m in layers):
+            return None
+        arrays = {'scaler.mul': scaler.mul, 'scaler.add': scaler.add} if hasattr(scaler, 'mul') else modelBundle.scaler_arrays(scaler)
+        self.mul = np.asarray(arrays['scaler.mul'], dtype=np.float32)
+        self.add = np.asarray(arrays['scaler.add'], dtype=np.float32)
+        self.input = torch.empty(1, self.mul.shape[0])
+        self.input_np = self.input.numpy()[0]
+        steps = []
+        for k, module in enumerate(layers):
+            if isinstance(module, torch.nn.Linear):
+                relu = k + 1 < len(layers) and isinstance(layers[k + 1], torch.nn.ReLU)
+                steps.append((module.weight.detach().t(), module.bias.detach(), torch.empty(1, module.out_features), relu))
+        self.mixture = None
+        if hasattr(model, 'weights'):
+            # modelRegistry.MixtureMLP: weighted sum of the per-model output blocks
+            self.mixture = (model.count, model.output_dim, model.weights, torch.empty(model.output_dim))
+        self.output_np = (self.mixture[3] if self.mixture else steps[-1][2][0]).numpy()
+        return steps
+
+    def predict_one(self, X: np.ndarray) -> np.ndarray:
+        if self.plan is None:
+            return self.predict_batch(X)[0]
+        np.multiply(X[0], self.mul, out=self.input_np)
+        self.input_np += self.add
+        with torch.no_grad():
+            h = self.input
+            for weight_t, bias, out, relu in self.plan:
+                torch.addmm(bias, h, weight_t, out=out)
+                if relu:
+                    out.relu_()
+                h = out
+            if self.mixture is not None:
+                count, output_dim, weights, mixed = self.mixture
+                torch.mv(h.view(count, output_dim).t(), weights, out=mixed)
+        return self.output_np
+
+    def predict_batch(self, X: np.ndarray) -> np.ndarray:
+        scaled = np.asarray(self.scaler.transform(X), dtype=np.float32)
+        with self.grad_off():
+            return self.model(torch.from_numpy(scaled)).numpy()
+
+
+class NumpyBackend(InferenceBackend):
+    '''
+    Linear/ReLU stack in NumPy on views of the torch parameters
+    '''
+
+    name = 'numpy'
+
+    def load(self, model, scaler):
+        layers = [module for module in model.model]
+        self.layers = []
+        for k, module in enumerate(layers):
+            if isinstance(module, torch.nn.Linear):
+                # .numpy() shares memory with the parameter; the transpose is a view as well
+                relu = k + 1 < len(layers) and isinstance(layers[k + 1], torch.nn.ReLU)
+                self.layers.append((module.weight.detach().numpy().T, module.bias.detach().numpy(), relu))
+            elif not isinstance(module, torch.nn.ReLU):
+                raise TypeError(f"NumPy backend only runs Linear/ReLU stacks, not {type(module).__name__}")
+        # A mixture (modelRegistry.MixtureMLP) sums its per-model outputs with a weight buffer; keep a view of it
+        self.mixture = (model.count, model.output_dim, model.weights.numpy()) if hasattr(model, 'weights') else None
+        self.scaler = scaler
+
+    def clone(self):
+        return NumpyBackend()
+
+    def predict_batch(self, X: np.ndarray) -> np.ndarray:
+        h = np.asarray(self.scaler.transform(X), dtype=np.float32)
+        for weight, bias, relu in self.layers:
+            h = h @ weight
+            h += bias
+            if relu:
+                np.maximum(h, 0.0, out=h)
+        if self.mixture is not None:
+            count, output_dim, weights = self.mixture
+            h = np.einsum('bko,k->bo', h.reshape(-1, count, output_dim), weights)
+        return h
+
+
+class OnnxBackend(InferenceBackend):
+    '''
+    ONNX Runtime CPU session over an exported or given .onnx model
+    '''
+
+    name = 'onnx'
+
+    def __init__(self, onnx_path: str | None = None, threads: int | None = None):
+        '''Constructor'''
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime (pip install onnxruntime; exporting the driver's model also needs onnx)")
+        self.ort = onnxruntime
+        self.onnx_path = onnx_path
+        self.threads = threads
+        self.options = onnxruntime.SessionOptions()
+        if threads:
+            self.options.intra_op_num_threads = threads
+            self.options.inter_op_num_threads = 1
+        self.session = None
+
+    def load(self, model, scaler):
+        if self.onnx_path:
+            source = self.onnx_path
+        else:
+            # Exported with the current weights; a model change is exported into a clone (see clone())
+            buffer = io.BytesIO()
+            dummy = torch.zeros(1, scaler.n_features_in_)
+            torch.onnx.export(model.eval(), dummy, buffer, input_names=['features'], output_names=['outputs'],
+                              dynamic_axes={'features': {0: 'batch'}, 'outputs': {0: 'batch'}}, dynamo=False)
+            source = buffer.getvalue()
+        self.session = self.ort.InferenceSession(source, self.options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.scaler = scaler
+
+    def clone(self):
+        return OnnxBackend(self.onnx_path, self.threads)
+
+    def predict_batch(self, X: np.ndarray) -> np.ndarray:
+        scaled = np.asarray(self.scaler.transform(X), dtype=np.float32)
+        return self.session.run(None, {self.input_name: scaled})[0]
+
+
+def create(name: str = 'torch', threads: int | None = None, onnx_path: str | None = None,
+           reuse: bool = False) -> InferenceBackend:
+    '''Backend by name (see BACKENDS); reuse enables preallocated tensors for the eager torch backends'''
+    if name == 'torch':
+        return TorchBackend(threads=threads, reuse=reuse)
+    if name == 'torch-infer':
+        return TorchBackend(inference_mode=True, threads=threads, reuse=reuse)
+    if name == 'torchscript':
+        return TorchBackend(mode='script', threads=threads)
+    if name == 'numpy':
+        return NumpyBackend()
+    if name == 'onnx':
+        return OnnxBackend(onnx_path, threads)
+    raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(BACKENDS)}")
+
+
+def bench(model, scaler, reference, names, calls: int, batch: int, threads: int | None, seed: int = 0):
+    '''Latency and throughput of each backend on one model; reference(X) gives the expected outputs'''
+    rng = np.random.default_rng(seed)
+    n = scaler.n_features_in_
+    mul, add = np.asarray(scaler.mul), np.asarray(scaler.add)
+    # Feature rows around the scaler's training distribution
+    X = ((rng.standard_normal((batch, n)) - add) / mul).astype(np.float32)
+    expected = reference(X.astype(np.float64))
+    for name in names:
+        try:
+            backend = create(name, threads=threads)
+            backend.load(model, scaler)
+        except Exception as e:
+            print(f"{name:<12} unavailable: {e}")
+            continue
+        for i in range(50): # Warm-up (TorchScript profiles its first calls)
+            backend.predict_one(X[i:i + 1])
+        latency = latencyStats.LatencyRecorder(calls)
+        for i in range(calls):
+            row = X[i % batch:i % batch + 1]
+            t0 = time.perf_counter()
+            backend.predict_one(row)
+            latency.add(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        got = backend.predict_batch(X)
+        rate = batch / (time.perf_counter() - t0)
+        error = float(np.max(np.abs(got - expected)))
+        s = latency.summary()
+        print(f"{name:<12} batch-1 p50={s['p50_ms'] * 1e3:7.1f}us p99={s['p99_ms'] * 1e3:7.1f}us  "
+              f"batch-{batch} {rate:12,.0f} rows/s  max |diff| {error:.1e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the inference backends on the current model.')
+    parser.add_argument('command', choices=['bench'], help='Per-backend latency and throughput')
+    parser.add_argument('--model', action='store', dest='model_filename', default='torcs_mlp_model.pth',
+                        help='PyTorch state_dict (default: torcs_mlp_model.pth)')
+    parser.add_argument('--scaler', action='store', dest='scaler_filename', default='scaler_multi_output.pkl',
+                        help='Feature scaler (default: scaler_multi_output.pkl)')
+    parser.add_argument('--backends', action='store', dest='backends', default=','.join(BACKENDS),
+                        help=f"Comma-separated backends to run (default: {','.join(BACKENDS)})")
+    parser.add_argument('--calls', action='store', type=int, dest='calls', default=5000,
+                        help='Batch-1 calls per backend (default: 5000)')
+    parser.add_argument('--batch', action='store', type=int, dest='batch', default=4096,
+                        help='Rows for the throughput run (default: 4096)')
+    parser.add_argument('--threads', action='store', type=int, dest='threads', default=None,
+                        help='Thread count for torch/onnx (default: library default)')
+    arguments = parser.parse_args()
+
+    import driver
+
+    arrays = modelBundle.load_bundle(arguments.model_filename, arguments.scaler_filename)
+    model, scaler = driver.build_model(arrays)
+    print(f"Model {arguments.model_filename}: {modelBundle.mlp_dims(arrays)}, torch threads {torch.get_num_threads()}")
+    bench(model, scaler, lambda X: modelBundle.forward(arrays, X), arguments.backends.split(','),
+          arguments.calls, arguments.batch, arguments.threads)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+'''
+Vectorized kinematic car simulator for closed-loop tests without TORCS.
+
+KinematicSim steps N cars at once on a simple track given as a list of
+(length, curvature) segments. The car model is a kinematic bicycle with
+a geared engine, drag, braking and a friction limit on lateral
+acceleration; it is nowhere near TORCS physics, but it is deterministic,
+cheap and reacts to accel/brake/steer/gear the way a policy expects.
+
+Cars are tracked in the track's curvilinear frame (distance along the
+centreline s, lateral offset d, heading error psi), which makes the
+rangefinders exact for any segment layout: each ray is a straight line,
+marched in the same frame until it leaves the track.
+
+Sensors come out under the recorded column names (telemetrySchema), so
+a whole fleet feeds TelemetrySchema.features() directly, or as SCR
+sensor strings per car for Driver.drive(). Units and signs follow SCR:
+speedX in km/h, angle in radians (positive when the track points left of
+the car), trackPos in [-1, 1] with +1 on the left edge, rangefinders
+clockwise from -90 (left) to +90 degrees, -1 when off track.
+
+Usage:
+    python kinematicSim.py --cars 2000 --steps 3000 --track circuit --policy model
+'''
+import argparse
+import math
+import time
+
+import numpy as np
+
+import featureReduction
+import msgParser
+import telemetrySchema
+
+# Segment lists: (length in m, curvature in 1/m, positive turns left)
+TRACKS = {
+    'straight': [(3000.0, 0.0)],
+    'oval': [(400.0, 0.0), (math.pi * 100.0, 1 / 100.0), (400.0, 0.0), (math.pi * 100.0, 1 / 100.0)],
+    'circuit': [
+        (300.0, 0.0), (math.pi / 2 * 60.0, 1 / 60.0), (200.0, 0.0), (math.pi / 2 * 40.0, -1 / 40.0),
+        (150.0, 0.0), (math.pi * 50.0, 1 / 50.0), (250.0, 0.0), (math.pi / 3 * 30.0, -1 / 30.0),
+        (120.0, 0.0), (math.pi / 2 * 80.0, 1 / 80.0), (400.0, 0.0), (math.pi / 2 * 45.0, 1 / 45.0),
+    ],
+}
+
+TICK = 0.02 # SCR game tick in seconds
+
+# Car parameters, loosely after the SCR car1-trb1
+MASS = 1150.0
+WHEELBASE = 2.6
+WHEEL_RADIUS = 0.33
+STEER_LOCK = 0.366 # rad of wheel angle at steer = +-1: the 21 degree steer lock of car1-trb1
+                   # (Driver.steer_lock = 0.785398 is the heading error its rule maps to full lock, not the car's)
+GEAR_RATIOS = np.array([-3.2, 0.0, 3.82, 2.15, 1.56, 1.21, 0.97, 0.8]) # Gears -1 (reverse) to 6
+FINAL_DRIVE = 4.5
+IDLE_RPM, MAX_TORQUE_RPM, REDLINE_RPM = 800.0, 7000.0, 9500.0
+MAX_TORQUE = 300.0 # N m
+DRAG = 0.42 # 0.5 rho Cd A, N per (m/s)^2
+ROLLING = 0.15 # m/s^2
+MAX_BRAKE = 12.0 # m/s^2
+GRIP = 11.8 # friction limit (mu g) in m/s^2 on track
+OFF_TRACK_GRIP = 6.0
+OFF_TRACK_DRAG = 3.0 # extra m/s^2 of deceleration on grass
+RAY_RANGE = 200.0
+
+
+class Track(object):
+    '''
+    Closed track with piecewise-constant curvature, sampled on a fine grid
+    '''
+
+    def __init__(self, segments: list[tuple[float, float]], width: float = 12.0, resolution: float = 0.5):
+        '''Constructor'''
+        self.segments = segments
+        self.width = width
+        self.length = sum(length for length, _ in segments)
+        self.resolution = resolution
+        stations = np.arange(0.0, self.length, resolution)
+        ends = np.cumsum([length for length, _ in segments])
+        index = np.minimum(np.searchsorted(ends, stations, side='right'), len(segments) - 1)
+        self.kappa = np.array([kappa for _, kappa in segments])[index]
+
+    def curvature(self, s: np.ndarray) -> np.ndarray:
+        '''Centreline curvature at stations s (any real value, wrapped onto the lap)'''
+        return self.kappa[(s / self.resolution).astype(np.int64) % self.kappa.shape[0]]
+
+
+class KinematicSim(object):
+    '''
+    N cars stepped together on one track
+    '''
+
+    def __init__(self, track: Track, cars: int, seed: int = 0, ray_step: float = 2.0):
+        '''Constructor. ray_step is the rangefinder marching step in metres.'''
+        self.track = track
+        self.cars = cars
+        self.ray_step = ray_step
+        self.rng = np.random.default_rng(seed)
+        self.ray_angles = np.radians(featureReduction.RAY_ANGLES).astype(np.float64)
+
+        # Per-car state: centreline station, lateral offset (+ left), heading error (+ left of the track), speed
+        self.s, self.d, self.psi, self.v = (np.zeros(cars) for _ in range(4))
+        self.gear = np.zeros(cars, dtype=np.int64)
+        self.rpm = np.full(cars, IDLE_RPM)
+        self.dist_raced, self.cur_lap_time, self.last_lap_time, self.time = (np.zeros(cars) for _ in range(4))
+        self.laps = np.zeros(cars, dtype=np.int64)
+        self.off_track_ticks = np.zeros(cars, dtype=np.int64)
+        self.reset()
+
+    def reset(self, mask: np.ndarray | None = None):
+        '''Put all cars (or those in mask) back on the grid, staggered with small random offsets'''
+        if mask is None:
+            mask = np.ones(self.cars, dtype=bool)
+        k = int(mask.sum())
+        self.s[mask] = self.rng.uniform(0.0, 5.0, k)
+        self.d[mask] = self.rng.uniform(-1.0, 1.0, k)
+        self.psi[mask] = self.rng.uniform(-0.02, 0.02, k)
+        self.v[mask] = 0.0
+        self.gear[mask] = 0
+        self.rpm[mask] = IDLE_RPM
+        for arr in (self.dist_raced, self.cur_lap_time, self.last_lap_time, self.time):
+            arr[mask] = 0.0
+        self.laps[mask] = 0
+        self.off_track_ticks[mask] = 0
+
+    # --- Dynamics ---
+
+    def step(self, accel: np.ndarray, brake: np.ndarray, steer: np.ndarray, gear: np.ndarray, dt: float = TICK):
+        '''Advance every car by one tick under the given controls (arrays of length N; clutch is not modelled)'''
+        accel = np.clip(accel, 0.0, 1.0)
+        brake = np.clip(brake, 0.0, 1.0)
+        delta = np.clip(steer, -1.0, 1.0) * STEER_LOCK
+        self.gear = np.clip(np.asarray(gear, dtype=np.int64), -1, 6)
+
+        ratio = GEAR_RATIOS[self.gear + 1] * FINAL_DRIVE
+        wheel_rpm = self.v / WHEEL_RADIUS * 60.0 / (2 * math.pi)
+        engine_rpm = np.abs(wheel_rpm * ratio)
+        # Neutral revs freely with the throttle
+        self.rpm = np.where(ratio == 0.0, IDLE_RPM + accel * (REDLINE_RPM - IDLE_RPM) * 0.6,
+                            np.clip(engine_rpm, IDLE_RPM, REDLINE_RPM))
+        torque = MAX_TORQUE * np.clip((REDLINE_RPM - self.rpm) / (REDLINE_RPM - MAX_TORQUE_RPM), 0.0, 1.0)
+
+        on_track = np.abs(self.d) <= self.track.width / 2
+        grip = np.where(on_track, GRIP, OFF_TRACK_GRIP)
+        drive = np.clip(accel * torque * ratio / WHEEL_RADIUS / MASS, -grip, grip)
+        resist = DRAG * self.v * np.abs(self.v) / MASS + np.sign(self.v) * (ROLLING + np.where(on_track, 0.0, OFF_TRACK_DRAG))
+        braking = np.sign(self.v) * brake * np.minimum(MAX_BRAKE, grip)
+        v = self.v + (drive - resist - braking) * dt
+        # Resistances and brakes stop the car, they do not reverse it
+        stopped = (np.sign(v) != np.sign(self.v)) & (self.v != 0.0) & (np.abs(drive) < 1e-9)
+        self.v = np.where(stopped, 0.0, v)
+
+        # Kinematic bicycle, with yaw rate limited by the available lateral grip
+        yaw_rate = self.v / WHEELBASE * np.tan(delta)
+        limit = grip / np.maximum(np.abs(self.v), 1.0)
+        yaw_rate = np.clip(yaw_rate, -limit, limit)
+        kappa = self.track.curvature(self.s)
+        s_dot = self.v * np.cos(self.psi) / np.maximum(1.0 - self.d * kappa, 0.1)
+        self.d = self.d + self.v * np.sin(self.psi) * dt
+        self.psi = (self.psi + (yaw_rate - kappa * s_dot) * dt + math.pi) % (2 * math.pi) - math.pi
+        self.s = self.s + s_dot * dt
+
+        self.dist_raced += s_dot * dt
+        self.time += dt
+        self.cur_lap_time += dt
+        lap_done = self.s >= self.track.length * (self.laps + 1)
+        self.last_lap_time = np.where(lap_done, self.cur_lap_time, self.last_lap_time)
+        self.cur_lap_time = np.where(lap_done, 0.0, self.cur_lap_time)
+        self.laps += lap_done
+        self.off_track_ticks += ~on_track
+
+    # --- Sensors ---
+
+    def rangefinders(self) -> np.ndarray:
+        '''(N, 19) distances to the track edge along the SCR rangefinder rays, -1 for cars off track'''
+        half = self.track.width / 2
+        # Ray direction relative to the track tangent; SCR angles run clockwise
+        phi = (self.psi[:, None] - self.ray_angles[None, :]).ravel()
+        s = np.repeat(self.s, self.ray_angles.shape[0])
+        d = np.repeat(self.d, self.ray_angles.shape[0])
+        dist = np.full(phi.shape, RAY_RANGE)
+        travelled = np.zeros(phi.shape)
+        rays = np.arange(phi.shape[0]) # Rays still in flight; finished ones are dropped from the arrays
+        while rays.shape[0]:
+            h = np.minimum(self.ray_step, RAY_RANGE - travelled)
+            # A straight line in the curvilinear frame: the track turns under it by kappa per metre of s.
+            # Midpoint rule, with the curvature also taken half a step ahead
+            kappa = self.track.curvature(s)
+            ds_half = 0.5 * h * np.cos(phi) / np.maximum(1.0 - d * kappa, 0.05)
+            kappa = self.track.curvature(s + ds_half)
+            phi_mid = phi - kappa * ds_half
+            d_mid = d + 0.5 * h * np.sin(phi)
+            d_next = d + h * np.sin(phi_mid)
+            ds = h * np.cos(phi_mid) / np.maximum(1.0 - d_mid * kappa, 0.05)
+            phi = phi - kappa * ds
+            s = s + ds
+
+            hit = np.abs(d_next) > half
+            if hit.any():
+                # Interpolate the crossing inside the last step
+                edge = np.sign(d_next[hit]) * half
+                frac = np.clip((edge - d[hit]) / (d_next[hit] - d[hit]), 0.0, 1.0)
+                dist[rays[hit]] = travelled[hit] + frac * h[hit]
+            travelled = travelled + h
+            flying = ~hit & (travelled < RAY_RANGE - 1e-6)
+            rays, phi, s, d, travelled = rays[flying], phi[flying], s[flying], d_next[flying], travelled[flying]
+        dist = dist.reshape(self.cars, -1)
+        dist[np.abs(self.d) > half] = -1.0
+        return dist
+
+    def sensor_columns(self) -> dict[str, np.ndarray]:
+        '''Current sensors of every car under the recorded column names (telemetrySchema.SENSOR_COLUMNS)'''
+        n = self.cars
+        track = self.rangefinders()
+        columns = {
+            'speedX': self.v * 3.6, 'speedY': np.zeros(n), 'speedZ': np.zeros(n),
+            'rpm': self.rpm, 'fuel': np.full(n, 94.0), 'damage': np.zeros(n), 'sensor_gear': self.gear.astype(np.float64),
+            'racePos': np.ones(n), 'distFromStart': self.s % self.track.length, 'distRaced': self.dist_raced,
+            'curLapTime': self.cur_lap_time, 'lastLapTime': self.last_lap_time,
+            'trackPos': self.d / (self.track.width / 2), 'angle': -self.psi, 'z': np.zeros(n),
+        }
+        columns.update({f'track_{i}': track[:, i] for i in range(19)})
+        columns.update({f'opponents_{i}': np.full(n, featureReduction.OPPONENT_RANGE) for i in range(36)})
+        spin = self.v / WHEEL_RADIUS
+        columns.update({f'wheelSpinVel_{i}': spin for i in range(4)})
+        return {col: np.asarray(columns[col], dtype=np.float32) for col in telemetrySchema.SENSOR_COLUMNS}
+
+    def messages(self, columns: dict[str, np.ndarray] | None = None, cars=None) -> list[str]:
+        '''SCR sensor strings, one per car (or per index in cars), as Driver.drive() receives them from the server'''
+        if columns is None:
+            columns = self.sensor_columns()
+        if cars is not None:
+            columns = {col: values[cars] for col, values in columns.items()}
+        parser = msgParser.MsgParser()
+        groups = {}
+        for col, (attr, idx) in telemetrySchema.SENSOR_SOURCES.items():
+            groups.setdefault(attr, []).append(columns[col])
+        rows = {attr: np.stack(values, axis=1).tolist() for attr, values in groups.items()}
+        return [parser.stringify({attr: [f'{v:.6g}' for v in values[i]] for attr, values in rows.items()})
+                for i in range(len(columns['speedX']))]
+
+
+# --- Policies: sensor columns -> (accel, brake, steer, gear) arrays ---
+
+def model_policy(d):
+    '''Batched version of the Driver's NN branch: schema features, scaler, MLP, clipping, rule-based gear'''
+    import torch
+
+    import driver
+
+    def policy(columns: dict, sim: KinematicSim):
+        X = d.schema.features(columns)
+        with torch.inference_mode():
+            pred = d.nn_model(torch.from_numpy(np.asarray(d.feature_scaler.transform(X), dtype=np.float32))).numpy()
+        out = {name: np.clip(pred[:, d.nn_output_names.index(name)], low, high)
+               for name, (low, high) in driver.OUTPUT_RANGES.items()}
+        gear = driver.gear_rule_batch(columns['rpm'], columns['speedX'], columns['sensor_gear'],
+                                      out['accel'], out['brake'])
+        return out['accel'], out['brake'], out['steer'], gear
+    return policy
+
+
+def fallback_policy(cars: int):
+    '''The Driver's fallback (no model) for every car at once, via driver.fallback_batch'''
+    import fallbackPolicy
+
+    fallback = fallbackPolicy.FallbackPolicy(cars)
+    brake = np.zeros(cars)
+
+    def policy(columns: dict, sim: KinematicSim):
+        accel, steer, gear = fallback(columns['angle'], columns['trackPos'], columns['speedX'], columns['rpm'],
+                                      columns['sensor_gear'])
+        return accel, brake, steer, gear
+    return policy
+
+
+def drive_policy(drivers: list):
+    '''One Driver per car running Driver.drive() on SCR strings (exact but per-car Python speed)'''
+    parser = msgParser.MsgParser()
+
+    def policy(columns: dict, sim: KinematicSim):
+        controls = [parser.parse(d.drive(msg)) for d, msg in zip(drivers, sim.messages(columns))]
+        accel, brake, steer, gear = (np.array([float(c[key][0]) for c in controls])
+                                     for key in ('accel', 'brake', 'steer', 'gear'))
+        return accel, brake, steer, gear.astype(np.int64)
+    return policy
+
+
+def run(sim: KinematicSim, policy, steps: int) -> dict:
+    '''Closed loop for a number of ticks; returns throughput and driving statistics'''
+    policy_time = 0.0
+    start = time.perf_counter()
+    for _ in range(steps):
+        columns = sim.sensor_columns()
+        t = time.perf_counter()
+        accel, brake, steer, gear = policy(columns, sim)
+        policy_time += time.perf_counter() - t
+        sim.step(accel, brake, steer, gear)
+    wall = time.perf_counter() - start
+    car_steps = steps * sim.cars
+    return {
+        'cars': sim.cars, 'steps': steps, 'wall_seconds': wall,
+        'car_steps_per_second': car_steps / wall,
+        'policy_share': policy_time / wall,
+        # Simulated seconds per wall second, summed over the fleet
+        'realtime_factor': car_steps * TICK / wall,
+        'mean_distance': float(sim.dist_raced.mean()),
+        'mean_speed_kmh': float(sim.dist_raced.mean() / max(sim.time.mean(), 1e-9) * 3.6),
+        'laps': int(sim.laps.sum()),
+        'best_lap': float(sim.last_lap_time[sim.laps > 0].min()) if (sim.laps > 0).any() else None,
+        'off_track_share': float(sim.off_track_ticks.sum() / car_steps),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Closed-loop driver benchmark on a vectorized kinematic simulator.')
+    parser.add_argument('--cars', action='store', type=int, dest='cars', default=1000,
+                        help='Cars simulated in parallel (default: 1000)')
+    parser.add_argument('--steps', action='store', type=int, dest='steps', default=2000,
+                        help='Ticks of 20 ms to simulate (default: 2000)')
+    parser.add_argument('--track', action='store', dest='track', default='circuit', choices=list(TRACKS),
+                        help='Track layout (default: circuit)')
+    parser.add_argument('--width', action='store', type=float, dest='width', default=12.0,
+                        help='Track width in metres (default: 12)')
+    parser.add_argument('--policy', action='store', dest='policy', default='model', choices=['model', 'fallback', 'driver'],
+                        help='model: batched NN over all cars; fallback: batched no-model driver; '
+                             'driver: one Driver.drive() per car (default: model)')
+    parser.add_argument('--stage', action='store', type=int, dest='stage', default=3,
+                        help='Stage passed to the Driver (default: 3)')
+    parser.add_argument('--seed', action='store', type=int, dest='seed', default=0,
+                        help='Seed for the start positions (default: 0)')
+    arguments = parser.parse_args()
+
+    import driver
+    import modelBundle
+
+    sim = KinematicSim(Track(TRACKS[arguments.track], arguments.width), arguments.cars, arguments.seed)
+    if arguments.policy == 'model':
+        d = driver.Driver(arguments.stage)
+        if d.nn_model is None:
+            raise SystemExit("The driver could not load its model/scaler; use --policy driver for the fallback.")
+        policy = model_policy(d)
+    elif arguments.policy == 'fallback':
+        policy = fallback_policy(arguments.cars)
+    else:
+        # All Drivers share one copy of the weights
+        try:
+            arrays = modelBundle.load_bundle('torcs_mlp_model.pth', 'scaler_multi_output.pkl')
+        except Exception as e:
+            print(f"Could not load the model ({e}), the drivers will use their fallback.")
+            arrays = None
+        policy = drive_policy([driver.Driver(arguments.stage, model_bundle=arrays) for _ in range(arguments.cars)])
+
+    stats = run(sim, policy, arguments.steps)
+    print('*********************************************')
+    print(f"{stats['cars']} cars x {stats['steps']} ticks on '{arguments.track}' ({sim.track.length:.0f} m) "
+          f"in {stats['wall_seconds']:.2f}s")
+    print(f"  {stats['car_steps_per_second']:,.0f} car-steps/s, {stats['realtime_factor']:,.0f}x real time "
+          f"({stats['policy_share']:.0%} of the time in the policy)")
+    best = f"{stats['best_lap']:.2f}s" if stats['best_lap'] is not None else 'n/a'
+    print(f"  mean distance {stats['mean_distance']:.0f} m, mean speed {stats['mean_speed_kmh']:.1f} km/h, "
+          f"{stats['laps']} laps, best lap {best}, off track {stats['off_track_share']:.1%} of ticks")
+    print('*********************************************')
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+'''
+Lap, sector and braking-zone index of recorded episodes.
+
+While pyclient.py --collectData records a race, IndexedWriter feeds every
+row to a LapIndexer and, when the file is closed, writes a sidecar
+<recording>.index.json that lists row ranges ([start, stop) data-row
+offsets into the recording):
+
+  laps     - one per lap; a new lap starts when curLapTime resets (lap 0 is
+             the run-up to the first crossing of the line), with the lap
+             time taken from lastLapTime
+  sectors  - distFromStart ranges per track, from a sector file
+             ({"<track>": [["<name>", start_m, end_m], ...]}) or fixed
+             DEFAULT_SECTOR_LENGTH slices named S1, S2, ...
+  braking  - runs of brake >= BRAKE_THRESHOLD with the entry speed
+  episodes - one per race when several races share one recording
+             (pyclient.py --singleFile); every segment carries its episode
+
+Queries read only the indexed slices: .tlm chunks outside a slice are
+skipped, CSV rows before it are skipped without parsing. For example,
+every braking zone on one track:
+
+    python lapIndex.py query collected_data --track g-track-1 --kind braking
+
+Recordings made before the index existed can be indexed afterwards:
+
+    python lapIndex.py build collected_data/*.csv --track g-track-1
+'''
+import argparse
+import glob
+import json
+import os
+import re
+
+import numpy as np
+
+import telemetrySchema
+
+DEFAULT_SECTOR_LENGTH = 500.0 # m, used for tracks without a sector definition
+BRAKE_THRESHOLD = 0.1
+MIN_BRAKING_ROWS = 5           # Shorter brake taps are not indexed (5 rows = 0.1 s)
+INDEX_SUFFIX = '.index.json'
+
+
+def load_sectors(path: str | None) -> dict:
+    '''Per-track sector definitions: {track: [(name, start_m, end_m), ...]}'''
+    if not path:
+        return {}
+    with open(path) as f:
+        return {track: [tuple(sector) for sector in sectors] for track, sectors in json.load(f).items()}
+
+
+def track_of(path: str) -> str:
+    '''Track name from a pyclient.py recording name (race_<track>_episode<n>_<ts>.csv/.tlm), else the file stem'''
+    stem = os.path.splitext(os.path.basename(path))[0]
+    m = re.match(r'^race_(.+)_episode\d+_\d{8}_\d{6}$', stem)
+    return m.group(1) if m else stem
+
+
+def index_path(recording: str) -> str:
+    return recording + INDEX_SUFFIX
+
+
+class LapIndexer(object):
+    '''
+    Incremental segmentation of recorded rows into laps, sectors and braking zones
+    '''
+
+    def __init__(self, track: str, sectors: list[tuple] | None = None):
+        '''Constructor'''
+        self.track = track
+        self.sectors = sectors
+        self.rows = 0
+        self.laps = []
+        self.sector_segments = []
+        self.braking = []
+        self.episodes = []
+        self.episode = 0
+        self.episode_start = 0
+        self.begin(0)
+
+    def begin(self, row: int):
+        '''Lap/sector/braking tracking from row on, as at the start of a race'''
+        self.lap = 0
+        self.lap_start = row
+        self.lap_dist = None
+        self.sector = None
+        self.sector_start = row
+        self.brake_start = None
+        self.brake_speed = None
+        self.last_cur_lap_time = None
+        self.last_dist_raced = None
+
+    def sector_of(self, dist_from_start: float) -> str | None:
+        if self.sectors is None:
+            return f'S{int(dist_from_start // DEFAULT_SECTOR_LENGTH) + 1}'
+        for name, start, end in self.sectors:
+            if start <= dist_from_start < end:
+                return name
+        return None
+
+    def add(self, dist_from_start, cur_lap_time, last_lap_time, dist_raced, brake, speed):
+        '''Index the next recorded row (None = sensor missing in that row)'''
+        row = self.rows
+        if cur_lap_time is not None:
+            if self.last_cur_lap_time is not None and cur_lap_time < self.last_cur_lap_time:
+                # The lap timer restarted: the car crossed the line
+                self.close_sector(row)
+                self.close_lap(row, last_lap_time)
+                self.lap += 1
+                self.lap_start = row
+                self.lap_dist = dist_raced
+            self.last_cur_lap_time = cur_lap_time
+        if self.lap_dist is None:
+            self.lap_dist = dist_raced
+
+        if dist_from_start is not None:
+            sector = self.sector_of(dist_from_start)
+            if sector != self.sector:
+                self.close_sector(row)
+                self.sector, self.sector_start = sector, row
+
+        if brake is not None and brake >= BRAKE_THRESHOLD:
+            if self.brake_start is None:
+                self.brake_start, self.brake_speed = row, speed
+        elif self.brake_start is not None:
+            self.close_braking(row)
+
+        if dist_raced is not None:
+            self.last_dist_raced = dist_raced
+        self.rows += 1
+
+    def close_lap(self, row: int, lap_time):
+        if row > self.lap_start:
+            distance = None if self.lap_dist is None or self.last_dist_raced is None \
+                else self.last_dist_raced - self.lap_dist
+            self.laps.append({'episode': self.episode, 'lap': self.lap, 'start': self.lap_start, 'stop': row,
+                              'time': lap_time if lap_time else None, 'distance': distance})
+
+    def close_sector(self, row: int):
+        if self.sector is not None and row > self.sector_start:
+            self.sector_segments.append({'episode': self.episode, 'sector': self.sector, 'lap': self.lap,
+                                         'start': self.sector_start, 'stop': row})
+        self.sector_start = row
+
+    def close_braking(self, row: int):
+        if row - self.brake_start >= MIN_BRAKING_ROWS:
+            self.braking.append({'episode': self.episode, 'lap': self.lap, 'sector': self.sector, 'start': self.brake_start, 'stop': row,
+                                 'entry_speed': self.brake_speed})
+        self.brake_start = None
+
+    def close_episode(self):
+        '''Close the open segments (the last lap of an episode has no lap time)'''
+        row = self.rows
+        self.close_sector(row)
+        self.close_lap(row, None)
+        if self.brake_start is not None:
+            self.close_braking(row)
+        self.sector = None
+        if row > self.episode_start:
+            self.episodes.append({'episode': self.episode, 'start': self.episode_start, 'stop': row})
+
+    def start_episode(self):
+        '''A new race continues in the same recording'''
+        self.close_episode()
+        self.episode += 1
+        self.episode_start = self.rows
+        self.begin(self.rows)
+
+    def finish(self) -> dict:
+        '''Close the open segments and return the index'''
+        self.close_episode()
+        return {'track': self.track, 'rows': self.rows, 'episodes': self.episodes, 'laps': self.laps,
+                'sectors': self.sector_segments, 'braking': self.braking}
+
+
+class IndexedWriter(object):
+    '''
+    Recorder wrapper: forwards rows to the CSV/.tlm writer and indexes them on the way
+    '''
+
+    FIELDS = ('distFromStart', 'curLapTime', 'lastLapTime', 'distRaced', 'brake', 'speedX')
+
+    def __init__(self, writer, data_file, header: list[str], path: str, track: str, sectors: list[tuple] | None = None):
+        '''Constructor'''
+        self.writer = writer
+        self.data_file = data_file
+        self.path = path
+        self.positions = [header.index(field) for field in self.FIELDS]
+        self.indexer = LapIndexer(track, sectors)
+        self.closed = False
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        self.indexer.add(*(row[i] for i in self.positions))
+
+    def start_episode(self):
+        self.indexer.start_episode()
+
+    def close(self):
+        '''Close the recording, then write its index next to it'''
+        if self.closed:
+            return
+        self.closed = True
+        self.data_file.close()
+        index = self.indexer.finish()
+        index['file'] = os.path.basename(self.path)
+        with open(index_path(self.path), 'w') as f:
+            json.dump(index, f, indent=1)
+        print(f"Wrote index {index_path(self.path)}: {len(index['laps'])} laps, "
+              f"{len(index['sectors'])} sector passes, {len(index['braking'])} braking zones")
+
+
+def build_index(path: str, track: str | None = None, sectors: dict | None = None) -> dict:
+    '''Index an existing recording (for files recorded before indexing)'''
+    track = track or track_of(path)
+    _, columns = telemetrySchema.read_table(path)
+    indexer = LapIndexer(track, (sectors or {}).get(track))
+    n = len(next(iter(columns.values())))
+    fields = [columns[field] if field in columns else np.full(n, np.nan, dtype=np.float32)
+              for field in IndexedWriter.FIELDS]
+    for values in zip(*(field.tolist() for field in fields)):
+        indexer.add(*(None if v != v else v for v in values)) # NaN = missing
+    index = indexer.finish()
+    index['file'] = os.path.basename(path)
+    with open(index_path(path), 'w') as f:
+        json.dump(index, f, indent=1)
+    return index
+
+
+def load_indexes(paths: list[str]) -> list[tuple[str, dict]]:
+    '''(recording path, index) for index files, recordings with an index, or directories of them'''
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = sorted(glob.glob(os.path.join(path, '*' + INDEX_SUFFIX)))
+        else:
+            candidates = [path if path.endswith(INDEX_SUFFIX) else index_path(path)]
+        for candidate in candidates:
+            with open(candidate) as f:
+                index = json.load(f)
+            result.append((os.path.join(os.path.dirname(candidate), index['file']), index))
+    return result
+
+
+def query(indexes: list[tuple[str, dict]], kind: str = 'laps', track: str | None = None, lap: int | None = None,
+          sector: str | None = None, episode: int | None = None) -> list[tuple[str, dict]]:
+    '''(recording, segment) pairs of one kind ('laps', 'sectors', 'braking' or 'episodes') matching the filters'''
+    result = []
+    for recording, index in indexes:
+        if track is not None and index['track'] != track:
+            continue
+        for segment in index.get(kind, []):
+            if episode is not None and segment.get('episode', 0) != episode:
+                continue
+            if lap is not None and segment.get('lap') != lap:
+                continue
+            if sector is not None and segment.get('sector') != sector:
+                continue
+            result.append((recording, segment))
+    return result
+
+
+def read_segment(recording: str, start: int, stop: int, columns: list[str] | None = None) -> dict[str, np.ndarray]:
+    '''Rows [start, stop) of a recording as float32 arrays, without reading the rest of the file'''
+    if recording.endswith('.tlm'):
+        import telemetryCodec
+
+        return telemetryCodec.read_rows(recording, start, stop, columns)
+    import pandas as pd
+
+    frame = pd.read_csv(recording, skiprows=range(1, start + 1), nrows=stop - start)
+    frame.columns = frame.columns.str.strip()
+    return {col: frame[col].to_numpy(dtype=np.float32) for col in (columns or frame.columns)}
+
+
+def gather(segments: list[tuple[str, dict]], columns: list[str] | None = None) -> dict[str, np.ndarray]:
+    '''Concatenate the rows of all segments, e.g. every braking zone of a track for training'''
+    parts = [read_segment(recording, segment['start'], segment['stop'], columns) for recording, segment in segments]
+    if not parts:
+        return {}
+    return {col: np.concatenate([part[col] for part in parts]) for col in parts[0]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or query the lap/sector/braking index of recordings.')
+    parser.add_argument('command', choices=['build', 'query'], help='build: index existing recordings; query: list segments')
+    parser.add_argument('paths', nargs='+', help='Recordings (.csv/.tlm), their index files, or directories')
+    parser.add_argument('--track', action='store', dest='track', default=None,
+                        help='Track name (build: override the name in the file name; query: filter)')
+    parser.add_argument('--sectorFile', action='store', dest='sector_file', default=None,
+                        help=f'JSON sector definitions per track (default: {DEFAULT_SECTOR_LENGTH:.0f} m slices)')
+    parser.add_argument('--kind', action='store', dest='kind', default='laps',
+                        choices=['laps', 'sectors', 'braking', 'episodes'],
+                        help='Segment kind to query (default: laps)')
+    parser.add_argument('--episode', action='store', type=int, dest='episode', default=None,
+                        help='Only this episode of a --singleFile recording')
+    parser.add_argument('--lap', action='store', type=int, dest='lap', default=None, help='Only this lap')
+    parser.add_argument('--sector', action='store', dest='sector', default=None, help='Only this sector')
+    parser.add_argument('--out', action='store', dest='out', default=None,
+                        help='Write the rows of the matching segments to this CSV')
+    arguments = parser.parse_args()
+
+    if arguments.command == 'build':
+        sectors = load_sectors(arguments.sector_file)
+        for path in arguments.paths:
+            index = build_index(path, arguments.track, sectors)
+            print(f"{index_path(path)}: {index['rows']} rows, {len(index['laps'])} laps, "
+                  f"{len(index['sectors'])} sector passes, {len(index['braking'])} braking zones")
+    else:
+        segments = query(load_indexes(arguments.paths), arguments.kind, arguments.track, arguments.lap, arguments.sector,
+                         arguments.episode)
+        for recording, segment in segments:
+            details = '  '.join(f"{key}={value}" for key, value in segment.items() if key not in ('start', 'stop'))
+            print(f"{os.path.basename(recording)} rows {segment['start']}-{segment['stop']}  {details}")
+        print(f"{len(segments)} {arguments.kind} segments, {sum(s['stop'] - s['start'] for _, s in segments)} rows")
+        if arguments.out and segments:
+            import pandas as pd
+
+            pd.DataFrame(gather(segments)).to_csv(arguments.out, index=False)
+            print(f"Wrote {arguments.out}")
@@ -0,0 +1,66 @@
+'''
+Latency bookkeeping for the client loops and benchmarks.
+
+Samples are kept in a preallocated ring so recording on the hot path
+does not allocate.
+'''
+from array import array
+import math
+
+
+class LatencyRecorder(object):
+    '''
+    Fixed-capacity ring of latency samples (in seconds) with percentile summaries
+    '''
+
+    def __init__(self, capacity: int = 100000):
+        '''Constructor'''
+        self.capacity = capacity
+        self.samples = array('d', bytes(8 * capacity))
+        self.count = 0 # Total samples ever recorded (may exceed capacity)
+
+    def add(self, seconds: float):
+        '''Record one sample, overwriting the oldest once the ring is full'''
+        self.samples[self.count % self.capacity] = seconds
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+
+    def values(self) -> list[float]:
+        '''Return the retained samples, sorted'''
+        n = min(self.count, self.capacity)
+        return sorted(self.samples[:n])
+
+    def percentile(self, p: float, ordered: list[float] | None = None) -> float | None:
+        '''Nearest-rank percentile, p in [0, 100]'''
+        if ordered is None:
+            ordered = self.values()
+        if not ordered:
+            return None
+        rank = max(1, int(math.ceil(p / 100.0 * len(ordered))))
+        return ordered[rank - 1]
+
+    def summary(self) -> dict:
+        '''Return count/mean/p50/p90/p99/p999/max, times in milliseconds'''
+        ordered = self.values()
+        if not ordered:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': sum(ordered) / len(ordered) * 1e3,
+            'p50_ms': self.percentile(50, ordered) * 1e3,
+            'p90_ms': self.percentile(90, ordered) * 1e3,
+            'p99_ms': self.percentile(99, ordered) * 1e3,
+            'p999_ms': self.percentile(99.9, ordered) * 1e3,
+            'max_ms': ordered[-1] * 1e3,
+        }
+
+    def format(self, name: str) -> str:
+        '''One-line human readable summary'''
+        s = self.summary()
+        if s['count'] == 0:
+            return f"{name:<24} no samples"
+        return (f"{name:<24} n={s['count']:<7} mean={s['mean_ms']:.3f}ms "
+                f"p50={s['p50_ms']:.3f}ms p90={s['p90_ms']:.3f}ms "
+                f"p99={s['p99_ms']:.3f}ms p99.9={s['p999_ms']:.3f}ms max={s['max_ms']:.3f}ms")
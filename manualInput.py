@@ -0,0 +1,256 @@
+'''
+Event-driven manual input for data collection.
+
+Input sources (keyboard, evdev gamepads/wheels) run on their own threads
+and turn every event into a new immutable InputSnapshot, stamped with the
+event's time on the perf_counter clock. Publishing is a single reference
+store (atomic under the GIL), so Driver.drive reads one consistent
+snapshot per sensor frame without taking a lock; accel, brake, steer and
+gear can never come from different events. Writers serialise on a lock,
+since two sources may fire at once.
+
+The first packet that carries a new snapshot closes the loop: the time
+from the event to that send is recorded as input-to-packet latency. It
+includes the wait for the next sensor frame, because that is when the
+server sees the input.
+
+The evdev source reads /dev/input directly and needs no X display, so
+collection also works over SSH or on a headless box with a pad attached
+(pip install evdev; the user needs read access to the device).
+'''
+import collections
+import threading
+import time
+
+import latencyStats
+
+InputSnapshot = collections.namedtuple('InputSnapshot', 'accel brake steer gear seq event_ns')
+
+GEAR_DEBOUNCE_NS = 200_000_000 # Repeated gear up/down events closer than this are ignored
+
+
+class ManualInput(object):
+    '''
+    Human control state shared by the input sources; the driver reads snapshot
+    '''
+
+    def __init__(self):
+        '''Constructor'''
+        self.lock = threading.Lock() # Writers only
+        self.sources = []
+        self.latency = latencyStats.LatencyRecorder()
+        self.reset()
+
+    def reset(self):
+        '''Neutral controls, first gear, nothing held'''
+        with self.lock:
+            self.pressed = set()  # Held digital controls: 'up', 'down', 'left', 'right'
+            self.axes = {}        # Analog accel/brake/steer, already in control units
+            self.gear = 1
+            self.last_shift_ns = 0
+            self.taken_seq = 0
+            self.pending_ns = None
+            self.snapshot = InputSnapshot(0.0, 0.0, 0.0, 1, 0, time.perf_counter_ns())
+
+    def publish(self, event_ns: int):
+        '''Build the snapshot for the current state (caller holds the lock)'''
+        if 'up' in self.pressed:
+            accel, brake = 1.0, 0.0
+        elif 'down' in self.pressed:
+            accel, brake = 0.0, 1.0
+        else:
+            accel, brake = self.axes.get('accel', 0.0), self.axes.get('brake', 0.0)
+        if 'left' in self.pressed and 'right' not in self.pressed:
+            steer = 1.0
+        elif 'right' in self.pressed and 'left' not in self.pressed:
+            steer = -1.0
+        else:
+            steer = self.axes.get('steer', 0.0)
+        self.snapshot = InputSnapshot(accel, brake, steer, self.gear, self.snapshot.seq + 1, event_ns)
+
+    def press(self, name: str, event_ns: int):
+        with self.lock:
+            if name not in self.pressed:
+                self.pressed.add(name)
+                self.publish(event_ns)
+
+    def release(self, name: str, event_ns: int):
+        with self.lock:
+            if name in self.pressed:
+                self.pressed.discard(name)
+                self.publish(event_ns)
+
+    def set_axis(self, name: str, value: float, event_ns: int):
+        with self.lock:
+            if self.axes.get(name) != value:
+                self.axes[name] = value
+                self.publish(event_ns)
+
+    def shift(self, action: str, event_ns: int):
+        '''Gear 'up' (max 6), 'down' (min neutral) or 'reverse'; debounced on the event timestamps'''
+        with self.lock:
+            if action in ('up', 'down') and event_ns - self.last_shift_ns < GEAR_DEBOUNCE_NS:
+                return
+            self.last_shift_ns = event_ns
+            if action == 'up':
+                gear = min(6, self.gear + 1)
+            elif action == 'down':
+                gear = max(0, self.gear - 1)
+            else:
+                gear = -1
+            if gear != self.gear:
+                self.gear = gear
+                self.publish(event_ns)
+
+    def take(self) -> InputSnapshot:
+        '''The snapshot for this frame (one lock-free read); a new one arms the latency measurement'''
+        snapshot = self.snapshot
+        if snapshot.seq != self.taken_seq:
+            self.taken_seq = snapshot.seq
+            self.pending_ns = snapshot.event_ns
+        return snapshot
+
+    def sent(self, now_ns: int | None = None):
+        '''Called after the reply went out: records event-to-packet latency for a new snapshot'''
+        if self.pending_ns is not None:
+            self.latency.add(((now_ns or time.perf_counter_ns()) - self.pending_ns) * 1e-9)
+            self.pending_ns = None
+
+    def add_source(self, source):
+        self.sources.append(source)
+        source.start()
+
+    def stop(self):
+        for source in self.sources:
+            source.stop()
+        self.sources = []
+
+
+class KeyboardSource(object):
+    '''
+    pynput keyboard: arrows drive, 'a'/'z' shift down/up, 'r' selects reverse (needs a display)
+    '''
+
+    SHIFTS = {'a': 'down', 'z': 'up', 'r': 'reverse'}
+
+    def __init__(self, manual: ManualInput):
+        '''Constructor'''
+        try:
+            from pynput import keyboard # Imported here so the driver itself runs headless
+        except ImportError as e:
+            raise ImportError(f"Keyboard input is unavailable ({e}); use --input evdev or none without a display")
+
+        self.manual = manual
+        # Looked up by the Key enum directly; nothing is allocated per event
+        self.arrows = {keyboard.Key.up: 'up', keyboard.Key.down: 'down',
+                       keyboard.Key.left: 'left', keyboard.Key.right: 'right'}
+        self.listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
+
+    def on_press(self, key):
+        now = time.perf_counter_ns()
+        char = getattr(key, 'char', None)
+        if char:
+            action = self.SHIFTS.get(char.lower())
+            if action:
+                self.manual.shift(action, now)
+            return
+        name = self.arrows.get(key)
+        if name:
+            self.manual.press(name, now)
+
+    def on_release(self, key):
+        name = self.arrows.get(key)
+        if name:
+            self.manual.release(name, time.perf_counter_ns())
+
+    def start(self):
+        print("ManualInput: keyboard (arrow keys drive, 'a' gear down, 'z' gear up, 'r' reverse)")
+        self.listener.start()
+
+    def stop(self):
+        self.listener.stop()
+
+
+class EvdevSource(threading.Thread):
+    '''
+    Gamepad, joystick or wheel through Linux evdev (no X display needed)
+    '''
+
+    # Absolute axes -> control; triggers and pedals map to 0..1, the stick/wheel to -1..1
+    AXES = {'ABS_X': 'steer', 'ABS_WHEEL': 'steer', 'ABS_RZ': 'accel', 'ABS_GAS': 'accel',
+            'ABS_Z': 'brake', 'ABS_BRAKE': 'brake'}
+    BUTTONS = {'BTN_TR': 'up', 'BTN_TL': 'down', 'BTN_NORTH': 'reverse',
+               'BTN_GEAR_UP': 'up', 'BTN_GEAR_DOWN': 'down'}
+    STEER_DEADZONE = 0.05
+
+    def __init__(self, manual: ManualInput, device_path: str | None = None):
+        '''Constructor'''
+        super(EvdevSource, self).__init__(name='evdev-input', daemon=True)
+        try:
+            import evdev
+        except ImportError:
+            raise ImportError("The evdev input needs the evdev package (pip install evdev)")
+        self.evdev = evdev
+        self.manual = manual
+        self.device = evdev.InputDevice(device_path) if device_path else self.find_device()
+        # Per axis code: (control, offset, scale) so one multiply-add normalises a raw value
+        self.axes = {}
+        for code, info in self.device.capabilities(absinfo=True).get(evdev.ecodes.EV_ABS, []):
+            name = evdev.ecodes.ABS.get(code)
+            control = self.AXES.get(name) if isinstance(name, str) else None
+            if control is None or info.max == info.min:
+                continue
+            if control == 'steer':
+                # Centre to -1..1; the stick reports left as negative, SCR steer is positive to the left
+                self.axes[code] = (control, (info.max + info.min) / 2.0, -2.0 / (info.max - info.min))
+            else:
+                self.axes[code] = (control, float(info.min), 1.0 / (info.max - info.min))
+        self.buttons = {code: action for name, action in self.BUTTONS.items()
+                        if (code := evdev.ecodes.ecodes.get(name)) is not None}
+
+    def find_device(self):
+        '''First input device with a steering axis'''
+        evdev = self.evdev
+        for path in evdev.list_devices():
+            device = evdev.InputDevice(path)
+            codes = [code for code, _ in device.capabilities(absinfo=True).get(evdev.ecodes.EV_ABS, [])]
+            if evdev.ecodes.ABS_X in codes or evdev.ecodes.ABS_WHEEL in codes:
+                return device
+        raise IOError("No evdev joystick/gamepad/wheel found (check permissions on /dev/input)")
+
+    def run(self):
+        ecodes = self.evdev.ecodes
+        try:
+            for event in self.device.read_loop():
+                # Kernel timestamps are wall-clock; shift them onto the perf_counter clock
+                age_ns = time.time_ns() - (event.sec * 1_000_000_000 + event.usec * 1000)
+                event_ns = time.perf_counter_ns() - max(0, age_ns)
+                if event.type == ecodes.EV_ABS and event.code in self.axes:
+                    control, offset, scale = self.axes[event.code]
+                    value = (event.value - offset) * scale
+                    if control == 'steer':
+                        value = 0.0 if abs(value) < self.STEER_DEADZONE else max(-1.0, min(1.0, value))
+                    else:
+                        value = max(0.0, min(1.0, value))
+                    self.manual.set_axis(control, value, event_ns)
+                elif event.type == ecodes.EV_KEY and event.value == 1 and event.code in self.buttons:
+                    self.manual.shift(self.buttons[event.code], event_ns)
+        except OSError:
+            pass # Device closed by stop() or unplugged
+
+    def start(self):
+        print(f"ManualInput: evdev device {self.device.path} ({self.device.name})")
+        super(EvdevSource, self).start()
+
+    def stop(self):
+        self.device.close()
+
+
+def open_input(kind: str = 'keyboard', device_path: str | None = None) -> ManualInput:
+    '''ManualInput with its source started: 'keyboard', 'evdev' or 'none' (neutral controls)'''
+    manual = ManualInput()
+    if kind == 'keyboard':
+        manual.add_source(KeyboardSource(manual))
+    elif kind == 'evdev':
+        manual.add_source(EvdevSource(manual, device_path))
+    return manual
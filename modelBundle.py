@@ -0,0 +1,156 @@
+'''
+Model and scaler weights as plain NumPy arrays.
+
+A "bundle" is a dict of arrays: the MLP state_dict tensors under their
+usual names ('model.0.weight', ...) plus the feature scaler folded into
+two vectors, 'scaler.mul' and 'scaler.add', so that
+
+    scaled = features * scaler.mul + scaler.add
+
+for both StandardScaler and MinMaxScaler. Bundles can be placed in one
+multiprocessing.shared_memory block (SharedBundle) so many driver
+processes run from a single copy of the weights.
+'''
+import re
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import telemetrySchema
+
+# Offsets of arrays inside a shared block are aligned to a cache line
+ALIGNMENT = 64
+
+_LINEAR_WEIGHT = re.compile(r'^model\.(\d+)\.weight$')
+
+
+def scaler_arrays(scaler) -> dict[str, np.ndarray]:
+    '''Fold a fitted sklearn StandardScaler or MinMaxScaler into mul/add vectors'''
+    if hasattr(scaler, 'mean_') or hasattr(scaler, 'with_mean'):
+        n = scaler.n_features_in_
+        mean = scaler.mean_ if getattr(scaler, 'mean_', None) is not None else np.zeros(n)
+        scale = scaler.scale_ if getattr(scaler, 'scale_', None) is not None else np.ones(n)
+        mul = 1.0 / np.asarray(scale, dtype=np.float64)
+        add = -np.asarray(mean, dtype=np.float64) * mul
+    elif hasattr(scaler, 'min_'):
+        mul = np.asarray(scaler.scale_, dtype=np.float64)
+        add = np.asarray(scaler.min_, dtype=np.float64)
+    else:
+        raise TypeError(f"Unsupported scaler type: {type(scaler).__name__}")
+    arrays = {'scaler.mul': mul, 'scaler.add': add}
+    names = getattr(scaler, 'feature_names_in_', None)
+    if names is not None:
+        # Kept with the weights so the feature order travels with the bundle
+        arrays['scaler.feature_names'] = np.array([str(name) for name in names])
+    return arrays
+
+
+def load_bundle(model_filename: str, scaler_filename: str) -> dict[str, np.ndarray]:
+    '''Load a torch state_dict and a joblib scaler into a bundle'''
+    import joblib
+    import torch
+
+    state_dict = torch.load(model_filename, map_location='cpu')
+    arrays = {name: tensor.detach().cpu().numpy().astype(np.float32) for name, tensor in state_dict.items()}
+    arrays.update(scaler_arrays(joblib.load(scaler_filename)))
+    return arrays
+
+
+def mlp_dims(arrays: dict[str, np.ndarray]) -> tuple[int, tuple[int, ...], int]:
+    '''Return (input_dim, hidden sizes, output_dim) of the MLP stored in a bundle'''
+    layers = sorted(int(m.group(1)) for m in map(_LINEAR_WEIGHT.match, arrays) if m)
+    if not layers:
+        raise ValueError("Bundle has no 'model.<i>.weight' arrays")
+    shapes = [arrays[f'model.{i}.weight'].shape for i in layers]
+    hidden = tuple(shape[0] for shape in shapes[:-1])
+    return shapes[0][1], hidden, shapes[-1][0]
+
+
+def forward(arrays: dict[str, np.ndarray], X: np.ndarray) -> np.ndarray:
+    '''Reference NumPy forward pass (scaler + MLP) over a (batch, features) array'''
+    layers = sorted(int(m.group(1)) for m in map(_LINEAR_WEIGHT.match, arrays) if m)
+    h = X * arrays['scaler.mul'] + arrays['scaler.add']
+    for k, i in enumerate(layers):
+        h = h @ arrays[f'model.{i}.weight'].T + arrays[f'model.{i}.bias']
+        if k < len(layers) - 1:
+            h = np.maximum(h, 0.0)
+    return h
+
+
+def bundle_schema(arrays: dict[str, np.ndarray], feature_set: str = 'raw') -> telemetrySchema.TelemetrySchema:
+    '''Telemetry schema matching a bundle's feature names (default layout of feature_set if it has none)'''
+    names = arrays.get('scaler.feature_names')
+    if names is None:
+        return telemetrySchema.TelemetrySchema(feature_set=feature_set)
+    return telemetrySchema.TelemetrySchema.from_feature_names(names.tolist())
+
+
+class ArrayScaler(object):
+    '''
+    Drop-in replacement for the sklearn scaler's transform() built from a bundle
+    '''
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        '''Constructor'''
+        self.mul = arrays['scaler.mul']
+        self.add = arrays['scaler.add']
+        self.n_features_in_ = self.mul.shape[0]
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return X * self.mul + self.add
+
+
+class SharedBundle(object):
+    '''
+    A bundle stored in a single shared memory block.
+
+    The creating process calls create(); workers receive spec() (picklable)
+    and call attach(*spec) to get zero-copy array views.
+    '''
+
+    def __init__(self, shm: shared_memory.SharedMemory, layout: dict, owner: bool):
+        '''Constructor'''
+        self.shm = shm
+        self.layout = layout # name -> (offset, shape, dtype string)
+        self.owner = owner
+
+    @classmethod
+    def create(cls, arrays: dict[str, np.ndarray]) -> 'SharedBundle':
+        layout = {}
+        offset = 0
+        for name, arr in arrays.items():
+            offset = (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+            layout[name] = (offset, arr.shape, arr.dtype.str)
+            offset += arr.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        bundle = cls(shm, layout, owner=True)
+        for name, view in bundle.arrays().items():
+            view[...] = arrays[name]
+        return bundle
+
+    @classmethod
+    def attach(cls, name: str, layout: dict) -> 'SharedBundle':
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            # Older Pythons register attached blocks too and unlink them when the worker exits
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, layout, owner=False)
+
+    def spec(self) -> tuple[str, dict]:
+        return self.shm.name, self.layout
+
+    def nbytes(self) -> int:
+        return self.shm.size
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        '''Zero-copy NumPy views of every array in the block'''
+        return {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.shm.buf, offset=offset)
+                for name, (offset, shape, dtype) in self.layout.items()}
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+'''
+Per-track and per-stage model routing.
+
+A registry file maps tracks and race stages to model/scaler pairs:
+
+    {
+      "default": {"model": "torcs_mlp_model.pth", "scaler": "scaler_multi_output.pkl"},
+      "tracks": {"g-speedway": {"model": "speedway.pth", "scaler": "speedway.pkl"}},
+      "stages": {"2": {"model": "race.pth", "scaler": "race.pkl"}}
+    }
+
+Relative paths are taken from the registry file's directory. Every bundle
+is loaded, built, loaded into its own inference backend (a clone of the
+driver's: scripted, exported or preallocated as configured) and warmed up
+when the client starts, so picking a model at identification time swaps
+references, with no file load, compile or export. Routing is by track first (case-insensitive), then stage,
+then "default"; without a match the first entry is used.
+
+Mixture mode goes further: all MLPs are fused into one network (the
+scalers folded into the first layer, hidden layers block-diagonal) and
+evaluated in a single batched pass. The driver's output is a weighted sum
+of the per-model outputs; routing only rewrites the weight vector (one-hot
+for the selected model, a plain average when nothing matches and there is
+no default). The fused network costs roughly the sum of the individual
+ones per tick, which for these small MLPs is still one call into torch.
+
+All models of a mixture must take the same features and produce the same
+outputs. Without mixture mode the schemas may differ; the driver adopts
+the selected model's schema on every switch.
+
+Usage:
+    python pyclient.py --track g-speedway --modelRegistry models.json [--mixture]
+    python modelRegistry.py check models.json
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+import driver as driverModule
+import inferenceBackend
+import modelBundle
+import telemetrySchema
+
+
+def load_spec(path: str) -> tuple[dict[str, tuple[str, str]], dict[str, str], dict[str, str], str | None]:
+    '''
+    Parse a registry file into (entries, track routes, stage routes, default entry).
+    Entries are named after their model/scaler pair, so a pair used by several
+    routes is loaded once.
+    '''
+    with open(path) as f:
+        spec = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    entries = {}
+
+    def entry(item, where):
+        if not isinstance(item, dict) or 'model' not in item or 'scaler' not in item:
+            raise ValueError(f"{path}: {where} needs 'model' and 'scaler'")
+        pair = tuple(os.path.join(base, item[key]) for key in ('model', 'scaler'))
+        name = os.path.splitext(os.path.basename(item['model']))[0]
+        while name in entries and entries[name] != pair:
+            name += "'"
+        entries[name] = pair
+        return name
+
+    default = entry(spec['default'], 'default') if 'default' in spec else None
+    tracks = {track.lower(): entry(item, f"track {track}") for track, item in spec.get('tracks', {}).items()}
+    stages = {str(stage): entry(item, f"stage {stage}") for stage, item in spec.get('stages', {}).items()}
+    if not entries:
+        raise ValueError(f"{path}: no models")
+    return entries, tracks, stages, default
+
+
+class MixtureMLP(nn.Module):
+    '''
+    Several scaler+MLP bundles fused into one network; forward() returns the
+    weighted sum of their outputs. Takes raw (unscaled) features.
+    '''
+
+    def __init__(self, bundles: list[dict[str, np.ndarray]]):
+        super(MixtureMLP, self).__init__()
+        per_model = []
+        for arrays in bundles:
+            layers = [(arrays[f'model.{i}.weight'].astype(np.float64), arrays[f'model.{i}.bias'].astype(np.float64))
+                      for i in sorted(int(m.group(1)) for m in map(modelBundle._LINEAR_WEIGHT.match, arrays) if m)]
+            # Fold the scaler in: W (x * mul + add) + b = (W * mul) x + (W add + b)
+            w, b = layers[0]
+            layers[0] = (w * arrays['scaler.mul'], w @ arrays['scaler.add'] + b)
+            per_model.append(layers)
+        self.count = len(bundles)
+        self.output_dim = per_model[0][-1][0].shape[0]
+        depth = max(len(layers) for layers in per_model)
+        for layers in per_model:
+            missing = depth - len(layers)
+            if missing == 0:
+                continue
+            if len(layers) == 1:
+                # No hidden layer: the padding sees the raw inputs, which can be negative, so carry
+                # x as [x, -x] through the ReLUs and read it back as relu(x) - relu(-x)
+                w, b = layers[0]
+                size = w.shape[1]
+                layers[:] = ([(np.vstack([np.eye(size), -np.eye(size)]), np.zeros(2 * size))]
+                             + [(np.eye(2 * size), np.zeros(2 * size))] * (missing - 1)
+                             + [(np.hstack([w, -w]), b)])
+            else:
+                # Identity layers before the output layer (exact, as hidden values are >= 0 after ReLU)
+                size = layers[-1][0].shape[1]
+                layers[-1:-1] = [(np.eye(size), np.zeros(size))] * missing
+
+        modules = []
+        for j in range(depth):
+            blocks = [layers[j] for layers in per_model]
+            if j == 0:
+                weight = np.vstack([w for w, _ in blocks]) # Every model reads the same input
+            else:
+                weight = np.zeros((sum(w.shape[0] for w, _ in blocks), sum(w.shape[1] for w, _ in blocks)))
+                row = col = 0
+                for w, _ in blocks:
+                    weight[row:row + w.shape[0], col:col + w.shape[1]] = w
+                    row, col = row + w.shape[0], col + w.shape[1]
+            linear = nn.Linear(weight.shape[1], weight.shape[0])
+            linear.weight.data = torch.from_numpy(weight.astype(np.float32))
+            linear.bias.data = torch.from_numpy(np.concatenate([b for _, b in blocks]).astype(np.float32))
+            modules.append(linear)
+            if j < depth - 1:
+                modules.append(nn.ReLU())
+        self.model = nn.Sequential(*modules)
+        self.register_buffer('weights', torch.full((self.count,), 1.0 / self.count))
+        self.eval()
+
+    def set_weights(self, weights):
+        self.weights.copy_(torch.as_tensor(weights, dtype=torch.float32))
+
+    def outputs(self, x: torch.Tensor) -> torch.Tensor:
+        '''Every model's outputs: (batch, models, outputs)'''
+        return self.model(x).view(-1, self.count, self.output_dim)
+
+    def forward(self, x):
+        return (self.outputs(x) * self.weights[:, None]).sum(dim=1)
+
+
+class ModelRegistry(object):
+    '''
+    Preloaded models with routing by track and stage
+    '''
+
+    def __init__(self, path: str, feature_set: str = 'raw', mixture: bool = False,
+                 backend: inferenceBackend.InferenceBackend | None = None):
+        '''Constructor: loads, builds and warms up every model in the registry file, each in a clone of backend'''
+        self.path = path
+        self.entries, self.tracks, self.stages, self.default = load_spec(path)
+        self.names = list(self.entries)
+        self.prototype = backend if backend is not None else inferenceBackend.create('torch')
+        self.bundles, self.models, self.schemas, self.backends = {}, {}, {}, {}
+        for name, (model_filename, scaler_filename) in self.entries.items():
+            t0 = time.perf_counter()
+            arrays = modelBundle.load_bundle(model_filename, scaler_filename)
+            schema = modelBundle.bundle_schema(arrays, feature_set)
+            if schema.feature_set != feature_set:
+                raise telemetrySchema.SchemaError(f"{name} uses {schema.feature_set} features, {feature_set} were requested")
+            input_dim, _, output_dim = modelBundle.mlp_dims(arrays)
+            schema.check_model(input_dim, output_dim, arrays['scaler.mul'].shape[0])
+            model, scaler = driverModule.build_model(arrays)
+            self.backends[name] = self.load_backend(model, scaler, input_dim)
+            self.bundles[name], self.models[name], self.schemas[name] = arrays, (model, scaler), schema
+            print(f"ModelRegistry: {name} loaded in {(time.perf_counter() - t0) * 1e3:.1f} ms "
+                  f"({input_dim} features -> {schema.output_names})")
+
+        self.mixture = None
+        if mixture:
+            first = self.schemas[self.names[0]]
+            for name in self.names[1:]:
+                schema = self.schemas[name]
+                if schema.feature_columns != first.feature_columns or schema.output_names != first.output_names:
+                    raise telemetrySchema.SchemaError(f"Mixture needs one feature/output layout; {name} differs from {self.names[0]}")
+            self.mixture = MixtureMLP([self.bundles[name] for name in self.names])
+            n = len(first.feature_columns)
+            # The scalers live in the fused first layer; the driver's transform() is the identity
+            self.identity = modelBundle.ArrayScaler({'scaler.mul': np.ones(n, dtype=np.float32),
+                                                     'scaler.add': np.zeros(n, dtype=np.float32)})
+            # One backend per weight vector: ONNX bakes the weights into its export, the others share the buffer
+            self.mixture_backends = {}
+            for name in self.names + [None]:
+                self.mixture.set_weights(self.mixture_weights(name))
+                self.mixture_backends[name] = self.load_backend(self.mixture, self.identity, n)
+            print(f"ModelRegistry: mixture of {self.mixture.count} models in one pass")
+
+    def load_backend(self, model, scaler, input_dim: int) -> inferenceBackend.InferenceBackend:
+        '''A clone of the prototype backend loaded with model/scaler and warmed up, so first-call costs happen now'''
+        backend = self.prototype.clone()
+        backend.load(model, scaler)
+        backend.predict_one(np.zeros((1, input_dim), dtype=np.float32))
+        return backend
+
+    def mixture_weights(self, name: str | None) -> np.ndarray:
+        '''One-hot for an entry, a plain average for None'''
+        if name is None:
+            return np.full(self.mixture.count, 1.0 / self.mixture.count)
+        return np.eye(self.mixture.count)[self.names.index(name)]
+
+    def select(self, track: str | None, stage: int | None) -> str | None:
+        '''Entry for a track/stage: track route, stage route, default; None if nothing matches'''
+        if track and track.lower() in self.tracks:
+            return self.tracks[track.lower()]
+        if stage is not None and str(stage) in self.stages:
+            return self.stages[str(stage)]
+        return self.default
+
+    def activate(self, driver, track: str | None, stage: int | None) -> str:
+        '''Point the driver at the model for track/stage; returns the version name it now reports'''
+        name = self.select(track, stage)
+        if self.mixture is not None:
+            self.mixture.set_weights(self.mixture_weights(name))
+            model, scaler, schema = self.mixture, self.identity, self.schemas[self.names[0]]
+            backend, version = self.mixture_backends[name], f"mixture:{name or 'average'}"
+        else:
+            name = name or self.names[0]
+            (model, scaler), schema, version = self.models[name], self.schemas[name], name
+            backend = self.backends[name]
+        driver.use_schema(schema)
+        driver.set_model(model, scaler, backend) # Preloaded backend: a reference swap
+        driver.metrics['model_version'] = version
+        return version
+
+
+def check(registry: ModelRegistry, rows: int, seed: int, tolerance: float = 1e-3) -> int:
+    '''Fused mixture vs. each model's NumPy reference forward on random feature rows; returns failures'''
+    rng = np.random.default_rng(seed)
+    failures = 0
+    first = registry.bundles[registry.names[0]]
+    # Rows around the first scaler's training distribution: scaled values ~ N(0, 1)
+    X = ((rng.standard_normal((rows, first['scaler.mul'].shape[0])) - first['scaler.add']) / first['scaler.mul'])
+    X = X.astype(np.float32)
+    with torch.no_grad():
+        fused = registry.mixture.outputs(torch.from_numpy(X)).numpy()
+    for k, name in enumerate(registry.names):
+        expected = modelBundle.forward(registry.bundles[name], X.astype(np.float64))
+        error = float(np.max(np.abs(fused[:, k] - expected) / (1.0 + np.abs(expected))))
+        ok = error <= tolerance
+        failures += not ok
+        print(f"  {name:<24} max relative error {error:.2e} {'OK' if ok else 'MISMATCH'}")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect and check a per-track model registry.')
+    parser.add_argument('command', choices=['list', 'check'], help='list routes, or check the fused mixture and timings')
+    parser.add_argument('registry', help='Registry JSON file')
+    parser.add_argument('--features', action='store', dest='feature_set', default='raw', choices=['raw', 'reduced'],
+                        help='Feature set of models without stored feature names (default: raw)')
+    parser.add_argument('--rows', action='store', type=int, dest='rows', default=2000,
+                        help='Random feature rows for check (default: 2000)')
+    parser.add_argument('--seed', action='store', type=int, dest='seed', default=0,
+                        help='Seed for the random rows (default: 0)')
+    parser.add_argument('--backends', action='store', dest='backends', default=','.join(inferenceBackend.BACKENDS),
+                        help=f"check: comma-separated backends to time switches on (default: {','.join(inferenceBackend.BACKENDS)})")
+    arguments = parser.parse_args()
+
+    registry = ModelRegistry(arguments.registry, arguments.feature_set, mixture=(arguments.command == 'check'))
+    print(f"default: {registry.default}")
+    for track, name in registry.tracks.items():
+        print(f"track {track}: {name}")
+    for stage, name in registry.stages.items():
+        print(f"stage {stage}: {name}")
+    if arguments.command == 'check':
+        failures = check(registry, arguments.rows, arguments.seed)
+
+        # Per-tick cost of one model vs. the fused mixture, and the cost of a switch
+        x = torch.from_numpy(np.zeros((1, registry.identity.n_features_in_), dtype=np.float32))
+        model = registry.models[registry.names[0]][0]
+        with torch.no_grad():
+            for label, net in (('single model', model), ('fused mixture', registry.mixture)):
+                t0 = time.perf_counter()
+                for _ in range(2000):
+                    net(x)
+                print(f"{label:<14} {(time.perf_counter() - t0) / 2000 * 1e6:.1f} us/tick")
+        # Switch cost on a real Driver, per backend, with and without the mixture
+        routes = [(track, None) for track in registry.tracks] + [(None, None), ('unrouted', 99)]
+        switches = []
+        for name in arguments.backends.split(','):
+            for fused in (False, True):
+                try:
+                    routed = ModelRegistry(arguments.registry, arguments.feature_set, mixture=fused,
+                                           backend=inferenceBackend.create(name))
+                except Exception as e:
+                    print(f"{name:<12} unavailable: {e}")
+                    break
+                d = driverModule.Driver(3, model_registry=routed)
+                t0 = time.perf_counter()
+                for i in range(1000):
+                    routed.activate(d, *routes[i % len(routes)])
+                switches.append((name, 'mixture' if fused else 'models', (time.perf_counter() - t0) / 1000 * 1e6))
+        for name, mode, us in switches:
+            print(f"switch {name:<12} {mode:<8} {us:.1f} us")
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,148 @@
+'''
+Hot reload of the driver's model and scaler.
+
+ModelWatcher polls the mtime/size of the model and scaler files on a
+background thread. When both have changed and stopped changing, the new
+artifacts are loaded, validated and smoke-tested off the hot path:
+
+  * layer shapes and the scaler's feature names must match the driver's
+    compiled TelemetrySchema
+  * the torch model assembled for the driver must agree with the NumPy
+    reference forward (modelBundle.forward) on a recorded frame, and
+    produce finite outputs
+  * the commands it would send on that frame (accel, brake, steer,
+    clutch, clipped as in Driver.drive) are compared with the running
+    model's; a drift beyond drift_bound (default 0.5) rejects it, as a
+    state_dict that loads cleanly can still be a bad retrain
+
+Only then is a clone of the driver's inference backend loaded with the
+pair, here on the watcher thread (TorchScript compiles, the ONNX backend
+exports and opens a session), and handed to Driver.stage_model(). The
+driver swaps it in between ticks by reference. The race connection is
+never touched.
+'''
+import os
+import threading
+import time
+
+import numpy as np
+import torch
+
+import driver as driverModule
+import modelBundle
+import telemetrySchema
+
+
+class ModelWatcher(threading.Thread):
+    '''
+    Background poller that reloads changed model/scaler files into a Driver
+    '''
+
+    def __init__(self, driver, model_filename: str, scaler_filename: str, interval: float = 1.0,
+                 tolerance: float = 1e-4, drift_bound: float | None = 0.5):
+        '''Constructor: drift_bound is the largest accepted command change vs. the running model (None: log only)'''
+        super().__init__(name='model-watcher', daemon=True)
+        self.driver = driver
+        self.model_filename = model_filename
+        self.scaler_filename = scaler_filename
+        self.interval = interval
+        self.tolerance = tolerance
+        self.drift_bound = drift_bound
+        self.stopped = threading.Event()
+
+        self.loaded_signature = self.signature()
+        self.seen_signature = self.loaded_signature
+
+    def signature(self):
+        '''(mtime, size) of both files, or None if either is missing'''
+        try:
+            m, s = os.stat(self.model_filename), os.stat(self.scaler_filename)
+        except OSError:
+            return None
+        return (m.st_mtime_ns, m.st_size, s.st_mtime_ns, s.st_size)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            current = self.signature()
+            # Reload once the files differ from the loaded ones and were unchanged for a full interval
+            if current is not None and current != self.loaded_signature and current == self.seen_signature:
+                self.reload(current)
+            self.seen_signature = current
+
+    def validate(self, arrays: dict) -> str | None:
+        '''Return a reason the candidate cannot be used, or None if it is fine'''
+        try:
+            input_dim, _, output_dim = modelBundle.mlp_dims(arrays)
+        except ValueError as e:
+            return str(e)
+        try:
+            schema = modelBundle.bundle_schema(arrays, self.driver.feature_set)
+            schema.check_model(input_dim, output_dim, arrays['scaler.mul'].shape[0])
+        except telemetrySchema.SchemaError as e:
+            return str(e)
+        # The gather plan is compiled at startup; a new layout needs a restart
+        if schema.feature_set != self.driver.feature_set or schema.feature_columns != self.driver.feature_columns:
+            return "feature layout differs from the running driver's schema"
+        if schema.output_names != self.driver.nn_output_names:
+            return f"outputs {schema.output_names} differ from the running driver's {self.driver.nn_output_names}"
+        if not all(np.all(np.isfinite(a)) for a in arrays.values() if a.dtype.kind == 'f'):
+            return "non-finite weights or scaler constants"
+        return None
+
+    def commands(self, outputs: np.ndarray) -> np.ndarray:
+        '''Model outputs -> the clipped commands Driver.drive would send'''
+        names = self.driver.nn_output_names
+        return np.array([np.clip(outputs[names.index(name)], low, high)
+                         for name, (low, high) in driverModule.OUTPUT_RANGES.items() if name in names])
+
+    def smoke_test(self, arrays: dict, model, scaler) -> str | None:
+        '''Run the assembled model on a recorded frame and compare with the NumPy reference'''
+        frame = self.driver.last_features
+        if frame is None:
+            frame = np.zeros((1, len(self.driver.feature_columns)), dtype=np.float32)
+        with torch.no_grad():
+            got = model(torch.from_numpy(scaler.transform(frame)).float()).numpy()
+        expected = modelBundle.forward(arrays, frame.astype(np.float64))
+        if not np.all(np.isfinite(got)):
+            return "non-finite prediction on the smoke-test frame"
+        err = float(np.max(np.abs(got - expected)))
+        if err > self.tolerance:
+            return f"prediction differs from reference by {err:.3g}"
+        if self.driver.nn_model is not None:
+            # predict_batch: predict_one may write into buffers the driver thread is using right now
+            current = self.driver.backend.predict_batch(frame)[0]
+            drift = float(np.max(np.abs(self.commands(got[0]) - self.commands(current))))
+            print(f"ModelWatcher: Command drift vs. running model: {drift:.4g}")
+            if self.drift_bound is not None and drift > self.drift_bound:
+                return f"commands drift {drift:.3g} from the running model (bound {self.drift_bound})"
+        return None
+
+    def reload(self, signature):
+        start = time.perf_counter()
+        try:
+            arrays = modelBundle.load_bundle(self.model_filename, self.scaler_filename)
+            reason = self.validate(arrays)
+            if reason is None:
+                model, scaler = driverModule.build_model(arrays)
+                reason = self.smoke_test(arrays, model, scaler)
+            if reason is None:
+                backend = self.driver.backend.clone()
+                backend.load(model, scaler)
+                backend.predict_batch(np.zeros((1, scaler.n_features_in_), dtype=np.float32)) # First-call costs here too
+        except Exception as e:
+            reason = f"load failed: {e}"
+
+        if reason is not None:
+            # Keep the current model; retry only when the files change again
+            print(f"ModelWatcher: Rejected new model: {reason}")
+            self.driver.metrics['reload_failures'] += 1
+            self.loaded_signature = signature
+            return
+
+        version = time.strftime('%Y%m%d_%H%M%S', time.localtime(signature[0] / 1e9))
+        self.driver.stage_model(model, scaler, version, time.perf_counter() - start, backend)
+        self.loaded_signature = signature
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+'''
+Protocol-level packet capture for the SCR client.
+
+PacketCapture logs every datagram the client reads from or sends to the
+server, raw bytes and all, with a perf_counter_ns() timestamp (monotonic,
+nanoseconds). It is attached to a udpTransport.UdpTransport
+(pyclient.py --capture run.scrcap) and writes through an mmap'd file,
+so recording a packet is one struct.pack_into and one slice copy into
+mapped memory, without a system call. The mapping grows by doubling.
+
+File layout (little endian):
+
+    header  8s magic b'SCRCAP\\x00\\x01', u64 wall-clock ns and u64
+            perf_counter ns taken together at open (maps capture
+            timestamps to wall time)
+    record  u32 payload length, u8 direction (1 = from server,
+            2 = to server), u64 perf_counter ns, payload bytes
+
+Records are appended back to back; the unwritten (zero) tail of the
+mapping reads as direction 0, which ends the log, so a capture of a
+crashed client is readable up to its last packet. close() trims the file.
+
+Every datagram read from the socket is logged, including frames the
+latest-frame mode skips. The tools pair each reply with the last packet
+received before it:
+
+  stats   inter-arrival time and jitter of server packets (RFC 3550
+          smoothed jitter as well), reply latency percentiles, packets
+          that got no reply, restarts/shutdowns
+  dump    one line per packet, tcpdump style
+  pcap    a libpcap file with synthetic IPv4/UDP headers
+          (127.0.0.1, client port 0 <-> --serverPort) for Wireshark/tcpdump
+
+Usage:
+    python pyclient.py --capture run.scrcap
+    python packetCapture.py stats run.scrcap
+    python packetCapture.py pcap run.scrcap --out run.pcap
+'''
+import argparse
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+import latencyStats
+
+MAGIC = b'SCRCAP\x00\x01'
+HEADER = struct.Struct('<8sQQ')
+RECORD = struct.Struct('<IBQ')
+
+INBOUND = 1  # Server -> client (sensors, ***identified***, ***restart***, ***shutdown***)
+OUTBOUND = 2 # Client -> server (identification, controls)
+
+
+class PacketCapture(object):
+    '''
+    Append-only, memory-mapped packet log (one writer thread)
+    '''
+
+    def __init__(self, path: str, capacity: int = 16 << 20):
+        '''Constructor: creates path and maps capacity bytes (grown as needed)'''
+        self.path = path
+        self.file = open(path, 'w+b')
+        self.capacity = max(capacity, mmap.PAGESIZE)
+        self.file.truncate(self.capacity)
+        self.map = mmap.mmap(self.file.fileno(), self.capacity)
+        HEADER.pack_into(self.map, 0, MAGIC, time.time_ns(), time.perf_counter_ns())
+        self.offset = HEADER.size
+        self.packets = 0
+
+    def record(self, direction: int, payload):
+        '''Append one datagram (bytes or memoryview) stamped with the current monotonic time'''
+        now = time.perf_counter_ns()
+        start = self.offset + RECORD.size
+        end = start + len(payload)
+        if end > self.capacity:
+            self.grow(end)
+        RECORD.pack_into(self.map, self.offset, len(payload), direction, now)
+        self.map[start:end] = payload
+        self.offset = end
+        self.packets += 1
+
+    def grow(self, needed: int):
+        while self.capacity < needed:
+            self.capacity *= 2
+        self.map.resize(self.capacity) # Extends the file as well
+
+    def close(self):
+        if self.map is None:
+            return
+        self.map.flush()
+        self.map.close()
+        self.map = None
+        self.file.truncate(self.offset)
+        self.file.close()
+
+
+def read_capture(path: str) -> dict:
+    '''
+    All records of a capture: {'wall_ns', 'perf_ns' (header), 't_ns', 'direction',
+    'length' (arrays) and 'payloads' (list of bytes)}
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, wall_ns, perf_ns = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a packet capture")
+    t, direction, payloads = [], [], []
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        length, kind, t_ns = RECORD.unpack_from(data, offset)
+        if kind == 0:
+            break # Unwritten tail
+        start = offset + RECORD.size
+        t.append(t_ns)
+        direction.append(kind)
+        payloads.append(data[start:start + length])
+        offset = start + length
+    return {'wall_ns': wall_ns, 'perf_ns': perf_ns, 't_ns': np.array(t, dtype=np.int64),
+            'direction': np.array(direction, dtype=np.uint8),
+            'length': np.array([len(p) for p in payloads], dtype=np.int64), 'payloads': payloads}
+
+
+def analyse(capture: dict) -> dict:
+    '''Inter-arrival jitter of server packets and reply latency of the client'''
+    t, direction, payloads = capture['t_ns'], capture['direction'], capture['payloads']
+    inbound = direction == INBOUND
+    # Protocol notices are not sensor frames
+    notice = np.array([p.startswith(b'***') for p in payloads], dtype=bool)
+    sensors = inbound & ~notice
+
+    arrivals = latencyStats.LatencyRecorder(max(1, int(sensors.sum())))
+    arrival_t = t[sensors]
+    gaps = np.diff(arrival_t) * 1e-9
+    for gap in gaps:
+        arrivals.add(float(gap))
+    # RFC 3550 interarrival jitter: smoothed |change in gap|
+    jitter = 0.0
+    for change in np.abs(np.diff(gaps)):
+        jitter += (change - jitter) / 16.0
+
+    # Each reply answers the newest packet received before it; unanswered packets were skipped or lost
+    replies = latencyStats.LatencyRecorder(max(1, int((direction == OUTBOUND).sum())))
+    last_in = None
+    answered = 0
+    unanswered = 0
+    for i in range(len(t)):
+        if direction[i] == INBOUND:
+            if last_in is not None and sensors[last_in]:
+                unanswered += 1
+            last_in = i
+        elif last_in is not None:
+            replies.add((t[i] - t[last_in]) * 1e-9)
+            answered += 1
+            last_in = None
+    if last_in is not None and sensors[last_in]:
+        unanswered += 1
+    return {
+        'packets': len(t), 'sensor_packets': int(sensors.sum()), 'replies': int((direction == OUTBOUND).sum()),
+        'unanswered': unanswered,
+        'restarts': sum(p.startswith(b'***restart***') for p in payloads),
+        'shutdowns': sum(p.startswith(b'***shutdown***') for p in payloads),
+        'duration_s': float((t[-1] - t[0]) * 1e-9) if len(t) else 0.0,
+        'interarrival': arrivals.summary(), 'gap_std_ms': float(np.std(gaps) * 1e3) if len(gaps) else None,
+        'rfc3550_jitter_ms': jitter * 1e3, 'reply_latency': replies.summary(),
+        'arrivals': arrivals, 'reply_recorder': replies,
+    }
+
+
+def dump(capture: dict, limit: int | None = None, width: int = 80):
+    '''tcpdump-like listing: time since start, direction, size, gap to the previous packet, payload head'''
+    t = capture['t_ns']
+    for i in range(len(t) if limit is None else min(limit, len(t))):
+        arrow = 'S>C' if capture['direction'][i] == INBOUND else 'C>S'
+        gap = (t[i] - t[i - 1]) * 1e-6 if i else 0.0
+        text = capture['payloads'][i][:width].decode('utf-8', 'replace')
+        print(f"{(t[i] - t[0]) * 1e-9:12.6f} {arrow} {capture['length'][i]:5d}B +{gap:8.3f}ms {text}")
+
+
+def ip_checksum(header: bytes) -> int:
+    total = sum(struct.unpack('!10H', header))
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def write_pcap(capture: dict, path: str, server_port: int = 3001, client_port: int = 0):
+    '''libpcap file (LINKTYPE_RAW, IPv4) with synthetic loopback UDP headers around each payload'''
+    wall0, perf0 = capture['wall_ns'], capture['perf_ns']
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xA1B23C4D, 2, 4, 0, 0, 65535, 101)) # Nanosecond pcap, LINKTYPE_RAW
+        for i, payload in enumerate(capture['payloads']):
+            inbound = capture['direction'][i] == INBOUND
+            src, dst = (server_port, client_port) if inbound else (client_port, server_port)
+            udp = struct.pack('!HHHH', src, dst, 8 + len(payload), 0) # Checksum 0: not computed
+            ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp) + len(payload), i & 0xFFFF, 0, 64, 17, 0,
+                             bytes([127, 0, 0, 1]), bytes([127, 0, 0, 1]))
+            ip = ip[:10] + struct.pack('!H', ip_checksum(ip)) + ip[12:]
+            wall = wall0 + int(capture['t_ns'][i]) - perf0
+            packet = ip + udp + payload
+            f.write(struct.pack('<IIII', wall // 1_000_000_000, wall % 1_000_000_000, len(packet), len(packet)))
+            f.write(packet)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyse and export SCR packet captures.')
+    parser.add_argument('command', choices=['stats', 'dump', 'pcap'], help='What to do with the capture')
+    parser.add_argument('capture', help='Capture file written by pyclient.py --capture')
+    parser.add_argument('--out', action='store', dest='out', default=None,
+                        help='pcap: output file (default: <capture>.pcap)')
+    parser.add_argument('--serverPort', action='store', type=int, dest='server_port', default=3001,
+                        help='pcap: UDP port shown for the server (default: 3001)')
+    parser.add_argument('--limit', action='store', type=int, dest='limit', default=None,
+                        help='dump: at most this many packets')
+    arguments = parser.parse_args()
+
+    capture = read_capture(arguments.capture)
+    if arguments.command == 'stats':
+        result = analyse(capture)
+        print(f"{result['packets']} packets in {result['duration_s']:.2f}s: {result['sensor_packets']} sensor frames, "
+              f"{result['replies']} replies, {result['unanswered']} frames without a reply, "
+              f"{result['restarts']} restarts, {result['shutdowns']} shutdowns")
+        print(result['arrivals'].format('Inter-arrival'))
+        if result['gap_std_ms'] is not None:
+            print(f"{'Jitter':<24} std={result['gap_std_ms']:.3f}ms rfc3550={result['rfc3550_jitter_ms']:.3f}ms")
+        print(result['reply_recorder'].format('Reply latency'))
+    elif arguments.command == 'dump':
+        dump(capture, arguments.limit)
+    else:
+        out = arguments.out or os.path.splitext(arguments.capture)[0] + '.pcap'
+        write_pcap(capture, out, arguments.server_port)
+        print(f"Wrote {len(capture['payloads'])} packets to {out}")
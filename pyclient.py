@@ -10,270 +10,468 @@ import sys
 import argparse
 import socket
 import driver # Assuming you have a driver.py file with a Driver class
+import udpTransport
+import controlCache
+import controlPipeline
+import executionProfile
+import inferenceBackend
+import latencyStats
+import modelRegistry
+import modelWatcher
+import telemetryCodec
+import lapIndex
+import packetCapture
 import os # Import os module for path manipulation
 import csv # Import the csv module
+import time
 from datetime import datetime # Import datetime for unique filenames
 
-if __name__ == '__main__':
-    pass
-
-# Configure the argument parser
-parser = argparse.ArgumentParser(description = 'Python client to connect to the TORCS SCRC server.')
-
-parser.add_argument('--host', action='store', dest='host_ip', default='localhost',
-                    help='Host IP address (default: localhost)')
-parser.add_argument('--port', action='store', type=int, dest='host_port', default=3001,
-                    help='Host port number (default: 3001)')
-parser.add_argument('--id', action='store', dest='id', default='SCR',
-                    help='Bot ID (default: SCR)')
-parser.add_argument('--maxEpisodes', action='store', dest='max_episodes', type=int, default=1,
-                    help='Maximum number of learning episodes (default: 1)')
-parser.add_argument('--maxSteps', action='store', dest='max_steps', type=int, default=0,
-                    help='Maximum number of steps (default: 0)')
-parser.add_argument('--track', action='store', dest='track', default=None,
-                    help='Name of the track')
-parser.add_argument('--stage', action='store', dest='stage', type=int, default=3,
-                    help='Stage (0 - Warm-Up, 1 - Qualifying, 2 - Race, 3 - Unknown)')
-# --- Add argument for data collection mode ---
-parser.add_argument('--collectData', action='store_true', dest='collect_data', default=False,
-                    help='Enable data collection mode')
-parser.add_argument('--dataDir', action='store', dest='data_dir', default='collected_data',
-                    help='Directory to save collected data (default: collected_data)')
-
-arguments = parser.parse_args()
-
-# Print summary
-print('Connecting to server host ip:', arguments.host_ip, '@ port:', arguments.host_port)
-print('Bot ID:', arguments.id)
-print('Maximum episodes:', arguments.max_episodes)
-print('Maximum steps:', arguments.max_steps)
-print('Track:', arguments.track)
-print('Stage:', arguments.stage)
-print('Data Collection Mode:', arguments.collect_data)
-if arguments.collect_data:
-    print('Data Directory:', arguments.data_dir)
-print('*********************************************')
-
-# Create the data directory if it doesn't exist
-if arguments.collect_data and not os.path.exists(arguments.data_dir):
-    os.makedirs(arguments.data_dir)
-    print(f"Created data directory: {arguments.data_dir}")
-
-
-try:
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-except socket.error as msg:
-    print('Could not make a socket.')
-    sys.exit(-1)
-
-# one second timeout
-sock.settimeout(1.0)
-
-shutdownClient = False
-curEpisode = 0
-
-# You might want to make verbose an argument later, or control it here
-verbose = True
-
-# Ensure the driver.py file exists and has a Driver class
-try:
-    # Pass the data collection flag and directory to the driver
-    d = driver.Driver(arguments.stage, collect_data=arguments.collect_data)
-except NameError:
-    print("Error: The 'driver.py' file or the 'Driver' class was not found.")
-    print("Please make sure you have a 'driver.py' file in the same directory")
-    print("with a 'Driver' class that has the required methods.")
-    sys.exit(-1)
-
-
-while not shutdownClient:
-    curEpisode += 1 # Increment episode counter at the start of the loop
-
-    # --- Data Collection: File Handling for Each Race ---
+def build_parser() -> argparse.ArgumentParser:
+    '''Build the command line parser for the client (also used by supervisor.py)'''
+    # Configure the argument parser
+    parser = argparse.ArgumentParser(description = 'Python client to connect to the TORCS SCRC server.')
+
+    parser.add_argument('--host', action='store', dest='host_ip', default='localhost',
+                        help='Host IP address (default: localhost)')
+    parser.add_argument('--port', action='store', type=int, dest='host_port', default=3001,
+                        help='Host port number (default: 3001)')
+    parser.add_argument('--id', action='store', dest='id', default='SCR',
+                        help='Bot ID (default: SCR)')
+    parser.add_argument('--maxEpisodes', action='store', dest='max_episodes', type=int, default=1,
+                        help='Maximum number of learning episodes (default: 1)')
+    parser.add_argument('--maxSteps', action='store', dest='max_steps', type=int, default=0,
+                        help='Maximum number of steps (default: 0)')
+    parser.add_argument('--track', action='store', dest='track', default=None,
+                        help='Name of the track')
+    parser.add_argument('--stage', action='store', dest='stage', type=int, default=3,
+                        help='Stage (0 - Warm-Up, 1 - Qualifying, 2 - Race, 3 - Unknown)')
+    # --- Add argument for data collection mode ---
+    parser.add_argument('--collectData', action='store_true', dest='collect_data', default=False,
+                        help='Enable data collection mode')
+    parser.add_argument('--dataDir', action='store', dest='data_dir', default='collected_data',
+                        help='Directory to save collected data (default: collected_data)')
+    parser.add_argument('--dataFormat', action='store', dest='data_format', default='csv', choices=['csv', 'tlm'],
+                        help='Recording format: plain CSV or the compact delta/int16 .tlm files of telemetryCodec.py (default: csv)')
+    parser.add_argument('--input', action='store', dest='input_source', default='keyboard',
+                        choices=['keyboard', 'evdev', 'none'],
+                        help='Manual input for data collection: keyboard (needs a display), evdev gamepad/wheel '
+                             '(works headless) or none (default: keyboard)')
+    parser.add_argument('--inputDevice', action='store', dest='input_device', default=None,
+                        help='evdev device path, e.g. /dev/input/event5 (default: first joystick found)')
+    parser.add_argument('--singleFile', action='store_true', dest='single_file', default=False,
+                        help='Record every episode into one file (episode boundaries go to the index) '
+                             'instead of opening a new file per race')
+    parser.add_argument('--sectorFile', action='store', dest='sector_file', default=None,
+                        help='JSON sector definitions per track for the recording index (default: fixed-length sectors)')
+    # --- Socket I/O tuning ---
+    parser.add_argument('--rcvBuf', action='store', type=int, dest='rcv_buf', default=0,
+                        help='Socket receive buffer size in bytes (default: 0 = OS default)')
+    parser.add_argument('--busyPoll', action='store_true', dest='busy_poll', default=False,
+                        help='Spin on a non-blocking socket instead of sleeping in recv (lowest latency, burns a core)')
+    parser.add_argument('--frameMode', action='store', dest='frame_mode', default=None, choices=['latest', 'all'],
+                        help='latest: drain queued packets and act on the newest only; all: process every packet '
+                             '(default: all when collecting data, latest otherwise)')
+    parser.add_argument('--pipelined', action='store_true', dest='pipelined', default=False,
+                        help='Run Driver.drive on a compute thread and reply immediately with the last published control')
+    parser.add_argument('--features', action='store', dest='feature_set', default='raw', choices=['raw', 'reduced'],
+                        help='Model inputs: raw sensors or the compact derived features of featureReduction.py (default: raw)')
+    # --- Model hot reload ---
+    parser.add_argument('--hotReload', action='store_true', dest='hot_reload', default=False,
+                        help='Watch the model/scaler files and swap in new versions without reconnecting')
+    parser.add_argument('--reloadInterval', action='store', type=float, dest='reload_interval', default=1.0,
+                        help='Seconds between model file checks with --hotReload (default: 1.0)')
+    parser.add_argument('--reloadDriftBound', action='store', type=float, dest='reload_drift_bound', default=0.5,
+                        help='Reject a reloaded model whose commands on the last frame differ from the running model by more than this; 0 disables (default: 0.5)')
+    parser.add_argument('--modelRegistry', action='store', dest='model_registry', default=None,
+                        help='JSON file of per-track/stage models to preload; the model is picked by --track/--stage')
+    parser.add_argument('--mixture', action='store_true', dest='mixture', default=False,
+                        help='With --modelRegistry, evaluate all models in one fused pass and route by output weights')
+    parser.add_argument('--backend', action='store', dest='backend', default='torch', choices=inferenceBackend.BACKENDS,
+                        help='Model inference backend (default: torch); see inferenceBackend.py')
+    parser.add_argument('--backendThreads', action='store', type=int, dest='backend_threads', default=None,
+                        help='Intra-op threads for the torch/onnx backends (default: library default)')
+    parser.add_argument('--onnxModel', action='store', dest='onnx_model', default=None,
+                        help='With --backend onnx, run this .onnx file on the scaled features instead of exporting the model')
+    parser.add_argument('--execProfile', action='store_true', dest='exec_profile', default=False,
+                        help='Single-threaded torch/OpenMP/MKL, warm-up forwards and preallocated tensors (for many bots per host)')
+    parser.add_argument('--cpuAffinity', action='store', dest='cpu_affinity', default=None,
+                        help='With --execProfile, cores to pin this process to, e.g. "2" or "0-3"')
+    parser.add_argument('--warmup', action='store', type=int, dest='warmup', default=100,
+                        help='Warm-up forward passes with --execProfile (default: 100)')
+    parser.add_argument('--capture', action='store', dest='capture', default=None,
+                        help='Log every packet to/from the server to this file; {port} and {id} are substituted '
+                             '(see packetCapture.py)')
+    parser.add_argument('--controlCache', action='store_true', dest='control_cache', default=False,
+                        help='Reuse the last model commands while speed, angle, position and forward rays barely change')
+    parser.add_argument('--cacheTolerance', action='store', type=float, dest='cache_tolerance', default=1.0,
+                        help='Scale of the --controlCache quantization steps; larger reuses more (default: 1.0)')
+    parser.add_argument('--maxStale', action='store', type=int, dest='max_stale', default=3,
+                        help='Most frames in a row that reuse one model run with --controlCache (default: 3)')
+    return parser
+
+
+def load_registry(arguments):
+    '''The --modelRegistry models, preloaded (None without the option or when collecting data)'''
+    if not arguments.model_registry or arguments.collect_data:
+        return None
+    return modelRegistry.ModelRegistry(arguments.model_registry, arguments.feature_set, mixture=arguments.mixture,
+                                       backend=load_backend(arguments))
+
+
+def load_control_cache(arguments):
+    '''The --controlCache layer (None without the option)'''
+    if not arguments.control_cache:
+        return None
+    return controlCache.ControlCache(arguments.cache_tolerance, arguments.max_stale)
+
+
+def load_backend(arguments):
+    '''The --backend inference backend'''
+    return inferenceBackend.create(arguments.backend, threads=arguments.backend_threads, onnx_path=arguments.onnx_model,
+                                   reuse=arguments.exec_profile)
+
+
+def load_profile(arguments):
+    '''The --execProfile settings (None without the option)'''
+    if not arguments.exec_profile:
+        return None
+    return executionProfile.ExecutionProfile(threads=arguments.backend_threads or 1,
+                                             cores=executionProfile.parse_cores(arguments.cpu_affinity),
+                                             warmup=arguments.warmup)
+
+
+def run(arguments, d=None, telemetry=None):
+    '''
+    Connect to the server and drive for arguments.max_episodes races.
+    A preconstructed Driver may be passed in as d; telemetry, if given, is
+    called with a dict of per-episode statistics at the end of each race.
+    '''
+    if arguments.frame_mode is None:
+        # Data collection needs every frame; driving wants the freshest one
+        arguments.frame_mode = 'all' if arguments.collect_data else 'latest'
+
+    # Print summary
+    print('Connecting to server host ip:', arguments.host_ip, '@ port:', arguments.host_port)
+    print('Bot ID:', arguments.id)
+    print('Maximum episodes:', arguments.max_episodes)
+    print('Maximum steps:', arguments.max_steps)
+    print('Track:', arguments.track)
+    print('Stage:', arguments.stage)
+    print('Data Collection Mode:', arguments.collect_data)
+    print('Busy-poll receive:', arguments.busy_poll)
+    print('Frame mode:', arguments.frame_mode)
+    print('Pipelined:', arguments.pipelined)
+    print('Backend:', arguments.backend)
+    if arguments.collect_data:
+        print('Data Directory:', arguments.data_dir)
+    print('*********************************************')
+
+    sectors = lapIndex.load_sectors(arguments.sector_file)
+    # Create the data directory if it doesn't exist
+    if arguments.collect_data and not os.path.exists(arguments.data_dir):
+        os.makedirs(arguments.data_dir)
+        print(f"Created data directory: {arguments.data_dir}")
+
+
+    try:
+        # Connected UDP socket with a reused receive buffer and a one second timeout
+        sock = udpTransport.UdpTransport(arguments.host_ip, arguments.host_port,
+                                         rcvbuf=arguments.rcv_buf, busy_poll=arguments.busy_poll, timeout=1.0)
+    except socket.error as msg:
+        print('Could not make a socket.')
+        sys.exit(-1)
+
+    if arguments.rcv_buf > 0:
+        print('Socket receive buffer:', sock.getRcvBuf(), 'bytes')
+    if arguments.capture:
+        # Every datagram in both directions, raw and timestamped; readable even if the client dies
+        capture_path = arguments.capture.format(port=arguments.host_port, id=arguments.id)
+        sock.capture = packetCapture.PacketCapture(capture_path)
+        print('Capturing packets to', capture_path)
+
+    shutdownClient = False
+    curEpisode = 0
+
+    # You might want to make verbose an argument later, or control it here
+    verbose = True
+
+    # Thread counts and affinity before the driver builds its model
+    # (a caller passing its own Driver has applied the profile already, see supervisor.worker_main)
+    profile = load_profile(arguments)
+    if profile and d is None:
+        profile.apply()
+
+    # Ensure the driver.py file exists and has a Driver class
+    try:
+        # Pass the data collection flag and directory to the driver
+        if d is None:
+            d = driver.Driver(arguments.stage, collect_data=arguments.collect_data, feature_set=arguments.feature_set,
+                              input_source=arguments.input_source, input_device=arguments.input_device,
+                              model_registry=load_registry(arguments), control_cache=load_control_cache(arguments),
+                              backend=load_backend(arguments))
+    except NameError:
+        print("Error: The 'driver.py' file or the 'Driver' class was not found.")
+        print("Please make sure you have a 'driver.py' file in the same directory")
+        print("with a 'Driver' class that has the required methods.")
+        sys.exit(-1)
+
+    if profile:
+        warm = profile.warm(d)
+        print(f"Execution profile: {profile.describe()}, {profile.warmup} warm-up passes in {warm * 1e3:.1f} ms")
+
+    # Time spent handling each packet (recv to send), reported per episode
+    tick_latency = latencyStats.LatencyRecorder()
+
+    watcher = None
+    if arguments.hot_reload and d.model_registry is not None:
+        print("--hotReload is ignored with --modelRegistry (the registry's models are preloaded)")
+    elif arguments.hot_reload and not arguments.collect_data:
+        watcher = modelWatcher.ModelWatcher(d, d.model_filename, d.scaler_filename, interval=arguments.reload_interval,
+                                            drift_bound=arguments.reload_drift_bound or None)
+        watcher.start()
+        print(f"Watching '{d.model_filename}' and '{d.scaler_filename}' for new versions")
+
+
     data_file = None
     csv_writer = None
-    if arguments.collect_data:
-        # Generate a unique filename for each race
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        # Use track name and episode number in the filename
-        track_name_for_file = arguments.track if arguments.track else "unknown_track"
-        filename = f"race_{track_name_for_file}_episode{curEpisode}_{timestamp}.csv"
-        filepath = os.path.join(arguments.data_dir, filename)
+    restart_time = None # When the last ***restart*** arrived, for the time-to-first-control report
+
+    while not shutdownClient:
+        curEpisode += 1 # Increment episode counter at the start of the loop
+
+        # --- Data Collection: File Handling for Each Race ---
+        if arguments.collect_data and data_file is not None:
+            # --singleFile: the recording stays open and the index marks where this race starts
+            csv_writer.start_episode()
+        elif arguments.collect_data:
+            # Generate a unique filename for each race
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Use track name and episode number in the filename
+            track_name_for_file = arguments.track if arguments.track else "unknown_track"
+            filename = f"race_{track_name_for_file}_episode{curEpisode}_{timestamp}.{arguments.data_format}"
+            filepath = os.path.join(arguments.data_dir, filename)
 
-        try:
-            # Open the CSV file for writing for this race
-            data_file = open(filepath, 'w', newline='') # newline='' is important for csv module
-            csv_writer = csv.writer(data_file)
-            print(f"Opened data file for writing: {filepath}")
-
-            # --- Define and Write CSV Header ---
-            # You need to list all the sensor and control parameters you want to save.
-            # Make sure this list matches the order you write data in driver.py
-            header = [
-                'speedX', 'speedY', 'speedZ', 'rpm', 'fuel', 'damage', 'sensor_gear',
-                'racePos', 'distFromStart', 'distRaced', 'curLapTime', 'lastLapTime',
-                'trackPos', 'angle', 'z',
-                # Flatten list sensors into multiple columns
-                ] + [f'track_{i}' for i in range(19)] + \
-                [f'opponents_{i}' for i in range(36)] + \
-                [f'wheelSpinVel_{i}' for i in range(4)] + \
-                ['accel', 'brake', 'steer', 'control_gear', 'clutch', 'focus', 'meta']
-
-            csv_writer.writerow(header) # Write the header row
-            # --- End Define and Write CSV Header ---
-
-
-        except IOError as e:
-            print(f"Error opening data file {filepath}: {e}")
-            # Decide if you want to continue without saving or exit
-            arguments.collect_data = False # Disable data collection if file can't be opened
-
-
-    # --- End Data Collection: File Handling ---
-
-
-    # --- Race Identification Loop ---
-    while True:
-        print('Sending id to server: ', arguments.id)
-        # In Python 3, strings need to be encoded to bytes before sending
-        # Pass the csv_writer to the driver's init method if it needs to write header/init data
-        # (Though for behavioral cloning, init data isn't usually part of the state)
+            try:
+                # The header comes from the driver's telemetry schema, the same object that builds each row
+                header = d.schema.header()
+
+                if arguments.data_format == 'tlm':
+                    # Compressed chunks; the writer has the csv.writer interface and is its own file
+                    csv_writer = telemetryCodec.TelemetryWriter(filepath, header, fingerprint=d.schema.fingerprint())
+                    data_file = csv_writer
+                else:
+                    # Open the CSV file for writing for this race
+                    data_file = open(filepath, 'w', newline='') # newline='' is important for csv module
+                    csv_writer = csv.writer(data_file)
+                    csv_writer.writerow(header) # Write the header row
+                # Index laps, sectors and braking zones as the rows are written (<file>.index.json on close)
+                csv_writer = data_file = lapIndex.IndexedWriter(csv_writer, data_file, header, filepath, track_name_for_file,
+                                                                sectors.get(track_name_for_file))
+                print(f"Opened data file for writing: {filepath}")
+
+
+            except IOError as e:
+                print(f"Error opening data file {filepath}: {e}")
+                # Decide if you want to continue without saving or exit
+                arguments.collect_data = False # Disable data collection if file can't be opened
+
+
+        # --- End Data Collection: File Handling ---
+
+
+        # --- Race Identification: resend with a short, exponentially growing timeout ---
         buf_to_send = (arguments.id + d.init()).encode()
         print('Sending init string to server:', buf_to_send) # Print the bytes being sent
-
+        handshake_start = time.perf_counter()
         try:
-            # Send data as bytes
-            sock.sendto(buf_to_send, (arguments.host_ip, arguments.host_port))
+            buf, attempts = sock.handshake(buf_to_send)
         except socket.error as msg:
             print("Failed to send data...Exiting...")
             # Ensure file is closed before exiting on error
             if data_file:
                 data_file.close()
             sys.exit(-1)
-
-        buf = None # Initialize buf before the try block
-        try:
-            # Receive data as bytes
-            buf_bytes, addr = sock.recvfrom(1000)
-            # Decode bytes to a string for processing
-            buf = buf_bytes.decode()
-        except socket.error as msg:
-            # Check if it's a timeout error specifically
-            if isinstance(msg, socket.timeout):
-                print("Timeout: didn't get response from server during identification...")
-            else:
-                print(f"Socket error during receive during identification: {msg}")
-                # Consider if other socket errors should be fatal
-                pass
-
-
-        if buf is not None and buf.find('***identified***') >= 0:
-            print('Received: ', buf)
-            break # Exit identification loop
-        elif buf is None:
-            # If buf is None due to timeout, continue the loop to resend id
-            continue
-        else:
-            # Handle unexpected responses before identification if necessary
-            print("Received unexpected response during identification:", buf)
-            # You might want to add logic here to decide whether to retry or exit
-            pass
-    # --- End Race Identification Loop ---
-
-    currentStep = 0
-
-    # --- Main Race Simulation Step Loop ---
-    while True:
-        # wait for an answer from server (sensor data)
-        buf = None
-        try:
-            # Receive data as bytes
-            buf_bytes, addr = sock.recvfrom(1000)
-            # Decode bytes to a string for processing
-            buf = buf_bytes.decode()
-        except socket.error as msg:
-            # Check if it's a timeout error specifically
-            if isinstance(msg, socket.timeout):
-                # print("Timeout: didn't get response from server during race step...")
-                pass # Continue loop, try receiving again
-            else:
-                print(f"Socket error during receive during race step: {msg}")
-                # Consider if other socket errors should be fatal
-                # Ensure file is closed before exiting on error
-                if data_file:
-                    data_file.close()
-                sys.exit(-1)
-
-
-        # Check for shutdown or restart messages
-        if buf is not None and buf.find('***shutdown***') >= 0:
-            print('Received: ', buf)
-            d.onShutDown() # Call driver shutdown method
-            shutdownClient = True # Set flag to exit main episode loop
+        print('Received: ', buf)
+        if buf.find('***shutdown***') >= 0:
+            d.onShutDown()
             print('Client Shutdown')
-            break # Exit the inner step loop (this race)
-
-        if buf is not None and buf.find('***restart***') >= 0:
-            print('Received: ', buf)
-            d.onRestart() # Call driver restart method
-            print('Client Restart')
-            break # Exit the inner step loop (this race), will start a new episode
-
-
-        # --- Process Sensor Data and Get Control Command ---
-        buf_to_send = None # Initialize buf_to_send
-        if buf is not None: # Only process if a non-None buffer was received (not a timeout)
-            currentStep += 1
-
-            # Call the driver's drive method with the sensor data
-            # Pass the csv_writer and currentStep to the drive method if in data collection mode
-            if arguments.collect_data and csv_writer:
-                buf_to_send_str = d.drive(buf, csv_writer=csv_writer, current_step=currentStep)
-            else:
-                # Standard driving mode (using driver's AI)
-                buf_to_send_str = d.drive(buf)
-
-            # Ensure the return value from drive is a string and encode it
-            if buf_to_send_str is not None: # Check if drive returned a valid string
-                buf_to_send = buf_to_send_str.encode()
-
-
-        # --- Send Control Command ---
-        # Only send data if buf_to_send was generated (i.e., valid sensor data received)
-        if buf_to_send is not None:
-            if verbose:
-                print('Sending: ', buf_to_send)
-
+            if data_file:
+                data_file.close()
+            break
+        print(f"Identified after {attempts} attempt(s) in {(time.perf_counter() - handshake_start) * 1e3:.1f} ms")
+        if d.model_registry is not None:
+            # Route to this race's model: an attribute swap, every model is already loaded
+            previous = d.metrics['model_version']
+            if d.model_registry.activate(d, arguments.track, arguments.stage) != previous:
+                print(f"Using model {d.metrics['model_version']} for track {arguments.track}, stage {arguments.stage}")
+        # --- End Race Identification ---
+
+        currentStep = 0
+        tick_latency.reset()
+        first_control = None # Seconds from ***restart*** to the first control of this race
+        if d.manual_input:
+            d.manual_input.latency.reset()
+        if d.control_cache is not None:
+            d.control_cache.reset_metrics()
+
+        # --- Pipelined mode: compute thread feeding a double-buffered control slot ---
+        worker = None
+        if arguments.pipelined:
+            control_slot = controlPipeline.ControlSlot()
+            worker = controlPipeline.ComputeWorker(d, control_slot,
+                                                   process_all=(arguments.frame_mode == 'all'),
+                                                   csv_writer=csv_writer if arguments.collect_data else None)
+            worker.start()
+
+        # --- Main Race Simulation Step Loop ---
+        while True:
+            # wait for an answer from server (sensor data)
+            buf = None
             try:
-                sock.sendto(buf_to_send, (arguments.host_ip, arguments.host_port))
+                # Receive data (None on timeout: continue loop, try receiving again)
+                if arguments.frame_mode == 'latest':
+                    buf = sock.recv_latest() # Skip stale frames queued while the last tick was running
+                else:
+                    buf = sock.recv()
             except socket.error as msg:
-                print("Failed to send data...Exiting...")
+                print(f"Socket error during receive during race step: {msg}")
+                # Consider if other socket errors should be fatal
                 # Ensure file is closed before exiting on error
                 if data_file:
                     data_file.close()
                 sys.exit(-1)
 
-        # Check max steps condition *after* processing the current step
-        if arguments.max_steps > 0 and currentStep >= arguments.max_steps:
-            print(f"Maximum steps ({arguments.max_steps}) reached for this episode.")
-            # Send a meta command to stop? Or let the server handle the end of race?
-            # Often reaching max steps means the episode ends, the server might send shutdown or restart
-            break # Exit the inner step loop
-
-
-    # --- End Race Simulation Step Loop ---
 
-    # --- Data Collection: Close File at End of Race ---
-    if data_file:
-        data_file.close()
-        print(f"Closed data file: {filepath}")
-    # --- End Data Collection: Close File ---
+            # Check for shutdown or restart messages
+            if buf is not None and buf.find('***shutdown***') >= 0:
+                print('Received: ', buf)
+                if worker:
+                    worker.stop() # The driver must be idle before it is shut down
+                d.onShutDown() # Call driver shutdown method
+                shutdownClient = True # Set flag to exit main episode loop
+                print('Client Shutdown')
+                break # Exit the inner step loop (this race)
+
+            if buf is not None and buf.find('***restart***') >= 0:
+                restart_time = time.perf_counter()
+                print('Received: ', buf)
+                if worker:
+                    worker.stop() # The driver must be idle before it is reset
+                d.onRestart() # Call driver restart method
+                print('Client Restart')
+                break # Exit the inner step loop (this race), will start a new episode
+
+
+            # --- Process Sensor Data and Get Control Command ---
+            buf_to_send = None # Initialize buf_to_send
+            if buf is not None: # Only process if a non-None buffer was received (not a timeout)
+                currentStep += 1
+                tick_start = time.perf_counter()
+
+                # Call the driver's drive method with the sensor data
+                # Pass the csv_writer and currentStep to the drive method if in data collection mode
+                if worker and worker.failed:
+                    # The compute thread died; drive on this thread for the rest of the race
+                    print(f"Pipelined mode disabled after compute error ({worker.error!r}); driving synchronously")
+                    worker.stop()
+                    worker = None
+                if worker:
+                    # Hand the frame to the compute thread and answer right away with the last published control
+                    worker.submit(buf, currentStep)
+                    buf_to_send_str = None
+                    buf_to_send = control_slot.read()
+                elif arguments.collect_data and csv_writer:
+                    buf_to_send_str = d.drive(buf, csv_writer=csv_writer, current_step=currentStep)
+                else:
+                    # Standard driving mode (using driver's AI)
+                    buf_to_send_str = d.drive(buf)
+
+                # Ensure the return value from drive is a string and encode it
+                if buf_to_send_str is not None: # Check if drive returned a valid string
+                    buf_to_send = buf_to_send_str.encode()
+
+
+            # --- Send Control Command ---
+            # Only send data if buf_to_send was generated (i.e., valid sensor data received)
+            if buf_to_send is not None:
+                if verbose:
+                    print('Sending: ', buf_to_send)
+
+                try:
+                    sock.send(buf_to_send)
+                except socket.error as msg:
+                    print("Failed to send data...Exiting...")
+                    # Ensure file is closed before exiting on error
+                    if data_file:
+                        data_file.close()
+                    sys.exit(-1)
+                tick_latency.add(time.perf_counter() - tick_start)
+                if first_control is None and restart_time is not None:
+                    first_control = time.perf_counter() - restart_time
+                    restart_time = None
+                    print(f"Restart to first control: {first_control * 1e3:.1f} ms")
+                if d.manual_input and not worker:
+                    d.manual_input.sent() # Input event -> first packet carrying it
+
+            # Check max steps condition *after* processing the current step
+            if arguments.max_steps > 0 and currentStep >= arguments.max_steps:
+                print(f"Maximum steps ({arguments.max_steps}) reached for this episode.")
+                # Send a meta command to stop? Or let the server handle the end of race?
+                # Often reaching max steps means the episode ends, the server might send shutdown or restart
+                break # Exit the inner step loop
+
+
+        # --- End Race Simulation Step Loop ---
+
+        if worker:
+            if worker.is_alive():
+                worker.stop()
+            print(worker.compute_latency.format('Compute time'))
+            if worker.skipped_frames > 0:
+                print(f"Compute thread skipped {worker.skipped_frames} frames")
+
+        if sock.dropped_frames > 0:
+            print(f"Dropped {sock.dropped_frames} stale frames of {sock.frames_received} received so far")
+        print(tick_latency.format('Tick time'))
+        if d.manual_input:
+            print(d.manual_input.latency.format('Input to packet'))
+        if d.control_cache is not None:
+            print(d.control_cache.format('Control cache'))
+
+        if telemetry is not None:
+            telemetry({
+                'bot_id': arguments.id,
+                'episode': curEpisode,
+                'steps': currentStep,
+                'frames_received': sock.frames_received,
+                'dropped_frames': sock.dropped_frames,
+                'tick': tick_latency.summary(),
+                'model': dict(d.metrics),
+                'input': d.manual_input.latency.summary() if d.manual_input else None,
+                'cache': d.control_cache.summary() if d.control_cache is not None else None,
+                'restart_to_first_control_ms': first_control * 1e3 if first_control is not None else None,
+            })
+
+        # Check if max episodes reached *after* handling the end of the current episode
+        # This check is now done at the start of the loop, combined with incrementing curEpisode
+        if curEpisode >= arguments.max_episodes:
+            shutdownClient = True # Ensure this flag is set to exit the main episode loop
+
+        # --- Data Collection: Close File at End of Race (with --singleFile only at the end of the session) ---
+        if data_file and (shutdownClient or not arguments.single_file):
+            data_file.close()
+            data_file = csv_writer = None
+            print(f"Closed data file: {filepath}")
+        # --- End Data Collection: Close File ---
+
+    if watcher:
+        watcher.stop()
+    print("Client shutting down completely.")
+    if sock.capture is not None:
+        sock.capture.close()
+        print(f"Captured {sock.capture.packets} packets to {sock.capture.path}")
+    sock.close()
 
 
-    # Check if max episodes reached *after* handling the end of the current episode
-    # This check is now done at the start of the loop, combined with incrementing curEpisode
-    if curEpisode >= arguments.max_episodes:
-        shutdownClient = True # Ensure this flag is set to exit the main episode loop
-
-print("Client shutting down completely.")
-sock.close()
+if __name__ == '__main__':
+    run(build_parser().parse_args())
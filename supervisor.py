@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+'''
+Run several independent driver bots from one entry point.
+
+The model and scaler are loaded once and placed in a shared memory block
+(modelBundle.SharedBundle). Each bot runs pyclient.run() in its own
+worker process, pinned to a core, with its Driver built on zero-copy
+views of that block, so every extra bot only costs its per-car state.
+Crashed workers are restarted and their per-episode telemetry is
+aggregated here.
+
+Bot i connects to --port + i. Any other option is passed through to
+pyclient.py, e.g.
+
+    python supervisor.py --bots 4 --port 3001 --maxEpisodes 5 --track g-track-1
+'''
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+import driver
+import executionProfile
+import modelBundle
+import pyclient
+
+
+def worker_main(index: int, core: int | None, bundle_spec, client_argv: list[str], telemetry_queue):
+    '''Entry point of a bot process'''
+    if core is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {core})
+
+    arguments = pyclient.build_parser().parse_args(client_argv)
+    # Thread limits must be in place before the Driver builds its model and backend;
+    # cores come from the supervisor's pinning above, not --cpuAffinity
+    profile = pyclient.load_profile(arguments)
+    if profile:
+        profile.apply()
+    bundle = modelBundle.SharedBundle.attach(*bundle_spec) if bundle_spec else None
+    d = driver.Driver(arguments.stage, collect_data=arguments.collect_data,
+                      model_bundle=bundle.arrays() if bundle else None, feature_set=arguments.feature_set,
+                      input_source=arguments.input_source, input_device=arguments.input_device,
+                      model_registry=pyclient.load_registry(arguments),
+                      control_cache=pyclient.load_control_cache(arguments), backend=pyclient.load_backend(arguments))
+    pyclient.run(arguments, d, telemetry=lambda stats: telemetry_queue.put((index, stats)))
+
+
+class Supervisor(object):
+    '''
+    Spawns, pins, restarts and collects telemetry from the bot workers
+    '''
+
+    def __init__(self, bots: int, base_port: int, client_argv: list[str], bundle_spec=None,
+                 pin: bool = True, max_restarts: int = 5):
+        '''Constructor'''
+        self.bots = bots
+        self.base_port = base_port
+        self.client_argv = client_argv
+        self.bundle_spec = bundle_spec
+        self.max_restarts = max_restarts
+
+        # Spawn (not fork) so each worker gets a clean torch/OpenMP runtime
+        self.ctx = multiprocessing.get_context('spawn')
+        self.telemetry_queue = self.ctx.Queue()
+
+        cores = sorted(os.sched_getaffinity(0)) if pin and hasattr(os, 'sched_getaffinity') else None
+        self.cores = [cores[i % len(cores)] if cores else None for i in range(bots)]
+
+        self.workers = [None] * bots
+        self.restarts = [0] * bots
+        self.finished = [False] * bots
+        self.episodes = [[] for _ in range(bots)] # Telemetry dicts per worker
+
+    def start_worker(self, index: int):
+        argv = self.client_argv + ['--port', str(self.base_port + index)]
+        p = self.ctx.Process(target=worker_main, name=f'bot-{index}',
+                             args=(index, self.cores[index], self.bundle_spec, argv, self.telemetry_queue))
+        p.start()
+        self.workers[index] = p
+        print(f"Supervisor: started bot {index} (pid {p.pid}, port {self.base_port + index}, core {self.cores[index]})")
+
+    def drain_telemetry(self, timeout: float):
+        try:
+            index, stats = self.telemetry_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        self.episodes[index].append(stats)
+        while True:
+            try:
+                index, stats = self.telemetry_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.episodes[index].append(stats)
+
+    def check_workers(self):
+        for index, p in enumerate(self.workers):
+            if self.finished[index] or p.is_alive():
+                continue
+            p.join()
+            if p.exitcode == 0:
+                print(f"Supervisor: bot {index} finished.")
+                self.finished[index] = True
+            elif self.restarts[index] < self.max_restarts:
+                self.restarts[index] += 1
+                print(f"Supervisor: bot {index} exited with code {p.exitcode}, "
+                      f"restarting ({self.restarts[index]}/{self.max_restarts})...")
+                time.sleep(min(2 ** self.restarts[index] * 0.1, 5.0))
+                self.start_worker(index)
+            else:
+                print(f"Supervisor: bot {index} crashed too often, giving up.")
+                self.finished[index] = True
+
+    def run(self):
+        for index in range(self.bots):
+            self.start_worker(index)
+        try:
+            while not all(self.finished):
+                self.drain_telemetry(0.5)
+                self.check_workers()
+        except KeyboardInterrupt:
+            print("Supervisor: interrupted, stopping bots...")
+            for p in self.workers:
+                if p.is_alive():
+                    p.terminate()
+            for p in self.workers:
+                p.join()
+        self.drain_telemetry(0.1)
+
+    def report(self):
+        '''Print per-bot and total telemetry'''
+        print('*********************************************')
+        total_steps = total_dropped = 0
+        for index in range(self.bots):
+            episodes = self.episodes[index]
+            steps = sum(e['steps'] for e in episodes)
+            dropped = episodes[-1]['dropped_frames'] if episodes else 0
+            ticks = [e['tick'] for e in episodes if e['tick'].get('count')]
+            p99 = max((t['p99_ms'] for t in ticks), default=None)
+            mean = (sum(t['mean_ms'] for t in ticks) / len(ticks)) if ticks else None
+            total_steps += steps
+            total_dropped += dropped
+            tick_text = f"tick mean={mean:.3f}ms worst-episode p99={p99:.3f}ms" if ticks else "no ticks"
+            caches = [e['cache'] for e in episodes if e.get('cache')]
+            if caches:
+                hits, misses = sum(c['hits'] for c in caches), sum(c['misses'] for c in caches)
+                tick_text += f" cache hit rate={hits / max(1, hits + misses):.1%}"
+            print(f"bot {index}: episodes={len(episodes)} steps={steps} dropped={dropped} "
+                  f"restarts={self.restarts[index]} {tick_text}")
+        print(f"total: bots={self.bots} steps={total_steps} dropped={total_dropped}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run several SCR driver bots with shared model weights.',
+                                     epilog='Unrecognised options are passed to pyclient.py.')
+    parser.add_argument('--bots', action='store', type=int, dest='bots', default=os.cpu_count(),
+                        help='Number of bot processes (default: number of CPUs)')
+    parser.add_argument('--port', action='store', type=int, dest='base_port', default=3001,
+                        help='Port of the first bot; bot i uses port + i (default: 3001)')
+    parser.add_argument('--model', action='store', dest='model_filename', default='torcs_mlp_model.pth',
+                        help='PyTorch state_dict to share (default: torcs_mlp_model.pth)')
+    parser.add_argument('--scaler', action='store', dest='scaler_filename', default='scaler_multi_output.pkl',
+                        help='Feature scaler to share (default: scaler_multi_output.pkl)')
+    parser.add_argument('--noPin', action='store_false', dest='pin', default=True,
+                        help='Do not pin bot processes to cores')
+    parser.add_argument('--maxRestarts', action='store', type=int, dest='max_restarts', default=5,
+                        help='Restarts allowed per crashed bot (default: 5)')
+    arguments, client_argv = parser.parse_known_args()
+
+    if any(arg.startswith('--cpuAffinity') for arg in client_argv):
+        parser.error("--cpuAffinity would override the per-bot core pinning; use --noPin to leave placement to the OS")
+    if '--execProfile' in client_argv:
+        # Inherited by the spawned bots, so their OpenMP/BLAS pools start single-threaded
+        executionProfile.set_thread_env(1)
+
+    bundle = None
+    if '--collectData' not in client_argv and '--modelRegistry' not in client_argv:
+        # (With --modelRegistry every bot preloads its own registry)
+        try:
+            bundle = modelBundle.SharedBundle.create(
+                modelBundle.load_bundle(arguments.model_filename, arguments.scaler_filename))
+            print(f"Supervisor: model and scaler shared in {bundle.nbytes()} bytes ({bundle.spec()[0]})")
+        except Exception as e:
+            print(f"Supervisor: could not load model or scaler ({e}), bots will load their own.")
+
+    supervisor = Supervisor(arguments.bots, arguments.base_port, client_argv,
+                            bundle_spec=bundle.spec() if bundle else None,
+                            pin=arguments.pin, max_restarts=arguments.max_restarts)
+    try:
+        supervisor.run()
+    finally:
+        if bundle:
+            bundle.close()
+    supervisor.report()
+    sys.exit(0)
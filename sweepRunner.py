@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+'''
+Hyperparameter and architecture sweep for the driver MLP.
+
+MLP_Model.ipynb trains one fixed network (128/64 ReLU, Adam 1e-3,
+batch 64). This runner trains a grid of driver.MLP variants instead:
+
+  * the dataset is parsed once, the StandardScaler is fitted on the
+    training split, and features/labels are written as .npy files that
+    every worker opens memory-mapped (no per-worker copy of the data)
+  * variants train in parallel worker processes, one per core, each with
+    a single torch thread, and stop early when the validation loss has not
+    improved for --patience epochs (the best epoch's weights are kept)
+  * afterwards each model's per-tick latency is measured serially, on an
+    otherwise idle process, through the same steps Driver.drive runs
+    (sklearn scaler transform, tensor conversion, forward pass)
+
+The result is a table of validation loss vs. p99 tick latency with the
+Pareto front marked, written to <outDir>/results.json. Every model is
+saved as <outDir>/<name>.pth next to the shared <outDir>/scaler.pkl, so
+the chosen pair can be copied over torcs_mlp_model.pth and
+scaler_multi_output.pkl directly (layer sizes are read from the file).
+
+Usage:
+    python sweepRunner.py Dataset.csv --hidden 128,64 64,32 32 --lr 1e-3 3e-4 --budgetMs 0.2
+'''
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import latencyStats
+import telemetrySchema
+
+
+def prepare_dataset(paths: list[str], out_dir: str, feature_set: str, val_fraction: float, seed: int) -> dict:
+    '''
+    Parse the tables, fit the scaler on the training split and write the
+    memory-mappable arrays. Returns the spec handed to the workers.
+    '''
+    import joblib
+    import pandas as pd
+    from sklearn.preprocessing import StandardScaler
+
+    import modelBundle
+
+    schema = scaler_names = None
+    X_parts, y_parts = [], []
+    for path in paths:
+        header, columns = telemetrySchema.read_table(path)
+        if schema is None:
+            schema, scaler_names = telemetrySchema.dataset_schema(header, feature_set)
+        X, y = schema.select(columns)
+        # Rows without every label cannot be trained on (same as dropna() in the notebook)
+        keep = ~np.isnan(y).any(axis=1)
+        X_parts.append(X[keep])
+        y_parts.append(y[keep])
+    X = np.concatenate(X_parts)
+    y = np.concatenate(y_parts)
+
+    order = np.random.default_rng(seed).permutation(X.shape[0])
+    n_val = max(1, int(len(order) * val_fraction))
+    val_idx, train_idx = np.sort(order[:n_val]), np.sort(order[n_val:])
+
+    scaler = StandardScaler().fit(pd.DataFrame(X[train_idx], columns=scaler_names))
+    scaler_filename = os.path.join(out_dir, 'scaler.pkl')
+    joblib.dump(scaler, scaler_filename)
+
+    data_dir = os.path.join(out_dir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    spec = {name: os.path.join(data_dir, f'{name}.npy') for name in ('X', 'y', 'train', 'val')}
+    for name, arr in (('X', X), ('y', y), ('train', train_idx), ('val', val_idx)):
+        np.save(spec[name], arr)
+    spec.update(scaler_arrays={k: v for k, v in modelBundle.scaler_arrays(scaler).items() if v.dtype.kind == 'f'},
+                scaler=scaler_filename, outputs=schema.output_names, features=X.shape[1])
+    print(f"Sweep: {len(train_idx)} training and {len(val_idx)} validation rows, "
+          f"{X.shape[1]} features -> {schema.output_names}")
+    return spec
+
+
+def cached_dataset(paths: list[str], cache_dir: str, budget_gb: float, feature_set: str, val_fraction: float,
+                   seed: int) -> dict:
+    '''Worker spec on top of a datasetCache entry (already scaled, so the workers' scaling is the identity)'''
+    import datasetCache
+
+    cache = datasetCache.DatasetCache(cache_dir, int(budget_gb * (1 << 30)))
+    dataset = cache.get(paths, {'feature_set': feature_set, 'val_fraction': val_fraction, 'seed': seed, 'epochs': 0})
+    n = len(dataset.feature_names)
+    spec = {name: os.path.join(dataset.path, f'{name}.npy') for name in ('X', 'y', 'train', 'val')}
+    spec.update(scaler_arrays={'scaler.mul': np.ones(n), 'scaler.add': np.zeros(n)}, prescaled=True,
+                scaler=dataset.scaler_filename, outputs=dataset.output_names, features=n)
+    print(f"Sweep: {len(dataset.train_idx)} training and {len(dataset.val_idx)} validation rows from the cache, "
+          f"{n} features -> {dataset.output_names}")
+    return spec
+
+
+def variant_name(variant: dict) -> str:
+    hidden = 'x'.join(str(h) for h in variant['hidden'])
+    return f"mlp_{hidden}_lr{variant['lr']:g}_bs{variant['batch_size']}"
+
+
+def init_worker(cores):
+    '''Pool initializer: pin to a free core and keep torch to one thread so workers do not contend'''
+    import torch
+
+    core = cores.get()
+    if core is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {core})
+    torch.set_num_threads(1)
+
+
+def train_variant(spec: dict, variant: dict, out_dir: str) -> dict:
+    '''Train one variant with early stopping; save and describe its best epoch'''
+    import torch
+    import torch.nn as nn
+
+    import driver
+
+    torch.manual_seed(variant['seed'])
+    rng = np.random.default_rng(variant['seed'])
+    X = np.load(spec['X'], mmap_mode='r')
+    y = np.load(spec['y'], mmap_mode='r')
+    train_idx, val_idx = np.load(spec['train']), np.load(spec['val'])
+    mul = spec['scaler_arrays']['scaler.mul'].astype(np.float32)
+    add = spec['scaler_arrays']['scaler.add'].astype(np.float32)
+
+    def batch(idx):
+        # Sorted indices turn the memory-mapped gather into forward reads
+        return torch.from_numpy(X[idx] * mul + add), torch.from_numpy(np.asarray(y[idx]))
+
+    def validation_loss(model, criterion):
+        model.eval()
+        total = 0.0
+        with torch.no_grad():
+            for start in range(0, len(val_idx), 65536):
+                idx = val_idx[start:start + 65536]
+                xb, yb = batch(idx)
+                total += criterion(model(xb), yb).item() * len(idx)
+        return total / len(val_idx)
+
+    model = driver.MLP(X.shape[1], y.shape[1], hidden=variant['hidden'])
+    criterion = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=variant['lr'])
+
+    start_time = time.perf_counter()
+    best_loss, best_epoch, best_state = float('inf'), 0, None
+    history = []
+    for epoch in range(1, variant['max_epochs'] + 1):
+        model.train()
+        order = rng.permutation(train_idx)
+        for start in range(0, len(order), variant['batch_size']):
+            xb, yb = batch(np.sort(order[start:start + variant['batch_size']]))
+            optimizer.zero_grad()
+            loss = criterion(model(xb), yb)
+            loss.backward()
+            optimizer.step()
+
+        val_loss = validation_loss(model, criterion)
+        history.append(val_loss)
+        if val_loss < best_loss - variant['min_delta']:
+            best_loss, best_epoch = val_loss, epoch
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        elif epoch - best_epoch >= variant['patience']:
+            break
+
+    name = variant_name(variant)
+    if best_state is None:
+        # No finite validation loss in any epoch (diverged): nothing worth saving
+        return {'name': name, 'failed': f"no finite validation loss in {len(history)} epochs", 'history': history,
+                'train_seconds': time.perf_counter() - start_time}
+    model_filename = os.path.join(out_dir, f'{name}.pth')
+    torch.save(best_state, model_filename)
+    return {
+        'name': name, 'model': model_filename, 'hidden': list(variant['hidden']), 'lr': variant['lr'],
+        'batch_size': variant['batch_size'], 'val_loss': best_loss, 'best_epoch': best_epoch,
+        'epochs': len(history), 'history': history,
+        'parameters': sum(p.numel() for p in model.parameters()),
+        'train_seconds': time.perf_counter() - start_time,
+    }
+
+
+def train_star(job):
+    return train_variant(*job)
+
+
+def measure_latency(model_filename: str, scaler_filename: str, rows: np.ndarray, ticks: int,
+                    warmup: int = 200) -> dict:
+    '''Per-tick latency of the scaler + MLP exactly as Driver.drive runs them, on recorded rows'''
+    import joblib
+    import torch
+
+    import driver
+    import modelBundle
+
+    model, _ = driver.build_model(modelBundle.load_bundle(model_filename, scaler_filename))
+    model.eval()
+    scaler = joblib.load(scaler_filename)
+    recorder = latencyStats.LatencyRecorder(ticks)
+    for i in range(warmup + ticks):
+        row = rows[i % len(rows)].reshape(1, -1)
+        start = time.perf_counter()
+        scaled = scaler.transform(row)
+        with torch.no_grad():
+            model(torch.from_numpy(scaled).float()).numpy()
+        if i >= warmup:
+            recorder.add(time.perf_counter() - start)
+    return recorder.summary()
+
+
+def pareto_front(results: list[dict]) -> list[dict]:
+    '''Results not beaten on both validation loss and p99 tick latency'''
+    front = []
+    best_loss = float('inf')
+    for result in sorted(results, key=lambda r: (r['latency']['p99_ms'], r['val_loss'])):
+        if result['val_loss'] < best_loss:
+            front.append(result)
+            best_loss = result['val_loss']
+    return front
+
+
+def parse_hidden(text: str) -> tuple[int, ...]:
+    return tuple(int(size) for size in text.split(',') if size.strip())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train MLP variants in parallel and report loss vs. tick latency.')
+    parser.add_argument('datasets', nargs='+', help='Dataset.csv or recorded episode files (.csv or .tlm)')
+    parser.add_argument('--hidden', action='store', dest='hidden', nargs='+', type=parse_hidden,
+                        default=[(256, 128), (128, 64), (64, 32), (32, 32), (32,)],
+                        help='Hidden layer sizes per variant, e.g. 128,64 64,32 32 (default: a small grid around 128,64)')
+    parser.add_argument('--lr', action='store', dest='lr', nargs='+', type=float, default=[1e-3],
+                        help='Adam learning rates (default: 1e-3)')
+    parser.add_argument('--batchSize', action='store', dest='batch_size', nargs='+', type=int, default=[64],
+                        help='Minibatch sizes (default: 64)')
+    parser.add_argument('--maxEpochs', action='store', type=int, dest='max_epochs', default=50,
+                        help='Epoch limit per variant (default: 50)')
+    parser.add_argument('--patience', action='store', type=int, dest='patience', default=5,
+                        help='Stop after this many epochs without validation improvement (default: 5)')
+    parser.add_argument('--minDelta', action='store', type=float, dest='min_delta', default=1e-5,
+                        help='Smallest validation loss decrease counted as improvement (default: 1e-5)')
+    parser.add_argument('--valFraction', action='store', type=float, dest='val_fraction', default=0.2,
+                        help='Share of rows held out for validation (default: 0.2)')
+    parser.add_argument('--features', action='store', dest='feature_set', default='raw', choices=['raw', 'reduced'],
+                        help='Train on raw sensors or the reduced features of featureReduction.py (default: raw)')
+    parser.add_argument('--workers', action='store', type=int, dest='workers', default=0,
+                        help='Parallel training processes (default: one per available core)')
+    parser.add_argument('--ticks', action='store', type=int, dest='ticks', default=2000,
+                        help='Timed ticks per model in the latency phase (default: 2000)')
+    parser.add_argument('--budgetMs', action='store', type=float, dest='budget_ms', default=None,
+                        help='Per-tick inference budget; the best model whose p99 fits is recommended')
+    parser.add_argument('--seed', action='store', type=int, dest='seed', default=0,
+                        help='Seed for the split, initialisation and shuffling (default: 0)')
+    parser.add_argument('--cacheDir', action='store', dest='cache_dir', default=None,
+                        help='Take the preprocessed dataset from this datasetCache directory (built on first use)')
+    parser.add_argument('--cacheBudgetGB', action='store', type=float, dest='cache_budget_gb', default=4.0,
+                        help='Disk budget of the dataset cache (default: 4)')
+    parser.add_argument('--outDir', action='store', dest='out_dir', default='sweep_results',
+                        help='Directory for models, scaler, data and results.json (default: sweep_results)')
+    arguments = parser.parse_args()
+
+    os.makedirs(arguments.out_dir, exist_ok=True)
+    if arguments.cache_dir:
+        spec = cached_dataset(arguments.datasets, arguments.cache_dir, arguments.cache_budget_gb,
+                              arguments.feature_set, arguments.val_fraction, arguments.seed)
+    else:
+        spec = prepare_dataset(arguments.datasets, arguments.out_dir, arguments.feature_set,
+                               arguments.val_fraction, arguments.seed)
+
+    variants = [{'hidden': hidden, 'lr': lr, 'batch_size': batch_size, 'max_epochs': arguments.max_epochs,
+                 'patience': arguments.patience, 'min_delta': arguments.min_delta, 'seed': arguments.seed}
+                for hidden, lr, batch_size in itertools.product(arguments.hidden, arguments.lr, arguments.batch_size)]
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else [None] * (os.cpu_count() or 1)
+    workers = min(arguments.workers or len(cores), len(variants))
+    print(f"Sweep: training {len(variants)} variants on {workers} worker processes...")
+
+    # Spawn (not fork) so each worker gets a clean torch/OpenMP runtime
+    ctx = multiprocessing.get_context('spawn')
+    free_cores = ctx.Queue()
+    for i in range(workers):
+        free_cores.put(cores[i % len(cores)])
+    results, failed = [], []
+    with ctx.Pool(workers, initializer=init_worker, initargs=(free_cores,)) as pool:
+        for result in pool.imap_unordered(train_star, [(spec, v, arguments.out_dir) for v in variants]):
+            if 'failed' in result:
+                print(f"Sweep: {result['name']} failed: {result['failed']}")
+                failed.append(result)
+                continue
+            print(f"Sweep: {result['name']} val_loss={result['val_loss']:.5f} "
+                  f"(best epoch {result['best_epoch']}/{result['epochs']}, {result['train_seconds']:.0f}s)")
+            results.append(result)
+
+    if not results:
+        raise SystemExit("Sweep: every variant failed; try a lower learning rate.")
+
+    # Latency is measured one model at a time so training load does not skew it
+    print("Sweep: measuring per-tick inference latency...")
+    X = np.load(spec['X'], mmap_mode='r')
+    rows = np.ascontiguousarray(X[np.load(spec['val'])[:arguments.ticks]])
+    if spec.get('prescaled'):
+        # The latency path starts from raw sensor rows, as in Driver.drive
+        import joblib
+
+        rows = joblib.load(spec['scaler']).inverse_transform(rows).astype(np.float32)
+    for result in results:
+        result['latency'] = measure_latency(result['model'], spec['scaler'], rows, arguments.ticks)
+
+    front = pareto_front(results)
+    print('*********************************************')
+    print(f"{'':2}{'variant':<34}{'params':>9}{'val_loss':>11}{'p50 ms':>9}{'p99 ms':>9}")
+    for result in sorted(results, key=lambda r: r['val_loss']):
+        mark = '* ' if result in front else '  '
+        print(f"{mark}{result['name']:<34}{result['parameters']:>9}{result['val_loss']:>11.5f}"
+              f"{result['latency']['p50_ms']:>9.3f}{result['latency']['p99_ms']:>9.3f}")
+    print("* = Pareto front (no other variant is both more accurate and faster at p99)")
+
+    chosen = None
+    if arguments.budget_ms is not None:
+        fitting = [r for r in front if r['latency']['p99_ms'] <= arguments.budget_ms]
+        chosen = min(fitting, key=lambda r: r['val_loss']) if fitting else None
+        if chosen:
+            print(f"Sweep: best model within {arguments.budget_ms} ms: {chosen['model']} (scaler: {spec['scaler']})")
+        else:
+            print(f"Sweep: no model fits a p99 budget of {arguments.budget_ms} ms.")
+
+    with open(os.path.join(arguments.out_dir, 'results.json'), 'w') as f:
+        json.dump({'scaler': spec['scaler'], 'outputs': spec['outputs'], 'features': spec['features'],
+                   'results': results, 'failed': failed, 'pareto': [r['name'] for r in front],
+                   'chosen': chosen['name'] if chosen else None}, f, indent=2)
+    print('*********************************************')
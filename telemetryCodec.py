@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+'''
+Compact binary telemetry files (.tlm) for long-running collection.
+
+A recorded row is 81 float columns per 20 ms tick, and most of them are
+either bounded (rangefinders, speeds, controls) or barely change (fuel,
+damage, racePos, lap times, distances). The codec stores rows in chunks
+and encodes each column of a chunk as one of:
+
+  int16  - value quantized with the column's step (see QUANT_STEPS)
+  delta  - quantized, then differenced against the previous row (int32);
+           slowly changing columns become runs of zeros
+  float32 - fallback when a chunk has missing values, does not fit int16,
+            or has fractions in an integer column
+
+Each chunk is then compressed with zstd or lz4 when installed, zlib
+otherwise. Decoding goes straight from the compressed bytes to NumPy
+arrays (frombuffer + cumsum + scale), with no text parsing.
+
+The worst-case error of a quantized column is half its step.
+
+TelemetryWriter has the csv.writer interface (writerow), so the recorder
+in Driver.drive writes .tlm files unchanged (pyclient.py --dataFormat tlm).
+
+File layout: b'TLM1', uint32 header length, JSON header, then chunks of
+(uint32 rows, uint32 compressed size, payload). The payload holds one
+uint8 codec tag per column followed by the column arrays.
+
+Usage:
+    python telemetryCodec.py encode collected_data/*.csv
+    python telemetryCodec.py decode race.tlm race.csv
+'''
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+import telemetrySchema
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+MAGIC = b'TLM1'
+TAG_FLOAT32, TAG_INT16, TAG_DELTA = 0, 1, 2
+INT16_LIMIT = 32767
+
+# Quantization step per column: bounded, fast-changing columns go to int16
+QUANT_STEPS = {
+    'angle': 1e-4, 'trackPos': 1e-4, 'z': 1e-4,
+    'speedX': 0.01, 'speedY': 0.01, 'speedZ': 0.01, 'rpm': 0.5,
+    'accel': 1e-4, 'brake': 1e-4, 'steer': 1e-4, 'clutch': 1e-4,
+}
+QUANT_STEPS.update({f'track_{i}': 0.01 for i in range(19)})
+QUANT_STEPS.update({f'opponents_{i}': 0.01 for i in range(36)})
+QUANT_STEPS.update({f'wheelSpinVel_{i}': 0.01 for i in range(4)})
+# Slowly changing or monotonic columns are delta-encoded at this step
+DELTA_STEPS = {
+    'fuel': 1e-3, 'damage': 1.0, 'racePos': 1.0, 'sensor_gear': 1.0, 'control_gear': 1.0,
+    'focus': 1.0, 'meta': 1.0, 'curLapTime': 1e-3, 'lastLapTime': 1e-3,
+    'distFromStart': 1e-3, 'distRaced': 1e-3,
+}
+
+
+def available_compressor(name: str = 'auto') -> str:
+    if name == 'auto':
+        return 'zstd' if zstandard else 'lz4' if lz4 else 'zlib'
+    if (name == 'zstd' and zstandard is None) or (name == 'lz4' and lz4 is None):
+        raise ImportError(f"The '{name}' compressor is not installed (pip install {'zstandard' if name == 'zstd' else 'lz4'})")
+    return name
+
+
+def compress(data: bytes, compressor: str) -> bytes:
+    if compressor == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if compressor == 'lz4':
+        return lz4.frame.compress(data)
+    return zlib.compress(data, 1)
+
+
+def decompress(data: bytes, compressor: str) -> bytes:
+    if compressor == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compressor == 'lz4':
+        return lz4.frame.decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_chunk(block: np.ndarray, columns: list[str]) -> bytes:
+    '''Encode a (rows, columns) float64 block into the uncompressed chunk payload'''
+    tags = bytearray()
+    parts = []
+    for j, col in enumerate(columns):
+        values = block[:, j]
+        tag, data = TAG_FLOAT32, None
+        if not np.isnan(values).any():
+            if col in DELTA_STEPS:
+                q = np.rint(values / DELTA_STEPS[col]).astype(np.int64)
+                diff = np.diff(q, prepend=0)
+                # Integer columns (gear, racePos, ...) must be exact, not rounded
+                exact = DELTA_STEPS[col] != 1.0 or np.array_equal(q, values)
+                if exact and np.abs(diff).max(initial=0) < 2 ** 31:
+                    tag, data = TAG_DELTA, diff.astype('<i4')
+            elif col in QUANT_STEPS:
+                q = np.rint(values / QUANT_STEPS[col])
+                if np.abs(q).max(initial=0) <= INT16_LIMIT:
+                    tag, data = TAG_INT16, q.astype('<i2')
+        if data is None:
+            data = values.astype('<f4')
+        tags.append(tag)
+        parts.append(data.tobytes())
+    return bytes(tags) + b''.join(parts)
+
+
+def decode_chunk(payload: bytes, rows: int, columns: list[str], wanted: list[int]) -> list[np.ndarray]:
+    '''Decode the wanted column indices of an uncompressed chunk payload into float32 arrays'''
+    tags = payload[:len(columns)]
+    offsets = [len(columns)]
+    for tag in tags:
+        offsets.append(offsets[-1] + rows * (2 if tag == TAG_INT16 else 4))
+    out = []
+    for j in wanted:
+        tag, start = tags[j], offsets[j]
+        if tag == TAG_INT16:
+            values = np.frombuffer(payload, '<i2', rows, start).astype(np.float32) * np.float32(QUANT_STEPS[columns[j]])
+        elif tag == TAG_DELTA:
+            values = (np.cumsum(np.frombuffer(payload, '<i4', rows, start), dtype=np.int64)
+                      * DELTA_STEPS[columns[j]]).astype(np.float32)
+        else:
+            values = np.frombuffer(payload, '<f4', rows, start).copy()
+        out.append(values)
+    return out
+
+
+class TelemetryWriter(object):
+    '''
+    Chunked .tlm writer with the csv.writer interface
+    '''
+
+    def __init__(self, path: str, columns: list[str], chunk_rows: int = 4096, compressor: str = 'auto',
+                 fingerprint: str | None = None):
+        '''Constructor'''
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self.compressor = available_compressor(compressor)
+        self.block = np.empty((chunk_rows, len(self.columns)), dtype=np.float64)
+        self.rows = 0
+        self.file = open(path, 'wb')
+        header = json.dumps({'columns': self.columns, 'compressor': self.compressor,
+                             'fingerprint': fingerprint}).encode()
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+
+    def writerow(self, row):
+        '''Append one row (None = missing value, stored as NaN)'''
+        self.block[self.rows] = [np.nan if value is None else value for value in row]
+        self.rows += 1
+        if self.rows == self.chunk_rows:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def write_block(self, block: np.ndarray):
+        '''Append a (rows, columns) array in one go'''
+        self.flush() # Rows buffered by writerow() come first
+        for start in range(0, block.shape[0], self.chunk_rows):
+            part = block[start:start + self.chunk_rows]
+            self.file.write(self.pack(part))
+
+    def pack(self, block: np.ndarray) -> bytes:
+        payload = compress(encode_chunk(block, self.columns), self.compressor)
+        return struct.pack('<II', block.shape[0], len(payload)) + payload
+
+    def flush(self):
+        if self.rows:
+            self.file.write(self.pack(self.block[:self.rows]))
+            self.rows = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_header(f) -> dict:
+    if f.read(4) != MAGIC:
+        raise ValueError("Not a .tlm telemetry file")
+    (length,) = struct.unpack('<I', f.read(4))
+    return json.loads(f.read(length))
+
+
+def column_names(path: str) -> list[str]:
+    '''Column names stored in a .tlm file (reads the header only)'''
+    with open(path, 'rb') as f:
+        return read_header(f)['columns']
+
+
+def read_columns(path: str, columns: list[str] | None = None) -> dict[str, np.ndarray]:
+    '''Decode a .tlm file into float32 arrays, optionally only some columns'''
+    with open(path, 'rb') as f:
+        header = read_header(f)
+        names = header['columns']
+        wanted = [names.index(col) for col in columns] if columns is not None else list(range(len(names)))
+        parts = [[] for _ in wanted]
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                break
+            rows, size = struct.unpack('<II', head)
+            payload = decompress(f.read(size), header['compressor'])
+            for part, values in zip(parts, decode_chunk(payload, rows, names, wanted)):
+                part.append(values)
+    return {names[j]: np.concatenate(part) if part else np.empty(0, dtype=np.float32)
+            for j, part in zip(wanted, parts)}
+
+
+def read_rows(path: str, start: int, stop: int, columns: list[str] | None = None) -> dict[str, np.ndarray]:
+    '''Decode rows [start, stop) only; chunks outside the range are skipped without decompressing'''
+    with open(path, 'rb') as f:
+        header = read_header(f)
+        names = header['columns']
+        wanted = [names.index(col) for col in columns] if columns is not None else list(range(len(names)))
+        parts = [[] for _ in wanted]
+        first = 0
+        while first < stop:
+            head = f.read(8)
+            if len(head) < 8:
+                break
+            rows, size = struct.unpack('<II', head)
+            if first + rows <= start:
+                f.seek(size, os.SEEK_CUR)
+            else:
+                payload = decompress(f.read(size), header['compressor'])
+                lo, hi = max(start - first, 0), min(stop - first, rows)
+                for part, values in zip(parts, decode_chunk(payload, rows, names, wanted)):
+                    part.append(values[lo:hi])
+            first += rows
+    return {names[j]: np.concatenate(part) if part else np.empty(0, dtype=np.float32)
+            for j, part in zip(wanted, parts)}
+
+
+def encode_csv(source: str, target: str, compressor: str = 'auto') -> dict:
+    '''Convert a recorded CSV; returns sizes and the worst quantization error per column'''
+    import pandas as pd
+
+    frame = pd.read_csv(source, dtype=np.float64)
+    frame.columns = frame.columns.str.strip()
+    columns = list(frame.columns)
+    writer = TelemetryWriter(target, columns, compressor=compressor,
+                             fingerprint=telemetrySchema.TelemetrySchema().fingerprint())
+    writer.write_block(frame.to_numpy())
+    writer.close()
+
+    decoded = read_columns(target)
+    errors = {col: float(np.nanmax(np.abs(decoded[col] - frame[col].to_numpy()), initial=0.0)) for col in columns}
+    return {'csv_bytes': os.path.getsize(source), 'tlm_bytes': os.path.getsize(target), 'errors': errors}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert recorded telemetry between CSV and the compact .tlm format.')
+    parser.add_argument('command', choices=['encode', 'decode'], help='encode CSV files to .tlm, or decode one .tlm to CSV')
+    parser.add_argument('files', nargs='+', help='encode: CSV files; decode: source.tlm target.csv')
+    parser.add_argument('--compressor', action='store', dest='compressor', default='auto',
+                        choices=['auto', 'zstd', 'lz4', 'zlib'], help='Chunk compressor (default: best installed)')
+    arguments = parser.parse_args()
+
+    if arguments.command == 'decode':
+        import pandas as pd
+
+        source, target = arguments.files
+        pd.DataFrame(read_columns(source)).to_csv(target, index=False)
+        print(f"Wrote {target}")
+    else:
+        import pandas as pd
+
+        total_csv = total_tlm = 0
+        for source in arguments.files:
+            target = os.path.splitext(source)[0] + '.tlm'
+            stats = encode_csv(source, target, arguments.compressor)
+            total_csv += stats['csv_bytes']
+            total_tlm += stats['tlm_bytes']
+            worst = max(stats['errors'].items(), key=lambda item: item[1])
+            print(f"{source}: {stats['csv_bytes'] / 1e6:.2f} MB -> {stats['tlm_bytes'] / 1e6:.2f} MB "
+                  f"({stats['csv_bytes'] / max(stats['tlm_bytes'], 1):.1f}x), largest error {worst[1]:.3g} ({worst[0]})")
+
+            # Read cost: full CSV parse vs. decoding the .tlm
+            t0 = time.perf_counter()
+            pd.read_csv(source, dtype=np.float32)
+            t1 = time.perf_counter()
+            read_columns(target)
+            t2 = time.perf_counter()
+            print(f"  read: csv {t1 - t0:.3f}s, tlm {t2 - t1:.3f}s ({(t1 - t0) / max(t2 - t1, 1e-9):.1f}x faster)")
+        print(f"Total: {total_csv / 1e6:.2f} MB -> {total_tlm / 1e6:.2f} MB "
+              f"({total_csv / max(total_tlm, 1):.1f}x) using {available_compressor(arguments.compressor)}")
@@ -0,0 +1,303 @@
+'''
+Single source of truth for the telemetry column layout.
+
+Recording (pyclient.py/Driver.drive), training and inference used to keep
+their own hand-written column lists. A TelemetrySchema is compiled once
+from these definitions and provides:
+
+  * header() / record_row()   - the recorded CSV layout (all sensors + all controls)
+  * gather()                  - the live feature extraction plan, CarState -> model input row
+  * features() / select()     - the same features (and labels) in bulk for training/evaluation
+  * check_*()                 - startup validation against model, scaler and file headers
+
+read_table() and dataset_schema() load training tables (Dataset.csv or
+recordings) under these names for the offline tools.
+
+Models take either the raw sensors (feature_set='raw') or the compact
+derived features of featureReduction.py (feature_set='reduced').
+
+The feature order can be taken from a fitted scaler's feature_names_in_,
+including scalers fitted on the Dataset.csv naming used in the notebooks
+(Angle, Track_1, ...), so the gather plan always matches the artifact.
+'''
+import hashlib
+
+import numpy as np
+
+import featureReduction
+
+
+class SchemaError(ValueError):
+    '''Raised when data, models or files do not match the schema'''
+    pass
+
+
+# --- Recorded columns: name -> (CarState attribute, list index or None) ---
+SENSOR_SOURCES = {
+    'speedX': ('speedX', None), 'speedY': ('speedY', None), 'speedZ': ('speedZ', None),
+    'rpm': ('rpm', None), 'fuel': ('fuel', None), 'damage': ('damage', None),
+    'sensor_gear': ('gear', None), 'racePos': ('racePos', None),
+    'distFromStart': ('distFromStart', None), 'distRaced': ('distRaced', None),
+    'curLapTime': ('curLapTime', None), 'lastLapTime': ('lastLapTime', None),
+    'trackPos': ('trackPos', None), 'angle': ('angle', None), 'z': ('z', None),
+}
+SENSOR_SOURCES.update({f'track_{i}': ('track', i) for i in range(19)})
+SENSOR_SOURCES.update({f'opponents_{i}': ('opponents', i) for i in range(36)})
+SENSOR_SOURCES.update({f'wheelSpinVel_{i}': ('wheelSpinVel', i) for i in range(4)})
+SENSOR_COLUMNS = list(SENSOR_SOURCES)
+
+# Recorded control columns: name -> CarControl attribute
+CONTROL_SOURCES = {
+    'accel': 'accel', 'brake': 'brake', 'steer': 'steer', 'control_gear': 'gear',
+    'clutch': 'clutch', 'focus': 'focus', 'meta': 'meta',
+}
+CONTROL_COLUMNS = list(CONTROL_SOURCES)
+
+# Model output name -> recorded label column
+LABEL_SOURCES = {'accel': 'accel', 'brake': 'brake', 'steer': 'steer', 'clutch': 'clutch', 'gear': 'control_gear'}
+
+# Output order of models trained on the client's own recordings
+DEFAULT_OUTPUT_NAMES = ['accel', 'brake', 'steer', 'clutch', 'gear']
+
+# Column names of the Dataset.csv used in MLP_Model.ipynb, mapped to ours
+DATASET_ALIASES = {
+    'Angle': 'angle', 'CurrentLapTime': 'curLapTime', 'Damage': 'damage',
+    'DistanceFromStart': 'distFromStart', 'DistanceCovered': 'distRaced', 'FuelLevel': 'fuel',
+    'LastLapTime': 'lastLapTime', 'RacePosition': 'racePos', 'RPM': 'rpm',
+    'SpeedX': 'speedX', 'SpeedY': 'speedY', 'SpeedZ': 'speedZ', 'TrackPosition': 'trackPos', 'Z': 'z',
+}
+DATASET_ALIASES.update({f'Track_{i + 1}': f'track_{i}' for i in range(19)})
+DATASET_ALIASES.update({f'Opponent_{i + 1}': f'opponents_{i}' for i in range(36)})
+DATASET_ALIASES.update({f'WheelSpinVelocity_{i + 1}': f'wheelSpinVel_{i}' for i in range(4)})
+# y_columns of MLP_Model.ipynb, in order
+DATASET_OUTPUT_NAMES = ['accel', 'brake', 'clutch', 'gear', 'steer']
+# Label columns of Dataset.csv, mapped to our recorded control columns
+DATASET_LABEL_ALIASES = {'Acceleration': 'accel', 'Braking': 'brake', 'Clutch': 'clutch',
+                         'Gear': 'control_gear', 'Steering': 'steer'}
+
+# Feature sets a model can be trained on, with their full column list
+FEATURE_SETS = {'raw': SENSOR_COLUMNS, 'reduced': featureReduction.REDUCED_COLUMNS}
+
+
+def feature_default(col: str) -> float:
+    '''Value fed to the model when a sensor is missing: opponents read "nobody within 200m", others 0'''
+    return 200.0 if col.startswith('opponents_') else 0.0
+
+
+def features_from_columns(columns: dict, feature_columns: list[str]) -> np.ndarray:
+    '''
+    Build an (N, n_features) float32 matrix from a dict of recorded columns
+    (NaN = missing sensor). Batch twin of TelemetrySchema.gather().
+    '''
+    n = len(next(iter(columns.values())))
+    X = np.empty((n, len(feature_columns)), dtype=np.float32)
+    for j, col in enumerate(feature_columns):
+        values = columns.get(col)
+        if values is None:
+            X[:, j] = feature_default(col)
+            continue
+        X[:, j] = values
+        X[np.isnan(X[:, j]), j] = feature_default(col)
+    return X
+
+
+def rename_dataset_columns(columns: dict) -> dict:
+    '''Columns of a Dataset.csv-style table under our recorded names (other tables are returned unchanged)'''
+    aliases = {**DATASET_ALIASES, **DATASET_LABEL_ALIASES}
+    return {aliases.get(col, col): values for col, values in columns.items()}
+
+
+def repair_legacy_controls(columns: dict) -> bool:
+    '''
+    Recordings made before the schema existed wrote only accel/brake/steer/clutch
+    under a seven-column control header, so clutch landed in 'control_gear' and
+    gear was never recorded. Detect that layout and move the values back in place.
+    Returns True if the columns were repaired.
+    '''
+    if 'control_gear' not in columns or 'clutch' not in columns:
+        return False
+    trailing = [columns[col] for col in ('clutch', 'focus', 'meta') if col in columns]
+    if not all(np.isnan(values).all() for values in trailing) or np.isnan(columns['control_gear']).all():
+        return False
+    columns['clutch'] = columns['control_gear']
+    columns['control_gear'] = np.full_like(columns['clutch'], np.nan)
+    return True
+
+
+def read_table(path: str) -> tuple[list[str], dict]:
+    '''(stripped header, float32 columns under our recorded names) of a Dataset.csv or recorded episode (.csv or .tlm)'''
+    if path.endswith('.tlm'):
+        import telemetryCodec
+
+        columns = telemetryCodec.read_columns(path)
+        header = list(columns)
+    else:
+        import pandas as pd
+
+        frame = pd.read_csv(path, low_memory=False)
+        frame.columns = frame.columns.str.strip()
+        columns = {col: pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype=np.float32)
+                   for col in frame.columns}
+        header = list(frame.columns)
+    columns = rename_dataset_columns(columns)
+    repair_legacy_controls(columns)
+    return header, columns
+
+
+class TelemetrySchema(object):
+    '''
+    Compiled column layout for recording, feature extraction and training
+    '''
+
+    def __init__(self, feature_columns: list[str] | None = None, output_names: list[str] | None = None,
+                 feature_set: str = 'raw'):
+        '''Constructor'''
+        if feature_set not in FEATURE_SETS:
+            raise SchemaError(f"Unknown feature set '{feature_set}', expected one of {list(FEATURE_SETS)}")
+        self.feature_set = feature_set
+        available = FEATURE_SETS[feature_set]
+        self.feature_columns = list(feature_columns) if feature_columns is not None else list(available)
+        self.output_names = list(output_names) if output_names is not None else list(DEFAULT_OUTPUT_NAMES)
+
+        unknown = [col for col in self.feature_columns if col not in available]
+        if unknown:
+            raise SchemaError(f"Unknown {feature_set} feature columns: {unknown}")
+        unknown = [name for name in self.output_names if name not in LABEL_SOURCES]
+        if unknown:
+            raise SchemaError(f"Unknown output names: {unknown}")
+
+        # Recorded columns the features are computed from
+        self.input_columns = list(self.feature_columns) if feature_set == 'raw' else list(SENSOR_COLUMNS)
+        # Gather plan: (CarState attribute, list index or None, default) per input column
+        self.plan = [SENSOR_SOURCES[col] + (feature_default(col),) for col in self.input_columns]
+        self.label_columns = [LABEL_SOURCES[name] for name in self.output_names]
+
+        self.reducer = None
+        if feature_set == 'reduced':
+            self.reducer = featureReduction.FeatureReducer(self.input_columns)
+            self.selection = [featureReduction.REDUCED_COLUMNS.index(col) for col in self.feature_columns]
+
+    @classmethod
+    def from_feature_names(cls, names, output_names: list[str] | None = None) -> 'TelemetrySchema':
+        '''
+        Schema whose features follow a fitted artifact's column order. Names
+        may use either our column names or the Dataset.csv ones; with the
+        latter the notebook's output order is assumed unless given.
+        '''
+        names = [str(name).strip() for name in names]
+        uses_dataset_names = any(name in DATASET_ALIASES for name in names)
+        columns = [DATASET_ALIASES.get(name, name) for name in names]
+        if output_names is None and uses_dataset_names:
+            output_names = DATASET_OUTPUT_NAMES
+        # Derived feature names identify a model trained on the reduced set
+        reduced = any(col not in SENSOR_SOURCES for col in columns) and \
+            all(col in featureReduction.REDUCED_COLUMNS for col in columns)
+        return cls(columns, output_names, feature_set='reduced' if reduced else 'raw')
+
+    @classmethod
+    def for_scaler(cls, scaler, feature_set: str = 'raw') -> 'TelemetrySchema':
+        '''
+        Schema matching a fitted sklearn scaler. Without feature names the
+        requested feature set is assumed; with them it must agree.
+        '''
+        names = getattr(scaler, 'feature_names_in_', None)
+        if names is None:
+            return cls(feature_set=feature_set)
+        schema = cls.from_feature_names(names)
+        if schema.feature_set != feature_set:
+            raise SchemaError(f"Scaler was fitted on {schema.feature_set} features, {feature_set} were requested")
+        return schema
+
+    # --- Recording ---
+
+    def header(self) -> list[str]:
+        '''Recorded CSV columns: every sensor, then every control'''
+        return SENSOR_COLUMNS + CONTROL_COLUMNS
+
+    def record_row(self, state, control) -> list:
+        '''One recorded row in header() order; missing sensors are None (empty CSV cell)'''
+        row = []
+        for attr, idx in SENSOR_SOURCES.values():
+            value = getattr(state, attr)
+            if idx is not None:
+                value = value[idx] if value is not None and len(value) > idx else None
+            row.append(value)
+        row.extend(getattr(control, attr) for attr in CONTROL_SOURCES.values())
+        return row
+
+    def fingerprint(self) -> str:
+        '''Short hash of the recorded layout and the feature/output selection, for binary file headers'''
+        text = ','.join(self.header()) + '|' + self.feature_set + ':' + ','.join(self.feature_columns) + \
+            '|' + ','.join(self.output_names)
+        return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+    # --- Inference ---
+
+    def gather(self, state) -> np.ndarray:
+        '''Current CarState as a (1, n_features) float32 model input row'''
+        values = []
+        for attr, idx, default in self.plan:
+            value = getattr(state, attr)
+            if idx is not None:
+                value = value[idx] if value is not None and len(value) > idx else None
+            values.append(default if value is None else value)
+        row = np.array(values, dtype=np.float32).reshape(1, -1)
+        if self.reducer is not None:
+            row = self.reducer(row)[:, self.selection]
+        return row
+
+    # --- Training / evaluation ---
+
+    def features(self, columns: dict) -> np.ndarray:
+        '''(N, n_features) float32 model inputs from recorded columns'''
+        raw = features_from_columns(columns, self.input_columns)
+        if self.reducer is not None:
+            return self.reducer(raw)[:, self.selection]
+        return raw
+
+    def select(self, columns: dict) -> tuple[np.ndarray, np.ndarray]:
+        '''(X, y) float32 arrays from recorded columns (a dict or DataFrame)'''
+        self.check_columns(list(columns.keys()), labels=True)
+        X = self.features({col: np.asarray(columns[col], dtype=np.float32) for col in self.input_columns})
+        y = np.stack([np.asarray(columns[col], dtype=np.float32) for col in self.label_columns], axis=1)
+        return X, y
+
+    # --- Validation ---
+
+    def check_columns(self, available: list[str], labels: bool = False):
+        wanted = self.input_columns + (self.label_columns if labels else [])
+        missing = [col for col in wanted if col not in available]
+        if missing:
+            raise SchemaError(f"Data is missing {len(missing)} schema columns: {missing[:8]}")
+
+    def check_header(self, header: list[str]):
+        '''Raise if a recorded file's header does not match header()'''
+        header = [col.strip() for col in header]
+        expected = self.header()
+        if header != expected:
+            for i, (got, want) in enumerate(zip(header, expected)):
+                if got != want:
+                    raise SchemaError(f"Header column {i} is '{got}', expected '{want}'")
+            raise SchemaError(f"Header has {len(header)} columns, expected {len(expected)}")
+
+    def check_model(self, input_dim: int, output_dim: int, scaler_features: int | None = None):
+        '''Raise if a model (and its scaler) do not fit this schema'''
+        if input_dim != len(self.feature_columns):
+            raise SchemaError(f"Model expects {input_dim} features, schema has {len(self.feature_columns)}")
+        if output_dim != len(self.output_names):
+            raise SchemaError(f"Model has {output_dim} outputs, schema has {len(self.output_names)} {self.output_names}")
+        if scaler_features is not None and scaler_features != len(self.feature_columns):
+            raise SchemaError(f"Scaler has {scaler_features} features, schema has {len(self.feature_columns)}")
+
+
+def dataset_schema(header: list[str], feature_set: str) -> tuple[TelemetrySchema, list[str]]:
+    '''
+    Schema for the training tables plus the names the scaler is fitted
+    with (these names are what Driver later derives the layout from)
+    '''
+    if feature_set == 'raw' and any(col in DATASET_LABEL_ALIASES for col in header):
+        # Dataset.csv: keep the notebook's feature order, naming and output order
+        names = [col for col in header if col not in DATASET_LABEL_ALIASES]
+        return TelemetrySchema.from_feature_names(names), names
+    schema = TelemetrySchema(feature_set=feature_set)
+    return schema, schema.feature_columns
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+'''
+Gym-style environments over the SCR protocol.
+
+TorcsEnv drives one car through the same pieces pyclient.py uses
+(UdpTransport, CarState, CarControl, the identification handshake) and
+exposes the gymnasium API:
+
+    obs, info = env.reset()
+    obs, reward, terminated, truncated, info = env.step(action)
+
+Observations are float32 vectors in the TelemetrySchema feature_columns
+layout of the Driver's model: by default the layout fixed by the shipped
+scaler's feature names (model_schema()), the row the Driver feeds its
+model. Pass a schema, or a Driver to copy its current layout, to observe
+something else. Actions are vectors in
+DEFAULT_OUTPUT_NAMES order (accel, brake, steer, clutch, gear). reset()
+on a running episode asks the server for a new race through the 'meta'
+control and re-identifies, like pyclient.py after ***restart***.
+
+VectorEnv steps many connections concurrently from one selector loop:
+all actions are sent, then the replies are collected as they arrive, so
+a step costs one round trip for the whole batch. Finished envs are reset
+automatically. Env-steps/s are tracked.
+
+StandInServer is a local SCR server backed by kinematicSim.KinematicSim
+(one UDP port per car, lockstep), for tests and CPU-only training.
+
+Usage:
+    python torcsEnv.py --envs 8 --steps 2000 --standIn
+'''
+import argparse
+import multiprocessing
+import selectors
+import socket
+import time
+
+import numpy as np
+
+import carControl
+import carState
+import featureReduction
+import msgParser
+import telemetrySchema
+import udpTransport
+
+ACTION_NAMES = telemetrySchema.DEFAULT_OUTPUT_NAMES
+
+_MODEL_SCHEMAS = {} # (scaler file, feature set) -> schema, so a VectorEnv loads the scaler once
+
+
+def model_schema(scaler_filename: str = 'scaler_multi_output.pkl', feature_set: str = 'raw') -> telemetrySchema.TelemetrySchema:
+    '''
+    Schema of the model the Driver loads (its scaler's feature names, as in
+    Driver.__init__); the full default layout if the scaler cannot be read.
+    '''
+    key = (scaler_filename, feature_set)
+    if key not in _MODEL_SCHEMAS:
+        try:
+            import joblib
+            _MODEL_SCHEMAS[key] = telemetrySchema.TelemetrySchema.for_scaler(joblib.load(scaler_filename), feature_set)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"TorcsEnv: {scaler_filename} not usable ({e}); observing the default {feature_set} layout")
+            _MODEL_SCHEMAS[key] = telemetrySchema.TelemetrySchema(feature_set=feature_set)
+    return _MODEL_SCHEMAS[key]
+
+
+def init_string(bot_id: str) -> str:
+    '''Identification string with the rangefinder angles Driver.init() sends'''
+    return bot_id + msgParser.MsgParser().stringify({'init': featureReduction.RAY_ANGLES.tolist()})
+
+
+def progress_reward(state) -> float:
+    '''Speed along the track axis minus sideways speed and distance from the centre (km/h units)'''
+    speed, angle, pos = state.getSpeedX() or 0.0, state.getAngle() or 0.0, state.getTrackPos() or 0.0
+    return speed * np.cos(angle) - abs(speed * np.sin(angle)) - speed * abs(pos)
+
+
+class TorcsEnv(object):
+    '''
+    One SCR connection as a gymnasium-style environment
+    '''
+
+    def __init__(self, host: str = 'localhost', port: int = 3001, bot_id: str = 'SCR', max_steps: int = 10000,
+                 schema=None, terminate_off_track: bool = True, timeout: float = 1.0, reward=progress_reward):
+        '''Constructor: schema is a TelemetrySchema, a Driver (its schema), or None for model_schema()'''
+        self.bot_id = bot_id
+        self.max_steps = max_steps
+        if schema is None:
+            schema = model_schema()
+        self.schema = getattr(schema, 'schema', schema) # A Driver carries its schema in .schema
+        self.terminate_off_track = terminate_off_track
+        self.reward = reward
+        self.transport = udpTransport.UdpTransport(host, port, timeout=timeout)
+
+        self.observation_size = len(self.schema.feature_columns)
+        self.action_size = len(ACTION_NAMES)
+        self.state = carState.CarState()
+        self.control = carControl.CarControl()
+        self.in_episode = False # True while the server considers our race running
+        self.steps = 0
+        self.episodes = 0
+
+    # --- Protocol ---
+
+    def identify(self) -> str:
+        '''Handshake until ***identified***, then return the first sensor frame'''
+        buf, _ = self.transport.handshake(init_string(self.bot_id).encode())
+        if buf.find('***shutdown***') >= 0:
+            raise ConnectionError("Server shut down during identification")
+        while True:
+            buf = self.transport.recv()
+            if buf is not None and not buf.startswith('***'):
+                return buf
+
+    def request_restart(self):
+        '''Ask the server for a new race through the meta control and wait for ***restart***'''
+        self.control.reset(meta=1)
+        deadline = time.perf_counter() + 10.0
+        while time.perf_counter() < deadline:
+            self.transport.send(self.control.toMsg().encode())
+            buf = self.transport.recv()
+            if buf is not None and buf.find('***restart***') >= 0:
+                return
+            if buf is not None and buf.find('***shutdown***') >= 0:
+                raise ConnectionError("Server shut down during restart")
+        raise TimeoutError("Server did not confirm the restart")
+
+    def send_action(self, action):
+        '''Encode an action vector (ACTION_NAMES order) into a control message and send it'''
+        action = np.asarray(action, dtype=np.float64)
+        self.control.reset(
+            accel=float(np.clip(action[0], 0.0, 1.0)), brake=float(np.clip(action[1], 0.0, 1.0)),
+            steer=float(np.clip(action[2], -1.0, 1.0)), clutch=float(np.clip(action[3], 0.0, 1.0)),
+            gear=int(np.clip(np.rint(action[4]), -1, 6)))
+        self.transport.send(self.control.toMsg().encode())
+
+    def observe(self, buf: str | None):
+        '''Turn the server's answer to the last action into a step() result'''
+        if buf is None:
+            raise TimeoutError("No sensor frame from the server")
+        info = {'steps': self.steps}
+        if buf.startswith('***'):
+            # ***restart*** or ***shutdown***: the race is over on the server side
+            self.in_episode = False
+            info['server'] = buf.strip('\x00')
+            return np.zeros(self.observation_size, dtype=np.float32), 0.0, True, False, info
+
+        self.state.setFromMsg(buf)
+        self.steps += 1
+        obs = self.schema.gather(self.state)[0]
+        off_track = abs(self.state.getTrackPos() or 0.0) > 1.0
+        terminated = self.terminate_off_track and off_track
+        truncated = not terminated and self.max_steps > 0 and self.steps >= self.max_steps
+        return obs, float(self.reward(self.state)), terminated, truncated, info
+
+    # --- Gym API ---
+
+    def reset(self, seed=None, options=None):
+        if self.in_episode:
+            self.request_restart()
+        # Cleared in place; the objects (and their parsers) live as long as the env
+        self.state.reset()
+        self.control.reset()
+        self.state.setFromMsg(self.identify())
+        self.in_episode = True
+        self.steps = 0
+        self.episodes += 1
+        return self.schema.gather(self.state)[0], {'episode': self.episodes}
+
+    def step(self, action):
+        self.send_action(action)
+        return self.observe(self.transport.recv())
+
+    def close(self):
+        self.transport.close()
+
+
+class VectorEnv(object):
+    '''
+    Many TorcsEnvs stepped concurrently from one selector loop, with auto-reset
+    '''
+
+    def __init__(self, envs: list[TorcsEnv]):
+        '''Constructor'''
+        self.envs = envs
+        self.selector = selectors.DefaultSelector()
+        for i, env in enumerate(envs):
+            self.selector.register(env.transport.sock, selectors.EVENT_READ, i)
+        self.env_steps = 0
+        self.start_time = None
+
+    def reset(self):
+        obs = np.stack([env.reset()[0] for env in self.envs])
+        self.env_steps = 0
+        self.start_time = time.perf_counter()
+        return obs, {}
+
+    def step(self, actions: np.ndarray):
+        '''
+        Step every env with its row of actions. Envs that finish are reset
+        and return their new first observation; the final one is in
+        infos[i]['final_observation'].
+        '''
+        n = len(self.envs)
+        for env, action in zip(self.envs, actions):
+            env.send_action(action)
+
+        frames = [None] * n
+        waiting = n
+        deadline = time.perf_counter() + max(env.transport.timeout for env in self.envs)
+        while waiting:
+            events = self.selector.select(max(deadline - time.perf_counter(), 0.0))
+            if not events:
+                raise TimeoutError(f"{waiting} of {n} envs got no sensor frame")
+            for key, _ in events:
+                i = key.data
+                buf = self.envs[i].transport.recv_nowait()
+                if buf is not None and frames[i] is None:
+                    frames[i] = buf
+                    waiting -= 1
+
+        obs = np.empty((n, self.envs[0].observation_size), dtype=np.float32)
+        rewards = np.empty(n)
+        terminated = np.zeros(n, dtype=bool)
+        truncated = np.zeros(n, dtype=bool)
+        infos = []
+        for i, (env, buf) in enumerate(zip(self.envs, frames)):
+            obs[i], rewards[i], terminated[i], truncated[i], info = env.observe(buf)
+            if terminated[i] or truncated[i]:
+                info['final_observation'] = obs[i].copy()
+                obs[i] = env.reset()[0]
+            infos.append(info)
+        self.env_steps += n
+        return obs, rewards, terminated, truncated, infos
+
+    def steps_per_second(self) -> float:
+        if self.start_time is None:
+            return 0.0
+        return self.env_steps / max(time.perf_counter() - self.start_time, 1e-9)
+
+    def close(self):
+        self.selector.close()
+        for env in self.envs:
+            env.close()
+
+
+class StandInServer(object):
+    '''
+    Minimal SCR server for tests: car i listens on base_port + i and is
+    simulated by a shared KinematicSim. All identified cars advance in
+    lockstep once each has answered (or after tick_timeout).
+    '''
+
+    def __init__(self, base_port: int, cars: int, track: str = 'oval', seed: int = 0, tick_timeout: float = 1.0):
+        '''Constructor'''
+        import kinematicSim
+
+        self.sim = kinematicSim.KinematicSim(kinematicSim.Track(kinematicSim.TRACKS[track]), cars, seed)
+        self.parser = msgParser.MsgParser()
+        self.tick_timeout = tick_timeout
+        self.selector = selectors.DefaultSelector()
+        self.socks = []
+        for i in range(cars):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', base_port + i))
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, i)
+            self.socks.append(sock)
+        self.addrs = [None] * cars
+        self.racing = np.zeros(cars, dtype=bool)
+        self.replied = np.zeros(cars, dtype=bool)
+        # accel, brake, steer, gear per car
+        self.controls = np.zeros((cars, 4))
+
+    def send_sensors(self):
+        messages = self.sim.messages()
+        for i in np.flatnonzero(self.racing):
+            self.socks[i].sendto(messages[i].encode(), self.addrs[i])
+
+    def handle(self, i: int, data: bytes, addr):
+        text = data.decode(errors='replace')
+        if '(init' in text:
+            # New race for this car: the first frame goes out right away, it joins the lockstep after replying
+            self.addrs[i] = addr
+            self.sim.reset(np.arange(self.sim.cars) == i)
+            self.controls[i] = 0.0
+            self.racing[i] = True
+            self.replied[i] = False
+            self.socks[i].sendto(b'***identified***', addr)
+            self.socks[i].sendto(self.sim.messages(cars=[i])[0].encode(), addr)
+            return
+        if not self.racing[i]:
+            return
+        values = self.parser.parse(text) or {}
+        if int(float(values.get('meta', ['0'])[0])) == 1:
+            self.racing[i] = False
+            self.socks[i].sendto(b'***restart***', addr)
+            return
+        self.controls[i] = [float(values.get(key, ['0'])[0]) for key in ('accel', 'brake', 'steer', 'gear')]
+        self.replied[i] = True
+
+    def serve(self, stop=None):
+        '''Run until stop (a multiprocessing/threading Event) is set'''
+        tick_start = time.perf_counter()
+        while stop is None or not stop.is_set():
+            for key, _ in self.selector.select(0.05):
+                i = key.data
+                while True:
+                    try:
+                        data, addr = self.socks[i].recvfrom(65536)
+                    except BlockingIOError:
+                        break
+                    self.handle(i, data, addr)
+            if not self.racing.any():
+                continue
+            if self.replied[self.racing].all() or time.perf_counter() - tick_start > self.tick_timeout:
+                # Cars that are not racing are held still with the brake on
+                accel, brake, steer, gear = self.controls.T
+                brake = np.where(self.racing, brake, 1.0)
+                accel = np.where(self.racing, accel, 0.0)
+                self.sim.step(accel, brake, steer, gear.astype(np.int64))
+                self.replied[:] = False
+                self.send_sensors()
+                tick_start = time.perf_counter()
+        for sock, addr in zip(self.socks, self.addrs):
+            if addr is not None:
+                sock.sendto(b'***shutdown***', addr)
+            sock.close()
+
+
+def serve_stand_in(base_port: int, cars: int, track: str, stop, ready):
+    '''Process entry point for a StandInServer'''
+    server = StandInServer(base_port, cars, track)
+    ready.set()
+    server.serve(stop)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Step vectorized SCR environments and report env-steps/s.')
+    parser.add_argument('--host', action='store', dest='host_ip', default='localhost',
+                        help='Host IP address (default: localhost)')
+    parser.add_argument('--port', action='store', type=int, dest='host_port', default=3001,
+                        help='Port of the first car; env i uses port + i (default: 3001)')
+    parser.add_argument('--envs', action='store', type=int, dest='envs', default=4,
+                        help='Concurrent environments (default: 4)')
+    parser.add_argument('--steps', action='store', type=int, dest='steps', default=1000,
+                        help='Vector steps to run (default: 1000)')
+    parser.add_argument('--maxSteps', action='store', type=int, dest='max_steps', default=2000,
+                        help='Episode length limit per env (default: 2000)')
+    parser.add_argument('--standIn', action='store_true', dest='stand_in', default=False,
+                        help='Start a local kinematic stand-in server instead of connecting to TORCS')
+    parser.add_argument('--track', action='store', dest='track', default='oval',
+                        help='Stand-in track layout (default: oval)')
+    arguments = parser.parse_args()
+
+    stop = server = None
+    if arguments.stand_in:
+        ctx = multiprocessing.get_context('spawn')
+        stop, ready = ctx.Event(), ctx.Event()
+        server = ctx.Process(target=serve_stand_in,
+                             args=(arguments.host_port, arguments.envs, arguments.track, stop, ready))
+        server.start()
+        ready.wait()
+
+    venv = VectorEnv([TorcsEnv(arguments.host_ip, arguments.host_port + i, bot_id=f'SCR{i}',
+                               max_steps=arguments.max_steps) for i in range(arguments.envs)])
+    try:
+        obs, _ = venv.reset()
+        print(f"{arguments.envs} envs, observation size {obs.shape[1]} ({venv.envs[0].schema.feature_set} features)")
+        rng = np.random.default_rng(0)
+        episodes = 0
+        for _ in range(arguments.steps):
+            # Mostly-throttle random policy steering back towards the centre
+            pos = obs[:, venv.envs[0].schema.feature_columns.index('trackPos')] \
+                if 'trackPos' in venv.envs[0].schema.feature_columns else np.zeros(len(obs))
+            actions = np.column_stack([rng.uniform(0.5, 1.0, len(obs)), np.zeros(len(obs)),
+                                       np.clip(-0.5 * pos + rng.normal(0, 0.05, len(obs)), -1, 1),
+                                       np.zeros(len(obs)), np.ones(len(obs))])
+            obs, rewards, terminated, truncated, _ = venv.step(actions)
+            episodes += int(terminated.sum() + truncated.sum())
+        print(f"{venv.env_steps} env-steps at {venv.steps_per_second():,.0f} env-steps/s, {episodes} episodes finished")
+    finally:
+        venv.close()
+        if server is not None:
+            stop.set()
+            server.join()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+'''
+Loopback latency benchmark for the client socket I/O paths.
+
+A stand-in server process sends SCR-sized sensor packets at a fixed
+interval and measures the time until the control reply comes back.
+The client side runs one of:
+
+  legacy    - the original pyclient.py loop: unconnected socket, 1s timeout,
+              sendto() with a tuple address, recvfrom(1000) allocating per packet
+  connected - udpTransport.UdpTransport, blocking recv_into() a reused buffer
+  busypoll  - udpTransport.UdpTransport in busy-poll mode
+  multi     - --bots sockets served by one udpTransport.MultiTransport loop
+
+Each client parses the packet into a CarState and replies with a CarControl
+message, so the numbers include the Python protocol handling.
+
+Usage: python transportBench.py --mode all --packets 2000 --interval 0.002
+'''
+import argparse
+import multiprocessing
+import socket
+import time
+
+import carControl
+import carState
+import latencyStats
+import msgParser
+import udpTransport
+
+
+def sample_sensor_message() -> str:
+    '''A sensor string with the same fields and length as a real SCR packet'''
+    sensors = {
+        'angle': [0.0123], 'curLapTime': [12.34], 'damage': [0], 'distFromStart': [1234.56],
+        'distRaced': [1234.56], 'fuel': [94.0], 'gear': [3], 'lastLapTime': [0],
+        'opponents': [200] * 36, 'racePos': [1], 'rpm': [6543.21], 'speedX': [123.456],
+        'speedY': [-0.123], 'speedZ': [0.0456], 'track': [7.123456] * 19,
+        'trackPos': [0.0123], 'wheelSpinVel': [98.7654] * 4, 'z': [0.345], 'focus': [-1] * 5,
+    }
+    return msgParser.MsgParser().stringify(sensors)
+
+
+def server_process(port: int, bots: int, packets: int, interval: float, queue):
+    '''Send packets to every registered bot and report round-trip times'''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', port))
+    queue.put('ready')
+
+    clients = []
+    while len(clients) < bots:
+        _, addr = sock.recvfrom(65536)
+        if addr not in clients:
+            clients.append(addr)
+
+    sock.settimeout(1.0)
+    payload = sample_sensor_message().encode()
+    rtts = []
+    lost = 0
+    for _ in range(packets):
+        sent_at = {}
+        for addr in clients:
+            sent_at[addr] = time.perf_counter()
+            sock.sendto(payload, addr)
+        for _ in clients:
+            try:
+                _, addr = sock.recvfrom(65536)
+            except socket.timeout:
+                lost += 1
+                continue
+            rtts.append(time.perf_counter() - sent_at[addr])
+        time.sleep(interval)
+
+    for addr in clients:
+        sock.sendto(b'***shutdown***', addr)
+    queue.put((rtts, lost))
+    sock.close()
+
+
+def handle(state, control, msg: str) -> bytes:
+    '''The per-packet client work: parse the sensors and build a reply'''
+    state.setFromMsg(msg)
+    control.setSteer(state.getAngle() or 0.0)
+    return control.toMsg().encode()
+
+
+def run_legacy(port: int):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(1.0)
+    state, control = carState.CarState(), carControl.CarControl()
+    sock.sendto(b'hello', ('127.0.0.1', port))
+    while True:
+        try:
+            buf_bytes, addr = sock.recvfrom(1000)
+        except socket.timeout:
+            continue
+        buf = buf_bytes.decode()
+        if buf.find('***shutdown***') >= 0:
+            break
+        sock.sendto(handle(state, control, buf), ('127.0.0.1', port))
+    sock.close()
+
+
+def run_transport(port: int, busy_poll: bool, rcvbuf: int):
+    t = udpTransport.UdpTransport('127.0.0.1', port, rcvbuf=rcvbuf, busy_poll=busy_poll)
+    state, control = carState.CarState(), carControl.CarControl()
+    t.send(b'hello')
+    while True:
+        buf = t.recv()
+        if buf is None:
+            continue
+        if buf.find('***shutdown***') >= 0:
+            break
+        t.send(handle(state, control, buf))
+    t.close()
+
+
+def run_multi(port: int, bots: int, rcvbuf: int):
+    transports = [udpTransport.UdpTransport('127.0.0.1', port, rcvbuf=rcvbuf) for _ in range(bots)]
+    cars = {t: (carState.CarState(), carControl.CarControl()) for t in transports}
+    mux = udpTransport.MultiTransport(transports)
+    for t in transports:
+        t.send(b'hello')
+    running = set(transports)
+    while running:
+        replies = []
+        for t, buf in mux.poll(1.0):
+            if buf.find('***shutdown***') >= 0:
+                running.discard(t)
+                continue
+            state, control = cars[t]
+            replies.append((t, handle(state, control, buf)))
+        mux.send_all(replies)
+    mux.close()
+
+
+def bench(mode: str, arguments) -> latencyStats.LatencyRecorder:
+    bots = arguments.bots if mode == 'multi' else 1
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=server_process,
+                                     args=(arguments.port, bots, arguments.packets, arguments.interval, queue))
+    server.start()
+    queue.get() # Wait until the server socket is bound
+
+    if mode == 'legacy':
+        run_legacy(arguments.port)
+    elif mode == 'multi':
+        run_multi(arguments.port, bots, arguments.rcv_buf)
+    else:
+        run_transport(arguments.port, mode == 'busypoll', arguments.rcv_buf)
+
+    rtts, lost = queue.get()
+    server.join()
+
+    recorder = latencyStats.LatencyRecorder(capacity=max(1, len(rtts)))
+    for rtt in rtts:
+        recorder.add(rtt)
+    if lost:
+        print(f"{mode}: {lost} replies lost")
+    return recorder
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Loopback latency benchmark for the SCR client socket paths.')
+    parser.add_argument('--mode', action='store', dest='mode', default='all',
+                        choices=['all', 'legacy', 'connected', 'busypoll', 'multi'],
+                        help='Client I/O path to benchmark (default: all)')
+    parser.add_argument('--packets', action='store', type=int, dest='packets', default=2000,
+                        help='Packets per bot (default: 2000)')
+    parser.add_argument('--interval', action='store', type=float, dest='interval', default=0.002,
+                        help='Seconds between server ticks (default: 0.002)')
+    parser.add_argument('--bots', action='store', type=int, dest='bots', default=8,
+                        help='Sockets served by the multi mode (default: 8)')
+    parser.add_argument('--rcvBuf', action='store', type=int, dest='rcv_buf', default=0,
+                        help='Socket receive buffer size in bytes (default: OS default)')
+    parser.add_argument('--port', action='store', type=int, dest='port', default=3901,
+                        help='Loopback port for the stand-in server (default: 3901)')
+    arguments = parser.parse_args()
+
+    print(f"Sensor packet size: {len(sample_sensor_message().encode())} bytes "
+          "(the legacy recvfrom(1000) truncates anything larger)")
+    modes = ['legacy', 'connected', 'busypoll', 'multi'] if arguments.mode == 'all' else [arguments.mode]
+    for mode in modes:
+        label = f"multi ({arguments.bots} bots)" if mode == 'multi' else mode
+        print(bench(mode, arguments).format(label))
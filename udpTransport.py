@@ -0,0 +1,259 @@
+'''
+UDP transport for the SCR client.
+
+Replaces the ad-hoc socket handling in pyclient.py:
+  * the socket is connected to the server, so sends skip the per-call
+    address lookup and only datagrams from the server are delivered
+  * packets are received with recv_into() into one reused bytearray, so no
+    bytes object is allocated per tick and large packets are not truncated
+  * SO_RCVBUF can be configured
+  * an optional busy-poll mode spins on a non-blocking socket instead of
+    sleeping in the kernel, trading a CPU core for wake-up latency
+
+recv_latest() implements the "latest-frame" mode: everything queued in
+the socket is drained without blocking and only the newest sensor frame
+is decoded, so a slow tick never makes the client fall behind the server.
+
+handshake() runs the SCR identification with exponential backoff: a
+short first wait (a server that is already up answers within a few ms),
+doubling after each miss, so a restart is not held up by a fixed 1 s
+timeout and a server that is still starting is not flooded.
+
+MultiTransport multiplexes many bot sockets on one selector (epoll on
+Linux) so a single loop can serve several cars.
+
+If a packetCapture.PacketCapture is attached as transport.capture, every
+datagram read from the socket (including frames recv_latest() skips) and
+every datagram sent is logged with its raw bytes and a timestamp.
+'''
+import selectors
+import socket
+import sys
+import time
+
+import packetCapture
+
+
+class UdpTransport(object):
+    '''
+    A connected UDP socket to the SCR server with a reusable receive buffer
+    '''
+    # Largest possible UDP payload; SCR sensor strings are ~1-2KB but must never be cut
+    MAX_PACKET = 65536
+
+    def __init__(self, host: str, port: int, rcvbuf: int = 0, busy_poll: bool = False, timeout: float = 1.0):
+        '''Constructor'''
+        self.addr = (host, port)
+        self.timeout = timeout
+        self.busy_poll = busy_poll
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if rcvbuf > 0:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        if busy_poll and sys.platform.startswith('linux'):
+            # Ask the kernel to busy-poll the device queue as well (needs CAP_NET_ADMIN, best effort)
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, getattr(socket, 'SO_BUSY_POLL', 46), 50)
+            except OSError:
+                pass
+        self.sock.connect(self.addr)
+
+        self.buffer = bytearray(self.MAX_PACKET)
+        self.view = memoryview(self.buffer)
+
+        # Frame accounting for recv_latest()
+        self.frames_received = 0
+        self.dropped_frames = 0
+        self.capture = None # Optional packetCapture.PacketCapture
+
+        if busy_poll:
+            self.sock.setblocking(False)
+        else:
+            self.sock.settimeout(timeout)
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def getRcvBuf(self) -> int:
+        '''Effective receive buffer size as reported by the kernel'''
+        return self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+    def send(self, data: bytes):
+        '''Send one datagram to the server'''
+        self.sock.send(data)
+        if self.capture is not None:
+            self.capture.record(packetCapture.OUTBOUND, data)
+
+    def set_timeout(self, timeout: float):
+        '''Change the receive timeout used by recv() and friends'''
+        self.timeout = timeout
+        if not self.busy_poll:
+            self.sock.settimeout(timeout)
+
+    def handshake(self, message: bytes, first_timeout: float = 0.05, max_timeout: float = 1.0,
+                  give_up: float | None = None) -> tuple[str, int]:
+        '''
+        Send the identification message until the server answers ***identified***
+        (or ***shutdown***, which is returned for the caller to handle). The reply
+        wait starts at first_timeout and doubles up to max_timeout.
+        Returns (reply, attempts); raises TimeoutError after give_up seconds
+        (None: retry forever). The normal receive timeout is restored afterwards.
+        '''
+        saved = self.timeout
+        timeout = first_timeout
+        start = time.perf_counter()
+        attempts = 0
+        try:
+            while True:
+                attempts += 1
+                self.set_timeout(timeout)
+                try:
+                    self.send(message)
+                    buf = self.recv()
+                except ConnectionRefusedError:
+                    # The server's port is closed (not up yet): wait out this attempt
+                    time.sleep(timeout)
+                    buf = None
+                if buf is not None and (buf.find('***identified***') >= 0 or buf.find('***shutdown***') >= 0):
+                    return buf, attempts
+                if give_up is not None and time.perf_counter() - start > give_up:
+                    raise TimeoutError(f"Not identified after {attempts} attempts")
+                timeout = min(timeout * 2, max_timeout)
+        finally:
+            self.set_timeout(saved)
+
+    def _captured(self, n: int) -> int:
+        '''Log the datagram just read into the buffer, if capturing'''
+        if self.capture is not None:
+            self.capture.record(packetCapture.INBOUND, self.view[:n])
+        return n
+
+    def _decode(self, n: int) -> str:
+        # Decode straight from the shared buffer without an intermediate bytes copy
+        return str(self.view[:n], 'utf-8')
+
+    def _wait_into(self) -> int | None:
+        '''Wait up to self.timeout for a datagram in self.buffer, return its size or None'''
+        if self.busy_poll:
+            deadline = time.perf_counter() + self.timeout
+            while True:
+                try:
+                    return self._captured(self.sock.recv_into(self.buffer))
+                except BlockingIOError:
+                    if time.perf_counter() >= deadline:
+                        return None
+        try:
+            return self._captured(self.sock.recv_into(self.buffer))
+        except socket.timeout:
+            return None
+
+    def recv(self) -> str | None:
+        '''
+        Wait up to self.timeout for one datagram and return it decoded,
+        or None on timeout. Other socket errors are raised to the caller.
+        '''
+        n = self._wait_into()
+        if n is None:
+            return None
+        self.frames_received += 1
+        return self._decode(n)
+
+    def recv_latest(self) -> str | None:
+        '''
+        Like recv(), but then drain every datagram already queued and return
+        only the newest. Skipped frames are counted in self.dropped_frames.
+        Server notices (***shutdown***, ***restart***) are never skipped.
+        '''
+        n = self._wait_into()
+        if n is None:
+            return None
+        self.frames_received += 1
+
+        if not self.busy_poll:
+            self.sock.setblocking(False)
+        try:
+            # Each read overwrites the previous frame in the shared buffer, only the last is decoded
+            while not self.buffer.startswith(b'***'):
+                try:
+                    n = self._captured(self.sock.recv_into(self.buffer))
+                except BlockingIOError:
+                    break
+                self.frames_received += 1
+                self.dropped_frames += 1
+        finally:
+            if not self.busy_poll:
+                self.sock.settimeout(self.timeout)
+        return self._decode(n)
+
+    def recv_nowait(self) -> str | None:
+        '''Return a queued datagram if there is one, without waiting'''
+        # A socket with a timeout polls before reading, so switch to non-blocking for the call
+        if not self.busy_poll:
+            self.sock.setblocking(False)
+        try:
+            n = self._captured(self.sock.recv_into(self.buffer))
+        except BlockingIOError:
+            return None
+        finally:
+            if not self.busy_poll:
+                self.sock.settimeout(self.timeout)
+        self.frames_received += 1
+        return self._decode(n)
+
+    def close(self):
+        self.sock.close()
+
+
+class MultiTransport(object):
+    '''
+    Serve many UdpTransports (one per bot) from a single selector loop.
+
+    Python does not expose recvmmsg/sendmmsg, so batching is done at the
+    readiness level: one epoll wait returns every socket with data and all
+    queued datagrams are drained from each before returning.
+    '''
+
+    def __init__(self, transports: list[UdpTransport]):
+        '''Constructor'''
+        self.transports = list(transports)
+        self.selector = selectors.DefaultSelector()
+        for t in self.transports:
+            t.sock.setblocking(False)
+            self.selector.register(t.sock, selectors.EVENT_READ, t)
+
+    def poll(self, timeout: float | None = None, latest: bool = False) -> list[tuple[UdpTransport, str]]:
+        '''
+        Wait for traffic on any socket and return every queued (transport, message) pair.
+        With latest=True only the newest frame per socket is returned (see UdpTransport.recv_latest).
+        '''
+        ready = []
+        for key, _ in self.selector.select(timeout):
+            t = key.data
+            n = None
+            while True:
+                try:
+                    m = t._captured(t.sock.recv_into(t.buffer))
+                except BlockingIOError:
+                    break
+                t.frames_received += 1
+                if not latest:
+                    ready.append((t, t._decode(m)))
+                    continue
+                if n is not None:
+                    t.dropped_frames += 1
+                n = m
+                if t.buffer.startswith(b'***'):
+                    break
+            if latest and n is not None:
+                ready.append((t, t._decode(n)))
+        return ready
+
+    def send_all(self, replies: list[tuple[UdpTransport, bytes]]):
+        '''Send one reply per (transport, data) pair'''
+        for t, data in replies:
+            t.send(data)
+
+    def close(self):
+        self.selector.close()
+        for t in self.transports:
+            t.close()